@@ -0,0 +1,90 @@
+"""
+Per object memory and build time of api entities.
+
+Compares the slotted models built by Client.make_* against the previous
+dict backed entities, over a synthetic linode.list / linode.job.list
+response.
+
+    python benchmarks/entities.py [count]
+"""
+
+import sys
+import time
+
+from juju_linode.client import Client, Job, LinodeInstace
+
+
+class DictEntity(object):
+    """The previous __dict__ based entity.
+    """
+
+    @classmethod
+    def from_dict(cls, data):
+        i = cls()
+        i.__dict__.update(data)
+        i.json_keys = data.keys()
+        return i
+
+
+LINODE_KEYS = zip(LinodeInstace.fields, LinodeInstace.api_keys)
+JOB_KEYS = zip(Job.fields, Job.api_keys)
+
+
+def dict_linode(info, ip_addresses):
+    # As the previous make_linode_instace, via an intermediate dict.
+    data = dict([(k, info[api_key]) for k, api_key in LINODE_KEYS])
+    data['ip_addresses'] = ip_addresses
+    data['remote_access_name'] = ip_addresses[0]
+    return DictEntity.from_dict(data)
+
+
+def dict_job(info):
+    return DictEntity.from_dict(
+        dict([(k, info[api_key]) for k, api_key in JOB_KEYS]))
+
+
+def linode_info(i):
+    info = dict([(k, 0) for k in LinodeInstace.api_keys])
+    info.update(LINODEID=i, LABEL='linode%d' % i)
+    return info
+
+
+def job_info(i):
+    info = dict([(k, '') for k in Job.api_keys])
+    info.update(JOBID=i, LINODEID=i)
+    return info
+
+
+def size_of(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+        size += sys.getsizeof(getattr(obj, 'json_keys', None))
+    return size
+
+
+def measure(name, build, infos):
+    start = time.time()
+    objs = [build(i) for i in infos]
+    elapsed = time.time() - start
+    print("%-16s build:%7.1fus/obj  size:%5d bytes/obj" % (
+        name, elapsed / len(objs) * 1e6, size_of(objs[0])))
+
+
+def main():
+    count = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+    client = Client('bench')
+    linodes = [linode_info(i) for i in range(count)]
+    jobs = [job_info(i) for i in range(count)]
+    ips = ['10.0.0.1']
+
+    print("%d objects" % count)
+    measure("linode (dict)", lambda i: dict_linode(i, ips), linodes)
+    measure("linode (slots)",
+            lambda i: client.make_linode_instace(i, ips), linodes)
+    measure("job (dict)", dict_job, jobs)
+    measure("job (slots)", client.make_linode_job, jobs)
+
+
+if __name__ == '__main__':
+    main()
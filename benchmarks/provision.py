@@ -0,0 +1,216 @@
+"""
+End to end provisioning benchmark against the local fake linode api.
+
+Runs the ops behind add-machine, terminate-machine and a forced
+destroy-environment for N machines through the threaded or coroutine
+runner, and reports wall clock, api round trips and peak thread count
+per scenario. Juju itself is replaced by a stub environment, so only
+provider side throughput is measured.
+
+    python benchmarks/provision.py -n 20 --engine threads --job-latency 1
+"""
+
+import argparse
+import functools
+import logging
+import sys
+import threading
+import time
+
+from juju_linode import engine, ops
+from juju_linode.engine import EngineRunner
+from juju_linode.provider import Linode
+from juju_linode.runner import Runner
+from juju_linode.tests.fakelinode import FakeLinode, THREAD_NAME
+
+
+class StubEnv(object):
+    """Stands in for the juju environment, recording machines added.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.machines = []
+        self._lock = threading.Lock()
+
+    def add_machine(self, location):
+        time.sleep(self.latency)
+        with self._lock:
+            self.machines.append(location)
+            return str(len(self.machines))
+
+    def register_machine(self, host):
+        return self.add_machine("ssh:ubuntu@%s" % host)
+
+    def terminate_machines(self, machine_ids):
+        time.sleep(self.latency)
+
+
+class ThreadSampler(object):
+    """Samples the process's thread count while running.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self._stop.is_set():
+            # Not counting the sampler itself, or the fake api's threads.
+            count = len([t for t in threading.enumerate()
+                         if t.name != THREAD_NAME]) - 1
+            self.peak = max(self.peak, count)
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self.thread.join()
+
+
+def make_runner(options):
+    if options.engine == 'coroutine':
+        return EngineRunner(options.runners)
+    return Runner(options.runners)
+
+
+def scenario(name, fake, provider, options, queue):
+    """Run the ops queue adds to a fresh runner, returning a report row.
+    """
+    runner = make_runner(options)
+    queue(runner)
+    calls, round_trips = dict(fake.calls), fake.round_trips
+    start = time.time()
+    with ThreadSampler() as threads:
+        results = list(runner.iter_results())
+    elapsed = time.time() - start
+    return results, {
+        'scenario': name, 'wall': elapsed, 'ok': len(results),
+        'round_trips': fake.round_trips - round_trips,
+        'calls': dict([(k, v - calls.get(k, 0))
+                       for k, v in fake.calls.items()
+                       if v - calls.get(k, 0)]),
+        'threads': threads.peak}
+
+
+def run(options):
+    fake = FakeLinode(
+        job_latency=options.job_latency, rate_limit=options.rate_limit,
+        error_rate=options.error_rate, seed=0).start()
+    provider = Linode(fake.config(**{
+        'default-num-runner': options.runners,
+        'linode-poll-interval': options.poll_interval,
+        'linode-read-rate': options.read_rate,
+        'linode-write-rate': options.write_rate}))
+    env = StubEnv(options.juju_latency)
+    params = dict(datacenter_id=2, plan_id=1,
+                  domain_postfix=options.domain and 'example.com' or None)
+
+    # Point the ssh and dns waits at the fake.
+    engine.wait_for_ssh_async = functools.partial(
+        engine.wait_for_ssh_async, port=fake.ssh_port)
+    engine.wait_for_record_async = functools.partial(
+        engine.wait_for_record_async, resolver=fake.resolve)
+
+    reports = []
+    try:
+        def add(runner):
+            for n in range(options.machines):
+                runner.queue_op(ops.MachineRegister(provider, env, params))
+        added, report = scenario('add-machine', fake, provider, options, add)
+        reports.append(report)
+
+        half = added[:len(added) / 2]
+
+        def terminate(runner):
+            # As terminate-machine, one bulk juju call then the teardown.
+            env.terminate_machines([machine_id for _, machine_id in half])
+            for instance, machine_id in half:
+                runner.queue_op(ops.MachineDestroy(
+                    provider, env, {
+                        'machine_id': machine_id,
+                        'instance_id': instance.linodeid,
+                        'instance': instance,
+                        'domain_name': params['domain_postfix'] and
+                        instance.remote_access_name},
+                    iaas_only=True))
+        reports.append(scenario(
+            'terminate-machine', fake, provider, options, terminate)[1])
+
+        def destroy(runner):
+            # As destroy-environment --force, from an instance listing.
+            for instance in provider.get_instances():
+                runner.queue_op(ops.MachineDestroy(
+                    provider, env,
+                    {'instance_id': instance.linodeid, 'instance': instance,
+                     'domain_name': None},
+                    iaas_only=True))
+        reports.append(scenario(
+            'destroy-environment', fake, provider, options, destroy)[1])
+    finally:
+        provider.close()
+        fake.stop()
+    return reports
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument("-n", "--machines", type=int, default=10)
+    parser.add_argument("--engine", choices=('threads', 'coroutine'),
+                        default='threads')
+    parser.add_argument("--runners", type=int, default=10,
+                        help="default-num-runner")
+    parser.add_argument("--job-latency", type=float, default=0.5,
+                        help="Seconds each linode job takes")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--read-rate", type=float, default=8.0,
+                        help="Client read calls per second")
+    parser.add_argument("--write-rate", type=float, default=2.0,
+                        help="Client mutating calls per second")
+    parser.add_argument("--rate-limit", type=int, default=None,
+                        help="Api requests per second before ERRORCODE 14")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Chance any api action fails")
+    parser.add_argument("--juju-latency", type=float, default=0.0,
+                        help="Seconds each stubbed juju call takes")
+    parser.add_argument("--domain", action="store_true",
+                        help="Register domains with the domain manager")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser
+
+
+def main():
+    options = setup_parser().parse_args()
+    logging.basicConfig(
+        level=options.verbose and logging.DEBUG or logging.WARNING,
+        format="%(asctime)s %(message)s", datefmt="%H:%M:%S")
+    # The client echoes every call on stdout.
+    stdout, sys.stdout = sys.stdout, open('/dev/null', 'w')
+    try:
+        reports = run(options)
+    finally:
+        sys.stdout = stdout
+
+    print("%d machines, %s engine, %d runners, job latency %.1fs" % (
+        options.machines, options.engine, options.runners,
+        options.job_latency))
+    print("{:<20} {:>8} {:>5} {:>11} {:>8}".format(
+        "Scenario", "Wall", "Ok", "Round trips", "Threads"))
+    for r in reports:
+        print("{:<20} {:>7.2f}s {:>5} {:>11} {:>8}".format(
+            r['scenario'], r['wall'], r['ok'], r['round_trips'],
+            r['threads']))
+    if options.verbose:
+        for r in reports:
+            print("%s calls: %s" % (r['scenario'], " ".join([
+                "%s:%d" % c for c in sorted(r['calls'].items())])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+On disk cache of the linode avail.* catalogs.
+
+Plans, datacenters and distributions rarely change, so they're kept in
+juju home and only refetched once their ttl expires (or on demand).
+"""
+
+import json
+import logging
+import os
+import time
+
+from juju_linode.client import DataCenter, Distribution, Plan
+
+
+log = logging.getLogger("juju.linode")
+
+CATALOG_FILE = "linode-catalog.json"
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+
+class Catalog(object):
+
+    # name: (client method, entity class)
+    entries = {
+        'plans': ('get_linode_plans', Plan),
+        'datacenters': ('get_datacenters', DataCenter),
+        'distributions': ('get_distributions', Distribution)}
+
+    def __init__(self, client, path, ttl=DEFAULT_TTL, clock=time.time):
+        self.client = client
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as fh:
+                return json.loads(fh.read())
+        except ValueError:
+            log.warning("Ignoring corrupt catalog cache %s", self.path)
+            return {}
+
+    def write(self, cache):
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as fh:
+            fh.write(json.dumps(cache))
+        os.rename(tmp, self.path)
+
+    def load(self, refresh=False):
+        """Return the catalogs as entity lists keyed by name.
+
+        Only expired catalogs are fetched from the api, and the cache file
+        is only rewritten if something was fetched.
+        """
+        cache = self.read()
+        now = self.clock()
+        fetched = False
+
+        for name, (method, entity) in self.entries.items():
+            entry = cache.get(name)
+            if not refresh and entry and now - entry['fetched'] < self.ttl:
+                continue
+            log.debug("Refreshing %s catalog", name)
+            items = [i.to_json() for i in getattr(self.client, method)()]
+            cache[name] = {'fetched': now, 'items': items}
+            fetched = True
+
+        if fetched:
+            self.write(cache)
+
+        return dict([
+            (name, map(entity.from_dict, cache[name]['items']))
+            for name, (method, entity) in self.entries.items()])
+
+    @classmethod
+    def connect(cls, client, juju_home, config):
+        return cls(
+            client, os.path.join(juju_home, CATALOG_FILE),
+            int(config.get('linode-catalog-ttl', DEFAULT_TTL)))
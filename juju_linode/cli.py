@@ -14,6 +14,12 @@ def _default_opts(parser):
         "-e", "--environment", help="Juju environment to operate on")
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Verbose output")
+    parser.add_argument(
+        "--refresh-catalog", action="store_true", default=False,
+        help="Refetch cached linode plans and datacenters")
+    parser.add_argument(
+        "--engine", choices=("threads", "coroutine"), default=None,
+        help="Run concurrent ops on threads or as coroutines on one thread")
 
 
 def _machine_opts(parser):
@@ -71,7 +77,9 @@ def setup_parser():
     terminate_machine = subparsers.add_parser(
         "terminate-machine",
         help="Terminate machine")
-    terminate_machine.add_argument("machines", nargs="+")
+    terminate_machine.add_argument(
+        "machines", nargs="+",
+        help="Machine ids, addresses or linode ids")
     _default_opts(terminate_machine)
     terminate_machine.set_defaults(command=commands.TerminateMachine)
 
@@ -84,9 +92,35 @@ def setup_parser():
         help="Irrespective of environment state, destroy all env machines")
     destroy_environment.set_defaults(command=commands.DestroyEnvironment)
 
+    pool = subparsers.add_parser(
+        'pool',
+        help="Show or resize the warm pool of pre-provisioned machines")
+    _default_opts(pool)
+    pool.add_argument(
+        "--constraints", default="",
+        help="Machine allocation criteria of the pool to resize")
+    pool.add_argument(
+        "-s", "--size", type=int, default=None,
+        help="Number of machines to keep in the pool")
+    pool.set_defaults(command=commands.Pool)
+
     return parser
 
 
+def report_api_stats(provider):
+    log = logging.getLogger("juju.linode")
+    stats = provider.transport.stats
+    log.debug("Api round trips: %d %s", stats.round_trips,
+              provider.client.limiter.summary())
+    for line in stats.summary():
+        log.debug("  %s", line)
+    retries = provider.retrier.stats.summary()
+    if retries:
+        log.debug("Api retries:")
+    for line in retries:
+        log.debug("  %s", line)
+
+
 def main():
     parser = setup_parser()
     options = parser.parse_args()
@@ -108,12 +142,12 @@ def main():
         print("Configuration error: %s" % str(e))
         sys.exit(1)
 
-    cmd = options.command(
-        config,
-        config.connect_provider(),
-        config.connect_environment())
+    provider = config.connect_provider()
+    env = config.connect_environment()
+    cmd = options.command(config, provider, env)
     try:
         cmd.run()
+        report_api_stats(provider)
     except ProviderAPIError, e:
         print("Provider interaction error: %s" % str(e))
     except ConfigError, e:
@@ -122,6 +156,9 @@ def main():
     except PrecheckError, e:
         print("Precheck error: %s" % str(e))
         sys.exit(1)
+    finally:
+        env.close()
+        provider.close()
 
 if __name__ == '__main__':
     main()
@@ -1,156 +1,171 @@
-from juju_linode.exceptions import ProviderAPIError
+from juju_linode.exceptions import AmbiguousAPIError, ProviderAPIError
+from juju_linode.ratelimit import RateLimiter, is_rate_limited
+from juju_linode.retry import Retrier
+from juju_linode.runner import spawn
+from juju_linode.transport import Transport
 
-import requests
+import json
+
+import logging
 
 import random
 
 import string
 
+log = logging.getLogger("juju.linode")
 
-class Entity(object):
+# Linode caps the number of actions accepted in a single batch request.
+DEFAULT_BATCH_SIZE = 25
 
-    @classmethod
-    def from_dict(cls, data):
-        i = cls()
-        i.__dict__.update(data)
-        i.json_keys = data.keys()
-        return i
-
-    def to_json(self):
-        return dict([(k, getattr(self, k)) for k in self.json_keys])
 
+class EntityType(type):
+    """Generates an entity's slots and api key mapping from its fields.
+    """
 
-class LinodeInstace(Entity):
-    """Instance on linode.
+    def __new__(mcs, name, bases, attrs):
+        fields = tuple(attrs.get('fields', ()))
+        extra = tuple(attrs.get('extra', ()))
+        private = tuple(attrs.get('private', ()))
+        # Extra fields implemented as properties store into private slots.
+        attrs['__slots__'] = fields + tuple(
+            [k for k in extra if k not in attrs]) + private
+        attrs['api_keys'] = tuple([f.upper() for f in fields])
+        attrs['_api_fields'] = tuple(zip(fields, attrs['api_keys']))
+        return type.__new__(mcs, name, bases, attrs)
 
-    Attributes: alert_cpu_enabled, alert_bwin_enabled, alert_bwquota_enabled, alert_diskio_threshold,
-        backupwindow, watchdog, distributionvendor, datacenterid, status, alert_diskio_enabled, create_dt,
-        totalhd, alert_bwquota_threshold, totalram, alert_bwin_threshold, linodeid, alert_bwout_threshold,
-        alert_bwout_enabled, backupsenabled, alert_cpu_threshold, planid, backupweeklyday, label, lpm_displaygroup,
-        totalxfer
-    """
 
+class Entity(object):
+    """Api model with one slot per field.
 
-class Distribution(Entity):
-    """
-    Attributes: distributionid, is64bit, requirespvopskernel, label, minimagesize, create_dt
+    fields are read from the api's uppercased keys, extra fields are set
+    by the client. Fields missing from the data are None.
     """
 
-class DataCenter(Entity):
-    """
-    Attributes: datacenterid, abbr, location
-    """
+    __metaclass__ = EntityType
 
-class Plan(Entity):
-    """
-    Attributes: cores, price, ram, xfer, planid, label, avail, disk, hourly
-    """
+    fields = ()
+    extra = ()
+    private = ()
 
-class Disk(Entity):
-    """
-    Attributes: update_dt, diskid, label, type, linodeid, isreadonly, create_dt, size
-    """
+    @classmethod
+    def _new(cls):
+        i = cls.__new__(cls)
+        for k in cls.private:
+            setattr(i, k, None)
+        return i
 
-class Job(Entity):
-    """
-    Attributes: entered_dt, action, label, host_start_dt, linodeid, host_finish_dt, duration, host_message, jobid, host_success
-    """
+    @classmethod
+    def from_dict(cls, data):
+        i = cls._new()
+        for k in cls.fields + cls.extra:
+            setattr(i, k, data.get(k))
+        return i
 
+    @classmethod
+    def from_api(cls, info, **extra):
+        """Build from an api response in a single pass over its keys.
+        """
+        i = cls._new()
+        for k, api_key in cls._api_fields:
+            setattr(i, k, info[api_key])
+        for k in cls.extra:
+            setattr(i, k, extra.pop(k, None))
+        for k, v in extra.items():
+            setattr(i, k, v)
+        return i
 
+    def to_json(self):
+        return dict([(k, getattr(self, k)) for k in self.fields + self.extra])
 
-class Client(object):
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, " ".join([
+            "%s=%r" % (k, getattr(self, k)) for k in self.fields[:3]]))
 
-    version = 1.0
 
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.api_url_base = 'https://api.linode.com'
+class LinodeInstace(Entity):
+    """Instance on linode.
+    """
 
-    def request(self, api_action, params=None, method='GET'):
-        p = params and dict(params) or {}
-        p['api_key'] = self.api_key
-        p['api_action'] = api_action
+    fields = (
+        'linodeid', 'label', 'status', 'datacenterid', 'planid',
+        'lpm_displaygroup', 'totalram', 'totalhd', 'totalxfer', 'create_dt',
+        'distributionvendor', 'backupsenabled', 'backupwindow',
+        'backupweeklyday', 'watchdog', 'alert_cpu_enabled',
+        'alert_cpu_threshold', 'alert_bwin_enabled', 'alert_bwin_threshold',
+        'alert_bwout_enabled', 'alert_bwout_threshold',
+        'alert_bwquota_enabled', 'alert_bwquota_threshold',
+        'alert_diskio_enabled', 'alert_diskio_threshold')
+    extra = ('ip_addresses', 'remote_access_name')
+    private = ('_ip_addresses', '_remote_access_name', 'ip_loader')
+
+    @property
+    def ip_addresses(self):
+        """Ip addresses, resolved on first access if an ip_loader is set.
+        """
+        if self._ip_addresses is None and self.ip_loader is not None:
+            self._ip_addresses = self.ip_loader(self.linodeid)
+            self.ip_loader = None
+        return self._ip_addresses
+
+    @ip_addresses.setter
+    def ip_addresses(self, value):
+        self._ip_addresses = value
+
+    @property
+    def remote_access_name(self):
+        """Domain name if one was registered, else the first ip address.
+        """
+        if self._remote_access_name is not None:
+            return self._remote_access_name
+        return self.ip_addresses and self.ip_addresses[0] or None
+
+    @remote_access_name.setter
+    def remote_access_name(self, value):
+        self._remote_access_name = value
 
-        print("Action: " + api_action)
-        print("Params: " + str(params))
 
-        # remove null values
-        p = {k: v for k, v in p.items() if v}
+class Distribution(Entity):
 
-        headers = {'User-Agent': 'juju/client'}
-        url = self.api_url_base
+    fields = ('distributionid', 'label', 'is64bit', 'requirespvopskernel',
+              'minimagesize', 'create_dt')
 
-        if method == 'POST':
-            headers['Content-Type'] = "application/json"
-            response = requests.post(url, headers=headers, params=p)
-        else:
-            response = requests.get(url, headers=headers, params=p)
 
-        data = response.json()
-        if not data:
-            raise ProviderAPIError('No json result found')
+class DataCenter(Entity):
 
-        if len(data['ERRORARRAY']) != 0:
-            raise ProviderAPIError(data['ERRORARRAY'])
+    fields = ('datacenterid', 'abbr', 'location')
 
-        return data['DATA']
 
+class Plan(Entity):
 
-    def make_datacenters(self, info):
-        return DataCenter.from_dict(
-            dict(datacenterid=info['DATACENTERID'], abbr=info['ABBR'], location=info['LOCATION']))
+    fields = ('planid', 'label', 'cores', 'price', 'ram', 'xfer', 'avail',
+              'disk', 'hourly')
 
-    def get_datacenters(self):
-        data = self.request("avail.datacenters")
-        return map(self.make_datacenters, data)
 
-    def make_plans(self, info):
-        return Plan.from_dict(
-            dict(cores=info['CORES'], price=info['PRICE'], ram=info['RAM'],
-                xfer=info['XFER'], planid=info['PLANID'], label=info['LABEL'],
-                avail=info['AVAIL'], disk=info['DISK'], hourly=info['HOURLY']))
+class Disk(Entity):
 
-    def get_linode_plans(self):
-        data = self.request("avail.linodeplans")
-        return map(self.make_plans, data)
+    fields = ('diskid', 'linodeid', 'label', 'type', 'size', 'isreadonly',
+              'create_dt', 'update_dt')
 
-    def make_distribution(self, info):
-        return Distribution.from_dict(
-            dict(distributionid=info['DISTRIBUTIONID'], is64bit=info['IS64BIT'], requirespvopskernel=info['REQUIRESPVOPSKERNEL'],
-                 label=info['LABEL'], minimagesize=info['MINIMAGESIZE'],
-                 create_dt=info['CREATE_DT']))
 
-    def get_distributions(self):
-        data = self.request("avail.distributions")
-        return map(self.make_distribution, data)
+class Image(Entity):
 
-    def make_linode_instace(self, info):
-        ip_addresses = [ip_field['IPADDRESS'] for ip_field in self.request("linode.ip.list", {'LinodeID': info['LINODEID']})]
-        return LinodeInstace.from_dict(
-            dict(alert_cpu_enabled=info['ALERT_CPU_ENABLED'], alert_bwin_enabled=info['ALERT_BWIN_ENABLED'], alert_bwquota_enabled=info['ALERT_BWQUOTA_ENABLED'],
-                 alert_diskio_threshold=info['ALERT_DISKIO_THRESHOLD'], backupwindow=info['BACKUPWINDOW'],watchdog=info['WATCHDOG'],
-                 distributionvendor=info['DISTRIBUTIONVENDOR'], datacenterid=info['DATACENTERID'], status=info['STATUS'],
-                 alert_diskio_enabled=info['ALERT_DISKIO_ENABLED'], create_dt=info['CREATE_DT'], totalhd=info['TOTALHD'],
-                 alert_bwquota_threshold=info['ALERT_BWQUOTA_THRESHOLD'], totalram=info['TOTALRAM'],alert_bwin_threshold=info['ALERT_BWIN_THRESHOLD'],
-                 linodeid=info['LINODEID'], alert_bwout_threshold=info['ALERT_BWOUT_THRESHOLD'],alert_bwout_enabled=info['ALERT_BWOUT_ENABLED'],
-                 backupsenabled=info['BACKUPSENABLED'], alert_cpu_threshold=info['ALERT_CPU_THRESHOLD'], planid=info['PLANID'],
-                 backupweeklyday=info['BACKUPWEEKLYDAY'], label=info['LABEL'],lpm_displaygroup=info['LPM_DISPLAYGROUP'],
-                 totalxfer=info['TOTALXFER'], ip_addresses=ip_addresses, remote_access_name=ip_addresses[0]) )
+    fields = ('imageid', 'label', 'description', 'status', 'minsize',
+              'create_dt')
 
-    def get_linode_instaces(self):
-        data = self.request("linode.list")
-        return map(self.make_linode_instace, data)
 
-    def get_linode_instace(self, linode_instace_id):
-        data = self.request("linode.list", {'LinodeID': linode_instace_id})
+class Job(Entity):
 
-        return self.make_linode_instace(data[0] if len(data) > 0 else {})
+    fields = ('jobid', 'linodeid', 'action', 'label', 'entered_dt',
+              'host_start_dt', 'host_finish_dt', 'duration', 'host_message',
+              'host_success')
 
-    def create_linode_instace(self, datacenter_id, plan_id, payment_term=None):
-        params = dict(DatacenterID=datacenter_id, PlanID=plan_id, PaymentTerm=payment_term)
-        data = self.request('linode.create', params)
 
-        return self.get_linode_instace(data['LinodeID'])
+class Actions(object):
+    """Api calls whose result is the action's raw data.
+
+    Shared by Client, which sends them, and Batch, which queues them.
+    Methods here may only use request and get_random_pass.
+    """
 
     def get_random_pass(self):
         N = 3;
@@ -182,6 +197,37 @@ class Client(object):
 
         return self.request('linode.disk.createfromstackscript', params)
 
+    def linode_disk_createfromimage(
+        self, linode_instace, image_id, label, size=None, root_pass=None, root_ssh_key=None):
+
+        if not root_pass:
+            root_pass = self.get_random_pass()
+
+        if not size:
+            size = linode_instace.planid * 24320
+
+        params = dict(
+            LinodeID=linode_instace.linodeid,
+            ImageID=image_id,
+            Label=label,
+            Size=size,
+            rootPass=root_pass,
+            rootSSHKey=root_ssh_key)
+
+        return self.request('linode.disk.createfromimage', params)
+
+    def linode_disk_imagize(self, disk, label, description=None):
+        params = dict(
+            LinodeID=disk.linodeid,
+            DiskID=disk.diskid,
+            Label=label,
+            Description=description)
+
+        return self.request('linode.disk.imagize', params)
+
+    def delete_image(self, image):
+        return self.request('image.delete', {'ImageID': image.imageid})
+
     def create_linode_swap(self, linode_instace, size=None):
         if not size:
             size = linode_instace.planid * 256
@@ -194,16 +240,6 @@ class Client(object):
 
         return self.request('linode.disk.create', params)
 
-    def make_linode_disk(self, info):
-        return Disk.from_dict(
-            dict(update_dt=info['UPDATE_DT'], diskid=info['DISKID'], label=info['LABEL'],
-                type=info['TYPE'], linodeid=info['LINODEID'], isreadonly=info['ISREADONLY'],
-                create_dt=info['CREATE_DT'], size=info['SIZE']) )
-
-    def get_linode_disks(self, linode_instace):
-        data = self.request('linode.disk.list', {'LinodeID': linode_instace.linodeid})
-        return map(self.make_linode_disk, data)
-
     def create_linode_config(self, linode_instace, label, disk_list, kernel_id=199):
         params = dict(
             LinodeID=linode_instace.linodeid,
@@ -213,6 +249,10 @@ class Client(object):
 
         return self.request('linode.config.create', params)
 
+    def update_linode(self, linode_instace, **fields):
+        params = dict(fields, LinodeID=linode_instace.linodeid)
+        return self.request('linode.update', params)
+
     def linode_boot(self, linode_instace):
         return self.request('linode.boot', {'LinodeID': linode_instace.linodeid})
 
@@ -225,26 +265,370 @@ class Client(object):
     def destroy_linode_instace(self, linode_instace):
         return self.request('linode.delete', {'LinodeID': linode_instace.linodeid})
 
+
+class Client(Actions):
+
+    version = 1.0
+
+    def __init__(self, api_key, transport=None, batch_size=DEFAULT_BATCH_SIZE,
+                 limiter=None, retrier=None):
+        self.api_key = api_key
+        self.api_url_base = 'https://api.linode.com'
+        self.transport = transport or Transport()
+        self.batch_size = batch_size
+        self.limiter = limiter or RateLimiter()
+        self.retrier = retrier or Retrier()
+
+    def _send(self, api_action, params, method='GET', label=None,
+              actions=None):
+        """Send a request within the rate limits, resending it while the
+        api rejects it as rate limited.
+        """
+        actions = actions or [api_action]
+        for attempt in range(self.limiter.retries + 1):
+            with self.limiter.slot(actions):
+                data = self._send_once(api_action, params, method, label)
+            if not isinstance(data, dict) or not is_rate_limited(
+                    data.get('ERRORARRAY')):
+                self.limiter.succeeded()
+                return data
+            if attempt < self.limiter.retries:
+                self.limiter.throttled()
+        return data
+
+    def _send_once(self, api_action, params, method='GET', label=None):
+        p = dict(params)
+        p['api_key'] = self.api_key
+        p['api_action'] = api_action
+
+        headers = {'User-Agent': 'juju/client'}
+        url = self.api_url_base
+
+        if method == 'POST':
+            headers['Content-Type'] = "application/json"
+
+        response = self.transport.request(
+            method, url, label=label or api_action, headers=headers, params=p)
+
+        try:
+            data = response.json()
+        except ValueError, e:
+            # The call may still have been applied.
+            raise AmbiguousAPIError('Invalid json response: %s' % e)
+        if not data:
+            raise ProviderAPIError('No json result found')
+        return data
+
+    def request(self, api_action, params=None, method='GET'):
+        print("Action: " + api_action)
+        print("Params: " + str(params))
+
+        # remove null values
+        p = params and dict((k, v) for k, v in params.items() if v) or {}
+
+        return self.retrier.call(
+            [api_action], self._request, api_action, p, method)
+
+    def _request(self, api_action, params, method):
+        data = self._send(api_action, params, method)
+
+        if len(data['ERRORARRAY']) != 0:
+            raise ProviderAPIError(data['ERRORARRAY'])
+
+        return data['DATA']
+
+    def request_batch(self, actions, method='POST'):
+        """Issue several api actions using as few round trips as possible.
+
+        actions is a list of (api_action, params) tuples, they're sent in
+        chunks of batch_size via the api's batch action. Returns a list of
+        (data, errors) tuples in the same order as actions.
+        """
+        results = []
+        for i in range(0, len(actions), self.batch_size):
+            results.extend(
+                self._request_chunk(actions[i:i + self.batch_size], method))
+        return results
+
+    def _request_chunk(self, chunk, method):
+        results = [None] * len(chunk)
+        pending = range(len(chunk))
+        for attempt in range(self.limiter.retries + 1):
+            actions = [chunk[i] for i in pending]
+            data = self.retrier.call(
+                [a for a, _ in actions], self._send_batch, actions, method)
+            limited = []
+            for i, r in zip(pending, data):
+                results[i] = (r.get('DATA'), r.get('ERRORARRAY'))
+                if is_rate_limited(r.get('ERRORARRAY')):
+                    limited.append(i)
+            # Only the rate limited actions of a batch are resent.
+            if not limited or attempt == self.limiter.retries:
+                break
+            self.limiter.throttled()
+            pending = limited
+        return results
+
+    def _send_batch(self, chunk, method):
+        request_array = []
+        for api_action, params in chunk:
+            p = params and dict(
+                (k, v) for k, v in params.items() if v) or {}
+            p['api_action'] = api_action
+            request_array.append(p)
+
+        log.debug("Batch: %s", ", ".join([a for a, _ in chunk]))
+        data = self._send(
+            'batch', {'api_requestArray': json.dumps(request_array)},
+            method, label='batch(%s)' % chunk[0][0],
+            actions=[a for a, _ in chunk])
+
+        if isinstance(data, dict):
+            # The whole batch was rejected.
+            raise ProviderAPIError(data.get('ERRORARRAY'))
+        if len(data) != len(chunk):
+            raise ProviderAPIError(
+                'Batch returned %d results for %d actions' % (
+                    len(data), len(chunk)))
+        return data
+
+
+    def make_datacenters(self, info):
+        return DataCenter.from_api(info)
+
+    def get_datacenters(self):
+        data = self.request("avail.datacenters")
+        return map(self.make_datacenters, data)
+
+    def make_plans(self, info):
+        return Plan.from_api(info)
+
+    def get_linode_plans(self):
+        data = self.request("avail.linodeplans")
+        return map(self.make_plans, data)
+
+    def make_distribution(self, info):
+        return Distribution.from_api(info)
+
+    def get_distributions(self):
+        data = self.request("avail.distributions")
+        return map(self.make_distribution, data)
+
+    def get_linode_ip_map(self, linode_ids=None):
+        """Map linode ids to their ip addresses.
+
+        Without linode_ids a single linode.ip.list call covers every linode
+        in the account, else the per linode lookups are batched.
+        """
+        ip_map = {}
+        if linode_ids is None:
+            ip_fields = self.request("linode.ip.list")
+        else:
+            ip_fields = []
+            results = self.request_batch(
+                [("linode.ip.list", {'LinodeID': linode_id})
+                 for linode_id in linode_ids])
+            for data, errors in results:
+                if errors:
+                    raise ProviderAPIError(errors)
+                ip_fields.extend(data)
+        for ip_field in ip_fields:
+            ip_map.setdefault(
+                ip_field['LINODEID'], []).append(ip_field['IPADDRESS'])
+        return ip_map
+
+    def make_linode_instace(self, info, ip_addresses=None):
+        if ip_addresses is None:
+            ip_addresses = [ip_field['IPADDRESS'] for ip_field in self.request("linode.ip.list", {'LinodeID': info['LINODEID']})]
+        return LinodeInstace.from_api(info, ip_addresses=ip_addresses)
+
+    def get_linode_instaces(self):
+        start = self.transport.stats.round_trips
+        data = self.request("linode.list")
+        ip_map = self.get_linode_ip_map()
+        instances = [
+            self.make_linode_instace(info, ip_map.get(info['LINODEID'], []))
+            for info in data]
+        log.debug("Listed %d linodes in %d api round trips",
+                  len(instances), self.transport.stats.round_trips - start)
+        return instances
+
+    def iter_linode_instaces(self):
+        """Yield instances as soon as linode.list returns.
+
+        Ip addresses are fetched by a single linode.ip.list call running
+        alongside, and only waited on when an instance's are accessed.
+        """
+        ip_map = spawn(self.get_linode_ip_map)
+
+        def ip_loader(linode_id):
+            return ip_map.result().get(linode_id, [])
+
+        for info in self.request("linode.list"):
+            yield LinodeInstace.from_api(info, ip_loader=ip_loader)
+
+    def get_linode_instace(self, linode_instace_id):
+        # linode and ip lookups share a single round trip.
+        (data, errors), (ip_fields, ip_errors) = self.request_batch([
+            ("linode.list", {'LinodeID': linode_instace_id}),
+            ("linode.ip.list", {'LinodeID': linode_instace_id})])
+        if errors or ip_errors:
+            raise ProviderAPIError(errors or ip_errors)
+        if not data:
+            return None
+
+        return self.make_linode_instace(
+            data[0], [ip_field['IPADDRESS'] for ip_field in ip_fields])
+
+    def create_linode_instace(self, datacenter_id, plan_id, payment_term=None):
+        params = dict(DatacenterID=datacenter_id, PlanID=plan_id, PaymentTerm=payment_term)
+        data = self.request('linode.create', params)
+
+        return self.get_linode_instace(data['LinodeID'])
+
+    def make_image(self, info):
+        return Image.from_api(info)
+
+    def get_images(self):
+        data = self.request('image.list')
+        return map(self.make_image, data)
+
+    def make_linode_disk(self, info):
+        return Disk.from_api(info)
+
+    def get_linode_disks(self, linode_instace):
+        data = self.request('linode.disk.list', {'LinodeID': linode_instace.linodeid})
+        return map(self.make_linode_disk, data)
+
     def make_linode_job(self, info):
-        return Job.from_dict(
-            dict(entered_dt=info['ENTERED_DT'], action=info['ACTION'], label=info['LABEL'],
-                host_start_dt=info['HOST_START_DT'], linodeid=info['LINODEID'], host_finish_dt=info['HOST_FINISH_DT'],
-                duration=info['DURATION'], host_message=info['HOST_MESSAGE'], jobid=info['JOBID'], host_success=info['HOST_SUCCESS']) )
+        return Job.from_api(info)
 
     def get_linode_pending_jobs(self, linode_instace):
         data = self.request('linode.job.list', {'LinodeID': linode_instace.linodeid, 'pendingOnly': '1'})
         return map(self.make_linode_job, data)
 
+    def get_linode_jobs(self, linode_instace, job_ids):
+        """Fetch specific jobs of a linode, finished or not.
+        """
+        results = self.request_batch(
+            [('linode.job.list', {'LinodeID': linode_instace.linodeid, 'JobID': job_id})
+             for job_id in job_ids])
+        jobs = []
+        for data, errors in results:
+            if errors:
+                raise ProviderAPIError(errors)
+            jobs.extend(map(self.make_linode_job, data))
+        return jobs
+
+    def get_linodes_pending_jobs(self, linode_ids):
+        """Map each of linode_ids to its pending jobs, in batched requests.
+        """
+        results = self.request_batch(
+            [('linode.job.list', {'LinodeID': linode_id, 'pendingOnly': '1'})
+             for linode_id in linode_ids])
+        jobs = {}
+        for linode_id, (data, errors) in zip(linode_ids, results):
+            if errors:
+                raise ProviderAPIError(errors)
+            jobs[linode_id] = map(self.make_linode_job, data)
+        return jobs
+
+    def batch(self):
+        """Queue api calls to be sent together via the batch action.
+
+        See Batch for usage.
+        """
+        return Batch(self)
 
     @classmethod
-    def connect(cls, config):
+    def connect(cls, config, transport=None, retrier=None):
         key = config.get('linode-api-key')
         if not key:
             raise KeyError("Missing api credentials")
         else:
-            return Client(key)
+            client = Client(
+                key, transport or Transport.from_config(config),
+                int(config.get('linode-batch-size') or DEFAULT_BATCH_SIZE),
+                RateLimiter.from_config(config),
+                retrier or Retrier.from_config(config))
+            # eg. a local fake api, see tests/fakelinode.py
+            if config.get('linode-api-url'):
+                client.api_url_base = config['linode-api-url']
+            return client
+
+
 
 
+class PendingResult(object):
+    """Outcome of an api call queued on a Batch.
+    """
+
+    def __init__(self, api_action, params):
+        self.api_action = api_action
+        self.params = params
+        self.done = False
+        self.data = None
+        self.errors = None
+
+    def set(self, data, errors):
+        self.data = data
+        self.errors = errors
+        self.done = True
+
+    def result(self):
+        """Return the action's data, raising its ERRORARRAY if it failed.
+        """
+        if not self.done:
+            raise ProviderAPIError(
+                "Batched action %s was not executed" % self.api_action)
+        if self.errors:
+            raise ProviderAPIError(self.errors)
+        return self.data
+
+
+class Batch(Actions):
+    """Collects api calls to be sent together as batched requests.
+
+    Only the Actions, whose result is the raw action data, can be queued,
+    each call returns a PendingResult which is resolved when the batch
+    executes::
+
+        with client.batch() as batch:
+            disk = batch.linode_disk_createfromstackscript(...)
+            swap = batch.create_linode_swap(instance)
+        disk_list = "%s,%s" % (
+            disk.result()['DiskID'], swap.result()['DiskID'])
+
+    Client methods that process their result (listings, make_* wrappers)
+    aren't available on a batch.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.pending = []
+
+    def request(self, api_action, params=None, method='GET'):
+        pending = PendingResult(api_action, params)
+        self.pending.append(pending)
+        return pending
+
+    def execute(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return pending
+        results = self.client.request_batch(
+            [(p.api_action, p.params) for p in pending])
+        for p, (data, errors) in zip(pending, results):
+            p.set(data, errors)
+        return pending
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.execute()
+        return False
 
 
 def main():
@@ -1,13 +1,15 @@
 import logging
+import sys
 import time
 import uuid
 import yaml
-import re
 
 from juju_linode import constraints
 from juju_linode.exceptions import ConfigError, PrecheckError
 from juju_linode import ops
+from juju_linode.engine import EngineRunner
 from juju_linode.runner import Runner
+from juju_linode.status import parse_linode_id
 
 
 log = logging.getLogger("juju.linode")
@@ -19,7 +21,29 @@ class BaseCommand(object):
         self.config = config
         self.provider = provider
         self.env = environment
-        self.runner = Runner(self.config.get_current_env_conf()['default-num-runner'])
+        self.runner = self.make_runner()
+
+    def make_runner(self):
+        conf = self.config.get_current_env_conf()
+        engine = self.config.engine or conf.get('runner-engine', 'threads')
+        if engine == 'coroutine':
+            return EngineRunner(conf['default-num-runner'])
+        return Runner(conf['default-num-runner'])
+
+    def refill_pool(self):
+        """Replace the warm pool linodes claimed by this command.
+        """
+        refills = self.provider.pool.take_refills()
+        if not refills:
+            return
+        log.info("Refilling warm pool with %d instances...", len(refills))
+        for datacenter, plan in refills:
+            self.runner.queue_op(
+                ops.PoolFill(
+                    self.provider, self.env,
+                    dict(datacenter_id=datacenter, plan_id=plan)))
+        for result in self.runner.iter_results():
+            pass
 
     def solve_constraints(self):
         return constraints.solve_constraints(self.config.constraints)
@@ -82,6 +106,7 @@ class Bootstrap(BaseCommand):
             self.provider.terminate_instance(instance.linodeid)
             raise
         log.info("Bootstrap complete.")
+        self.refill_pool()
 
     def check_preconditions(self):
         super(Bootstrap, self).check_preconditions()
@@ -99,6 +124,8 @@ class ListMachines(BaseCommand):
             "Id", "Label", "RAM", "DataCenter", "Address")
 
         allmachines = self.config.options.all
+        # Rows are printed as instances stream in, addresses are resolved
+        # alongside the listing.
         for m in self.provider.get_instances():
             if not allmachines:
                 continue
@@ -107,19 +134,18 @@ class ListMachines(BaseCommand):
                 print(header)
                 header = None
 
-            for d in constraints.DATACENTERS:
-                if m.datacenterid == d.datacenterid:
-                    break
-            name = m.name
+            d = constraints.get_datacenter(m.datacenterid)
+            name = m.label
             if len(name) > 18:
                 name = name[:15] + "..."
-            
+
             print("{:<8} {:<18} {:<5} {:<10} {:<20}".format(
-                m.id,
-                m.label,
+                m.linodeid,
+                name,
                 m.totalram,
-                d.abbr,
+                d and d.abbr or m.datacenterid,
                 ','.join(m.ip_addresses) ).strip())
+            sys.stdout.flush()
 
 
 class AddMachine(BaseCommand):
@@ -140,6 +166,7 @@ class AddMachine(BaseCommand):
 
         for result in self.runner.iter_results():
             pass
+        self.refill_pool()
 
 
 class TerminateMachine(BaseCommand):
@@ -150,83 +177,80 @@ class TerminateMachine(BaseCommand):
         self.check_preconditions()
         self._terminate_machines()
 
-    def _machine_filter(self, mid, m):
-        return any([
-            spec == mid for spec in
-            self.config.options.machines if mid != '0'])
+    def _select_machines(self, status):
+        """Machine ids of the machines given, as ids, addresses or
+        linode ids.
+        """
+        selected = set()
+        for spec in self.config.options.machines:
+            mid = spec in status.machines and spec or (
+                status.machine_by_address(spec) or
+                status.machine_by_linodeid(spec))
+            if mid is None:
+                log.warning("No machine %s in environment", spec)
+            elif mid == '0':
+                log.warning("Not terminating the state server, machine 0")
+            else:
+                selected.add(mid)
+        return selected
 
     def _terminate_machines(self, machine_filter=None):
         status = self.env.status()
-        machines = status.get('machines', {})
 
-        machine_filter = machine_filter or self._machine_filter
+        if machine_filter is None:
+            selected = self._select_machines(status)
+            machine_filter = lambda mid, m: mid in selected
         # Using the api instance-id can be the provider id, but
         # else it defaults to ip, and we have to disambiguate.
         remove = []
-        for m in machines:
-            if machine_filter(m, machines[m]):
+        for mid, m in status.machines.items():
+            if machine_filter(mid, m):
                 remove.append(
-                    {'address': machines[m].get('dns-name'),
-                     'instance_id': machines[m]['instance-id'],
-                     'machine_id': m})
+                    {'address': status.address(mid),
+                     'instance_id': status.instance_id(mid),
+                     'machine_id': mid})
 
-        #address_map = dict([(d.remote_access_name, d) for
-        #                    d in self.provider.get_instances()])
-        address_map = None
+        # One listing resolves every machine, by the linode id in its
+        # instance id, else by its address.
+        instances = self.provider.get_instance_index()
 
-        #instance_list =  address_map.values()
-
-
-        #if not remove:
-        #    return status, address_map
+        if not remove:
+            return status, instances
 
         log.info("Terminating machines %s",
                  " ".join([m['machine_id'] for m in remove]))
 
+        # Remove all the machines from juju state in one call, before the
+        # parallel provider teardown.
+        self.env.terminate_machines([m['machine_id'] for m in remove])
+
         for m in remove:
-            instance = None
-            domain_name = None;
-
-            temp = re.findall("linode(\d+)", m['instance_id'])
-            machine_linode_id = temp[0] if len(temp) > 0 and len(temp[0]) > 4 else None
-            
-            #instances = [
-            #    i for i in instance_list
-            #    if machine_linode_id == str(i.linodeid)]
-            instance = self.provider.get_instance(machine_linode_id)
-            domain_name = m['address'];
-            #else:
-            #    instances = [
-            #        i for i in instance_list
-            #        if m['instance_id'] == i.remote_access_name]
-
-
-            #if len(instances) == 1:
-            #    instance = instances[0]
-
-            env_only = False  # Remove from only env or also provider.
+            instance = instances.find(
+                parse_linode_id(m['instance_id']), m['address'])
             if instance is None:
+                # We have a machine in juju state that we couldn't
+                # find in provider, removing it from state is enough
+                # for destroy to proceed.
                 log.warning(
                     "Couldn't resolve machine %s's address %s to instance" % (
                         m['machine_id'], m['address']))
-                # We have a machine in juju state that we couldn't
-                # find in provider. Remove it from state so destroy
-                # can proceed.
-                env_only = True
-                instance_id = None
-            else:
-                instance_id = instance.linodeid
+                continue
+            # Machines registered by domain name have it removed too.
+            domain_name = None
+            if m['address'] not in instance.ip_addresses:
+                domain_name = m['address']
             self.runner.queue_op(
                 ops.MachineDestroy(
                     self.provider, self.env, {
                         'machine_id': m['machine_id'],
-                        'instance_id': instance_id,
+                        'instance_id': instance.linodeid,
+                        'instance': instance,
                         'domain_name': domain_name},
-                    env_only=env_only))
+                    iaas_only=True))
         for result in self.runner.iter_results():
             pass
 
-        return status, address_map
+        return status, instances
 
 
 class DestroyEnvironment(TerminateMachine):
@@ -246,7 +270,7 @@ class DestroyEnvironment(TerminateMachine):
         if force:
             return self.force_environment_destroy()
 
-        env_status, instance_map = self._terminate_machines(
+        env_status, instances = self._terminate_machines(
             state_service_filter)
 
         # sadness, machines are marked dead, but juju is async to
@@ -258,29 +282,83 @@ class DestroyEnvironment(TerminateMachine):
         self.env.destroy_environment()
 
         # Remove the state server.
-        bootstrap_host = env_status.get(
-            'machines', {}).get('0', {}).get('dns-name')
-        instance = instance_map.get(bootstrap_host)
+        instance = instances.find(
+            parse_linode_id(env_status.instance_id('0')),
+            env_status.address('0'))
         if instance:
             log.info("Terminating state server")
-            self.provider.terminate_instance(instance.linodeid)
+            self.provider.terminate_instance(instance)
         log.info("Environment Destroyed")
 
     def force_environment_destroy(self):
         env_name = self.config.get_env_name()
-        env_machines = [m for m in self.provider.get_instances()
-                        if m.name.startswith("%s-" % env_name)]
 
         log.info("Destroying environment")
-        for m in env_machines:
+        # Workers start destroying as the instance listing streams in.
+        self.runner.start(self.runner.default_num_runner)
+        try:
+            for m in self.provider.get_instances():
+                if not m.label.startswith("%s-" % env_name):
+                    continue
+                self.runner.queue_op(
+                    ops.MachineDestroy(
+                        self.provider, self.env,
+                        {'instance_id': m.linodeid, 'instance': m,
+                         'domain_name': None},
+                        iaas_only=True))
+
+            for result in self.runner.iter_results():
+                pass
+        finally:
+            self.runner.stop()
+
+        # Fast destroy the client cache by removing the jenv file.
+        self.env.destroy_environment_jenv()
+        log.info("Environment Destroyed")
+
+
+class Pool(BaseCommand):
+    """Show the warm pool, or resize the pool matching the constraints.
+    """
+
+    def run(self):
+        if self.config.options.size is not None:
+            self.resize(self.config.options.size)
+        self.show()
+
+    def show(self):
+        print("{:<10} {:<14} {:<6} {:<6}".format(
+            "DataCenter", "Plan", "Ready", "Total"))
+        pools = self.provider.pool.members()
+        for (datacenter, plan), members in sorted(pools.items()):
+            d = constraints.find_datacenter(datacenter)
+            p = constraints.find_plan(plan)
+            print("{:<10} {:<14} {:<6} {:<6}".format(
+                d and d.abbr or datacenter,
+                p and p.label or plan,
+                len([m for m in members if m.status == 1]),
+                len(members)))
+
+    def resize(self, size):
+        plan, datacenter, domain_postfix = self.solve_constraints()
+        members = self.provider.pool.members(datacenter, plan).get(
+            (str(datacenter), str(plan)), [])
+        log.info("Resizing warm pool from %d to %d instances",
+                 len(members), size)
+
+        for n in range(size - len(members)):
+            self.runner.queue_op(
+                ops.PoolFill(
+                    self.provider, self.env,
+                    dict(datacenter_id=datacenter, plan_id=plan)))
+
+        for m in members[size:]:
             self.runner.queue_op(
                 ops.MachineDestroy(
-                    self.provider, self.env, {'instance_id': m.id},
+                    self.provider, self.env,
+                    {'instance_id': m.linodeid, 'instance': m,
+                     'domain_name': None},
                     iaas_only=True))
 
         for result in self.runner.iter_results():
             pass
-
-        # Fast destroy the client cache by removing the jenv file.
-        self.env.destroy_environment_jenv()
-        log.info("Environment Destroyed")
@@ -42,6 +42,14 @@ class Config(object):
     def upload_tools(self):
         return getattr(self.options, 'upload_tools', False)
 
+    @property
+    def engine(self):
+        return getattr(self.options, 'engine', None)
+
+    @property
+    def refresh_catalog(self):
+        return getattr(self.options, 'refresh_catalog', False)
+
     @property
     def num_machines(self):
         return getattr(self.options, 'num_machines', 0)
@@ -5,6 +5,15 @@ DATACENTERS = ()
 DEFAULT_PLAN = '1'
 PLAN_MAP = ()
 
+# Lookup indexes built by init.
+SORTED_PLANS = ()
+PLAN_INDEX = {}
+DATACENTER_INDEX = {}
+DATACENTER_IDS = {}
+
+# Memoized solutions, keyed by constraint string.
+_SOLVED = {}
+
 # Would be nice to use ubuntu-distro-info, but portability.
 SERIES_MAP = {
     '12-04': 'precise',
@@ -23,15 +32,60 @@ SUFFIX_SIZES = {
     "p": 1024 * 1024 * 1024}
 
 
+def normalize(value):
+    return " ".join(str(value).lower().split())
+
+
+def build_indexes():
+    """Index plans by label, alias and id and datacenters by abbr, id
+    and location.
+    """
+    global SORTED_PLANS, PLAN_INDEX, DATACENTER_INDEX, DATACENTER_IDS
+
+    plans = {}
+    for p in PLAN_MAP:
+        label = normalize(p.label)
+        plans[label] = p
+        # both "1024" and "linode 1024" is acceptable
+        if label.startswith('linode '):
+            plans[label[len('linode '):]] = p
+        plans.setdefault(normalize(p.planid), p)
+
+    datacenters = {}
+    for d in DATACENTERS:
+        datacenters[normalize(d.abbr)] = d
+        datacenters[normalize(d.location)] = d
+        datacenters.setdefault(normalize(d.datacenterid), d)
+
+    # Cheapest first, so the first plan that fits is the cheapest.
+    SORTED_PLANS = tuple(sorted(
+        PLAN_MAP, key=lambda p: (p.price, p.hourly, p.ram)))
+    PLAN_INDEX = plans
+    DATACENTER_INDEX = datacenters
+    DATACENTER_IDS = dict([(d.datacenterid, d) for d in DATACENTERS])
+    _SOLVED.clear()
+
+
+def find_plan(value):
+    return PLAN_INDEX.get(normalize(value))
+
+
+def find_datacenter(value):
+    return DATACENTER_INDEX.get(normalize(value))
+
+
+def get_datacenter(datacenterid):
+    return DATACENTER_IDS.get(datacenterid)
+
+
 def init(client, data=None):
-    global PLAN_MAP, DATACENTERS, DEFAULT_DATACENTER
+    global PLAN_MAP, DATACENTERS, DEFAULT_DATACENTER, DEFAULT_PLAN
 
-    if data is not None:
-        PLAN_MAP = data['plans']
-        DATACENTERS = data['datacenters']
-        return
+    if data is None:
+        data = {'plans': client.get_linode_plans(),
+                'datacenters': client.get_datacenters()}
 
-    PLAN_MAP = client.get_linode_plans()
+    PLAN_MAP = data['plans']
     for plan in PLAN_MAP:
         if plan.label == 'Linode 1024':
             DEFAULT_PLAN = plan.planid
@@ -40,7 +94,7 @@ def init(client, data=None):
         raise ValueError("Could not find plan 'Linode 1024'")
 
     # Record datacenters so we can offer nice aliases.
-    DATACENTERS = client.get_datacenters()
+    DATACENTERS = data['datacenters']
 
     for datacenter in DATACENTERS:
         if datacenter.abbr == 'dallas':
@@ -49,6 +103,41 @@ def init(client, data=None):
     else:
         raise ValueError("Could not find region 'dallas'")
 
+    build_indexes()
+
+
+def parse_size(value):
+    """Convert a juju size (eg. 512M, 4G) into megabytes.
+    """
+    value = value.strip().lower()
+    multiplier = 1
+    if value and value[-1] in SUFFIX_SIZES:
+        multiplier = SUFFIX_SIZES[value[-1]]
+        value = value[:-1]
+    try:
+        size = float(value) * multiplier
+    except ValueError:
+        raise ConstraintError("Invalid size %s" % value)
+    return int(size)
+
+
+def plan_available(plan, datacenter_id):
+    avail = getattr(plan, 'avail', None)
+    if not avail:
+        # No availability data, let linode.create decide.
+        return True
+    return avail.get(str(datacenter_id), 0) > 0
+
+
+def plan_fits(plan, c):
+    if 'mem' in c and plan.ram < c['mem']:
+        return False
+    if 'cores' in c and plan.cores < c['cores']:
+        return False
+    if 'root-disk' in c and plan.disk * SUFFIX_SIZES['g'] < c['root-disk']:
+        return False
+    return True
+
 
 def parse_constraints(constraints):
     """
@@ -59,42 +148,112 @@ def parse_constraints(constraints):
         k, v = p.split('=', 1)
         c[k.strip()] = v.strip()
 
+    # juju spells cores as cpu-cores
+    if 'cpu-cores' in c:
+        c['cores'] = c.pop('cpu-cores')
+
     unknown = set(c).difference(
-        set(['datacenter', 'plan', 'domain_postfix']))
+        set(['datacenter', 'plan', 'domain_postfix',
+             'mem', 'cores', 'root-disk', 'arch']))
     if unknown:
         raise ConstraintError("Unknown constraints %s" % (" ".join(unknown)))
 
     c_out = {}
     
     if 'plan' in c:
-        for p in PLAN_MAP:
-            if c['plan'].lower() == p.label.lower() or 'linode '+c['plan'].lower() == p.label.lower(): # both "1024" and "linode 1024" is acceptable
-                c_out['plan'] = p.planid
-                break
-        else:
+        p = find_plan(c['plan'])
+        if p is None:
             raise ConstraintError("Unknown Linode plan %s" % c['plan'])
+        c_out['plan'] = p.planid
 
     if 'datacenter' in c:
-        for d in DATACENTERS:
-            if c['datacenter'] == d.abbr:
-                c_out['datacenter'] = d.datacenterid
-                break
-        else:
+        d = find_datacenter(c['datacenter'])
+        if d is None:
             raise ConstraintError("Unknown datacenter %s" % c['datacenter'])
+        c_out['datacenter'] = d.datacenterid
 
     if 'domain_postfix' in c:
         c_out['domain_postfix'] = c['domain_postfix']
 
+    for k in ('mem', 'root-disk'):
+        if k in c:
+            c_out[k] = parse_size(c[k])
+
+    if 'cores' in c:
+        try:
+            c_out['cores'] = int(c['cores'])
+        except ValueError:
+            raise ConstraintError("Invalid cores %s" % c['cores'])
+
+    if 'arch' in c and c['arch'] not in ARCHES:
+        raise ConstraintError("Unsupported arch %s" % c['arch'])
+
     return c_out
 
 
+def solve_plan(c, datacenter_id):
+    """Return the cheapest plan satisfying the resource constraints that
+    is available in the datacenter.
+    """
+    for plan in SORTED_PLANS:
+        if plan_fits(plan, c) and plan_available(plan, datacenter_id):
+            return plan.planid
+    return None
+
+
 def solve_constraints(constraints):
-    """Return machine plan and datacenter.
+    """Return machine plan, datacenter and domain postfix.
+
+    Solutions are memoized, so bulk operations solve each distinct
+    constraint string once.
+    """
+    solution = _SOLVED.get(constraints)
+    if solution is None:
+        solution = _SOLVED[constraints] = compile_constraints(constraints)
+    return solution
+
+
+def compile_constraints(constraints):
+    """Solve a constraint string against the plan and datacenter indexes.
     """
 
     constraints = parse_constraints(constraints)
-    constraints['datacenter'] = constraints.pop('datacenter', DEFAULT_DATACENTER)
-    constraints['plan'] = constraints.pop('plan', DEFAULT_PLAN)
+    sized = set(['mem', 'cores', 'root-disk']).intersection(constraints)
+
+    if 'plan' in constraints:
+        plan = find_plan(constraints['plan'])
+        if not plan_fits(plan, constraints):
+            raise ConstraintError(
+                "Plan %s does not satisfy %s" % (
+                    plan.label, ", ".join(sorted(sized))))
+
+    if 'datacenter' in constraints:
+        datacenters = [constraints['datacenter']]
+    else:
+        # Prefer the default, but fall back to any datacenter with capacity.
+        datacenters = [DEFAULT_DATACENTER] + [
+            d.datacenterid for d in DATACENTERS
+            if d.datacenterid != DEFAULT_DATACENTER]
+
+    for datacenter in datacenters:
+        if 'plan' in constraints:
+            plan = constraints['plan']
+            if not plan_available(find_plan(plan), datacenter):
+                continue
+        elif sized:
+            plan = solve_plan(constraints, datacenter)
+            if plan is None:
+                continue
+        else:
+            plan = DEFAULT_PLAN
+        break
+    else:
+        raise ConstraintError(
+            "No available plan satisfies constraints in %s" % (
+                " ".join([str(d) for d in datacenters])))
+
+    constraints['datacenter'] = datacenter
+    constraints['plan'] = plan
     constraints['domain_postfix'] = constraints.pop('domain_postfix', None)
     print(constraints)
 
@@ -102,15 +261,19 @@ def solve_constraints(constraints):
 
 
 def get_images(client):
+    """Map series and release versions to 64 bit Ubuntu distribution ids.
+
+    Linode's stock images are its distributions, image.list only has the
+    account's own images.
+    """
     images = {}
-    for i in client.get_images():
-        if not i.public:
+    for d in client.get_distributions():
+        if not d.is64bit or not d.label.startswith("Ubuntu "):
             continue
-        if not i.distribution == "Ubuntu":
+        version = d.label.split()[1]
+        series = SERIES_MAP.get(version.replace('.', '-'))
+        if series is None:
             continue
-
-        for s in SERIES_MAP:
-            if ("ubuntu-%s-x64" % s) == i.slug:
-                images[SERIES_MAP[s]] = i.id
-                images[s.replace('-', '.')] = i.id
+        images[series] = d.distributionid
+        images[version] = d.distributionid
     return images
@@ -0,0 +1,21 @@
+"""
+Dns lookups for waiting on a new record to resolve, instead of sleeping a
+fixed time, see engine.wait_for_record_async.
+"""
+
+import logging
+import socket
+
+
+log = logging.getLogger("juju.linode")
+
+DEFAULT_TIMEOUT = 300
+
+
+def resolve(name):
+    """Return the addresses name resolves to, empty if it doesn't.
+    """
+    try:
+        return socket.gethostbyname_ex(name)[2]
+    except socket.error:
+        return []
@@ -1,6 +1,8 @@
-from juju_linode.exceptions import ProviderAPIError
+from juju_linode.exceptions import (
+    AmbiguousAPIError, ProviderAPIError, TransientAPIError)
+from juju_linode.retry import Retrier
+from juju_linode.transport import Transport
 
-import requests
 from requests.auth import HTTPBasicAuth
 import json
 import string
@@ -12,23 +14,47 @@ class DomainManager(object):
 
     version = 1.0
 
-    def __init__(self, api_url, api_username, api_password):
+    # Status codes of requests refused without being applied.
+    rejected_status = (429, 502, 503)
+
+    # Gateway timeout, the change may have been applied upstream.
+    ambiguous_status = (504,)
+
+    def __init__(self, api_url, api_username, api_password, transport=None,
+                 retrier=None):
         self.api_url = api_url
         self.api_username = api_username
         self.api_password = api_password
+        self.transport = transport or Transport()
+        self.retrier = retrier or Retrier()
 
     def request(self, params=None):
 
         print("creating domain: ", json.dumps(params))
 
+        # Record changes aren't idempotent, only rejected requests retry.
+        action = 'domain-manager.%s' % params['changes'][0][0]
+        return self.retrier.call([action], self._request, params)
+
+    def _request(self, params):
+
         headers = {'User-Agent': 'juju/client'}
         url = self.api_url
 
         headers['Content-Type'] = "application/json"
-        response = requests.post(url, headers=headers, data=json.dumps(params), auth=HTTPBasicAuth(self.api_username, self.api_password))
+        response = self.transport.request(
+            'POST', url, label='domain-manager', headers=headers,
+            data=json.dumps(params),
+            auth=HTTPBasicAuth(self.api_username, self.api_password))
 
         print(response.content)
 
+        if response.status_code in self.rejected_status:
+            raise TransientAPIError(
+                'Domain manager unavailable (%s)' % response.status_code)
+        if response.status_code in self.ambiguous_status:
+            raise AmbiguousAPIError(
+                'Domain manager timed out (%s)' % response.status_code)
         if response.status_code != 200:
             raise ProviderAPIError('Error on creating domain')
 
@@ -60,13 +86,16 @@ class DomainManager(object):
 
 
     @classmethod
-    def connect(cls, config):
+    def connect(cls, config, transport=None, retrier=None):
         api_url = config.get('domain-manager-api-url')
         api_username = config.get('domain-manager-username')
         api_password = config.get('domain-manager-password')
         if not api_url:
             raise KeyError("Missing api credentials")
         else:
-            return DomainManager(api_url, api_username, api_password)
+            return DomainManager(
+                api_url, api_username, api_password,
+                transport or Transport.from_config(config),
+                retrier or Retrier.from_config(config))
 
 
@@ -0,0 +1,452 @@
+"""
+Single threaded, generator based provisioning engine.
+
+An alternative to the thread per op Runner: ops run as coroutines on one
+scheduler thread. Waiting (backoff sleeps, job polls) never holds a
+thread, only the short blocking api calls are handed to a small bounded
+pool of worker threads, so hundreds of in flight provisions cost little
+more than their generator frames.
+
+Coroutines are generators that yield what they wait on:
+
+- Sleep(seconds), to resume later.
+- a runner.Future (eg. from loop.call or the job poller), to resume with
+  its result, or with its exception raised at the yield.
+- WaitFor(future, timeout), as above but raising TimeoutError.
+
+A coroutine produces its result by raising Return(value). loop.cancel(task)
+raises CancelledError at the task's current yield, and in the task it is
+waiting on, if any.
+
+The same coroutines also run on plain threads with a ThreadLoop, so the
+blocking code paths share their definition with the engine's.
+"""
+
+import heapq
+import itertools
+import logging
+from Queue import Queue, Empty
+import threading
+import time
+
+from juju_linode import dns, ssh
+from juju_linode.exceptions import CancelledError, TimeoutError
+from juju_linode.runner import Future
+from juju_linode.waiter import Backoff
+
+
+log = logging.getLogger("juju.linode")
+
+
+class Return(Exception):
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class Sleep(object):
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class WaitFor(object):
+
+    def __init__(self, future, timeout):
+        self.future = future
+        self.timeout = timeout
+
+
+class Executor(object):
+    """Bounded pool of threads for blocking calls.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.calls = Queue()
+        self.threads = []
+
+    def submit(self, func, *args, **kw):
+        future = Future()
+        self.calls.put((future, func, args, kw))
+        if len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            self.threads.append(thread)
+            thread.start()
+        return future
+
+    def work(self):
+        while True:
+            call = self.calls.get()
+            if call is None:
+                return
+            future, func, args, kw = call
+            try:
+                future.set_result(func(*args, **kw))
+            except Exception, e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        for t in self.threads:
+            self.calls.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+
+class Task(Future):
+    """A coroutine scheduled on a Loop.
+    """
+
+    def __init__(self, coroutine):
+        super(Task, self).__init__()
+        self.coroutine = coroutine
+        # Incremented per suspension, stale wakeups are ignored.
+        self.token = 0
+        # What the task is suspended on.
+        self.waiting = None
+
+
+class Loop(object):
+
+    def __init__(self, workers=10, clock=time.time):
+        self.executor = Executor(workers)
+        self.clock = clock
+        self.ready = Queue()
+        self.timers = []
+        self.active = 0
+        self._seq = itertools.count()
+
+    def call(self, func, *args, **kw):
+        """Run a blocking func on the worker pool, returns a Future.
+        """
+        return self.executor.submit(func, *args, **kw)
+
+    def spawn(self, coroutine):
+        task = Task(coroutine)
+        self.active += 1
+        self.ready.put((task, task.token, None, None))
+        return task
+
+    def cancel(self, task):
+        """Stop task at its current yield, returns False if it's done.
+        """
+        if task.done():
+            return False
+        task.token += 1
+        waiting, task.waiting = task.waiting, None
+        self.ready.put((task, task.token, None, CancelledError("Cancelled")))
+        if isinstance(waiting, Task):
+            self.cancel(waiting)
+        return True
+
+    def _wake(self, task, token, future):
+        exception = future.exception()
+        if exception is not None:
+            self.ready.put((task, token, None, exception))
+        else:
+            self.ready.put((task, token, future.result(), None))
+
+    def _suspend(self, task, waiting):
+        task.token += 1
+        token = task.token
+        task.waiting = waiting
+        if isinstance(waiting, Sleep):
+            heapq.heappush(self.timers, (
+                self.clock() + waiting.seconds, next(self._seq),
+                task, token, None))
+        elif isinstance(waiting, WaitFor):
+            heapq.heappush(self.timers, (
+                self.clock() + waiting.timeout, next(self._seq),
+                task, token, TimeoutError(
+                    "Timed out after %ss" % waiting.timeout)))
+            waiting.future.add_done_callback(
+                lambda f: self._wake(task, token, f))
+        elif isinstance(waiting, Future):
+            waiting.add_done_callback(
+                lambda f: self._wake(task, token, f))
+        else:
+            self.ready.put((task, token, None, TypeError(
+                "Coroutine yielded unsupported %r" % (waiting,))))
+
+    def _step(self, task, value, exception):
+        try:
+            if exception is not None:
+                waiting = task.coroutine.throw(exception)
+            else:
+                waiting = task.coroutine.send(value)
+        except Return, r:
+            task.set_result(r.value)
+        except StopIteration:
+            task.set_result(None)
+        except Exception, e:
+            task.set_exception(e)
+        else:
+            self._suspend(task, waiting)
+            return
+        self.active -= 1
+        return task
+
+    def _next_timeout(self):
+        if not self.timers:
+            return None
+        return max(0, self.timers[0][0] - self.clock())
+
+    def run_iter(self):
+        """Run until no task is active, yielding tasks as they complete.
+        """
+        while self.active:
+            now = self.clock()
+            while self.timers and self.timers[0][0] <= now:
+                when, seq, task, token, exception = heapq.heappop(
+                    self.timers)
+                self.ready.put((task, token, None, exception))
+            try:
+                task, token, value, exception = self.ready.get(
+                    timeout=self._next_timeout())
+            except Empty:
+                continue
+            if token != task.token or task.done():
+                continue
+            completed = self._step(task, value, exception)
+            if completed is not None:
+                yield completed
+
+    def run(self):
+        for task in self.run_iter():
+            pass
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class ThreadTask(Future):
+    """A coroutine running on a thread of a ThreadLoop.
+    """
+
+    def __init__(self):
+        super(ThreadTask, self).__init__()
+        self.stopped = threading.Event()
+        # The ThreadTask this one is waiting on.
+        self.waiting = None
+
+
+class ThreadLoop(object):
+    """Loop interface for running coroutines on the calling thread.
+
+    Calls run inline and waits block, spawned coroutines get a thread
+    of their own, so work a coroutine spawns still runs concurrently.
+    """
+
+    def __init__(self, clock=time.time, sleep=None):
+        self.clock = clock
+        self.sleep = sleep
+
+    def call(self, func, *args, **kw):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kw))
+        except Exception, e:
+            future.set_exception(e)
+        return future
+
+    def spawn(self, coroutine):
+        task = ThreadTask()
+
+        def run():
+            try:
+                task.set_result(self.run(coroutine, task))
+            except Exception, e:
+                task.set_exception(e)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return task
+
+    def cancel(self, task):
+        """Stop task at its current yield, returns False if it's done.
+
+        Sleeps are cut short, other waits are let finish first.
+        """
+        if task.done():
+            return False
+        task.stopped.set()
+        if task.waiting is not None:
+            self.cancel(task.waiting)
+        return True
+
+    def _wait(self, task, waiting):
+        if isinstance(waiting, Sleep):
+            if self.sleep is not None:
+                self.sleep(waiting.seconds)
+            else:
+                task.stopped.wait(waiting.seconds)
+            return None
+        elif isinstance(waiting, WaitFor):
+            return waiting.future.result(waiting.timeout)
+        elif isinstance(waiting, ThreadTask):
+            task.waiting = waiting
+            try:
+                return waiting.result()
+            finally:
+                task.waiting = None
+        elif isinstance(waiting, Future):
+            return waiting.result()
+        raise TypeError("Coroutine yielded unsupported %r" % (waiting,))
+
+    def run(self, coroutine, task=None):
+        """Run coroutine to completion, returning its result.
+        """
+        task = task or ThreadTask()
+        value = exception = None
+        while True:
+            try:
+                if exception is not None:
+                    waiting = coroutine.throw(exception)
+                else:
+                    waiting = coroutine.send(value)
+            except Return, r:
+                return r.value
+            except StopIteration:
+                return None
+            value = exception = None
+            try:
+                value = self._wait(task, waiting)
+            except Exception, e:
+                exception = e
+            if task.stopped.is_set():
+                value, exception = None, CancelledError("Cancelled")
+
+
+class Stages(object):
+    """How long each stage of a coroutine took, logged on one line.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.start = clock()
+        self.timings = []
+
+    def done(self, name, start):
+        """Record stage name as having run from start till now.
+        """
+        self.timings.append((name, self.clock() - start))
+
+    def log(self, name):
+        log.info("%s stages: %s total:%.1fs", name, " ".join([
+            "%s:%.1fs" % timing for timing in self.timings]),
+            self.clock() - self.start)
+
+
+class AsyncClient(object):
+    """Client variant whose api methods return futures resolved on the
+    loop's worker pool, for use from coroutines::
+
+        client = AsyncClient(provider.client, loop)
+        boot = yield client.linode_boot(instance)
+    """
+
+    def __init__(self, client, loop):
+        self.client = client
+        self.loop = loop
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kw):
+            return self.loop.call(attr, *args, **kw)
+        return call
+
+
+class EngineRunner(object):
+    """Runner compatible interface executing ops on a Loop.
+
+    Ops provide run_async(loop), a coroutine, else their blocking run
+    is handed to the worker pool.
+    """
+
+    def __init__(self, default_num_runner):
+        self.default_num_runner = default_num_runner
+        self.ops = []
+        self.started = False
+
+    def queue_op(self, op):
+        self.ops.append(op)
+
+    def start(self, count):
+        pass
+
+    def stop(self):
+        pass
+
+    def iter_results(self):
+        loop = Loop(self.default_num_runner)
+        ops, self.ops = self.ops, []
+        tasks = set()
+        for op in ops:
+            if hasattr(op, 'run_async'):
+                tasks.add(loop.spawn(op.run_async(loop)))
+            else:
+                tasks.add(loop.spawn(run_blocking(loop, op)))
+        try:
+            for task in loop.run_iter():
+                # Tasks spawned by the ops complete here too.
+                if task not in tasks:
+                    continue
+                if task.exception() is not None:
+                    log.error("Error while processing op: %s",
+                              task.exception())
+                    continue
+                yield task.result()
+        finally:
+            loop.close()
+
+
+def run_blocking(loop, op):
+    result = yield loop.call(op.run)
+    raise Return(result)
+
+
+def wait_for_ssh_async(loop, host, port=22, timeout=ssh.DEFAULT_TIMEOUT,
+                       banner=True, probe=ssh.probe_ssh, backoff=None):
+    """Wait till sshd on host is reachable, returns the seconds waited.
+    """
+    start = loop.clock()
+    deadline = start + timeout
+    for interval in backoff or Backoff(0.5, 1.5, 5):
+        ready = yield loop.call(probe, host, port, banner=banner)
+        if ready:
+            elapsed = loop.clock() - start
+            log.debug("Ssh on %s ready after %.1fs", host, elapsed)
+            raise Return(elapsed)
+        now = loop.clock()
+        if now >= deadline:
+            raise TimeoutError(
+                "Ssh on %s not reachable within %ds" % (host, timeout))
+        yield Sleep(min(interval, deadline - now))
+
+
+def wait_for_record_async(loop, name, address, timeout=dns.DEFAULT_TIMEOUT,
+                          resolver=dns.resolve, backoff=None):
+    """Wait till name resolves to address, returns the seconds waited.
+
+    resolver is a callable mapping a name to a list of addresses.
+    """
+    start = loop.clock()
+    deadline = start + timeout
+    for interval in backoff or Backoff(1, 2, 15):
+        addresses = yield loop.call(resolver, name)
+        if address in addresses:
+            elapsed = loop.clock() - start
+            log.debug("Domain %s resolved after %.1fs", name, elapsed)
+            raise Return(elapsed)
+        now = loop.clock()
+        if now >= deadline:
+            raise TimeoutError(
+                "Domain %s did not resolve to %s within %ds" % (
+                    name, address, timeout))
+        yield Sleep(min(interval, deadline - now))
@@ -3,6 +3,8 @@ import logging
 import shutil
 import subprocess
 import socket
+import threading
+import time
 
 import os
 import yaml
@@ -10,15 +12,83 @@ import yaml
 log = logging.getLogger("juju.linode")
 
 from jujuclient import Environment as Client
+from jujuclient.exc import EnvError
 from juju_linode.constraints import SERIES_MAP
+from juju_linode.register import Registrar
+from juju_linode.status import StatusSnapshot, StatusWatcher
+
+# Seconds a fetched status is reused, changes made through the
+# environment drop it sooner.
+DEFAULT_STATUS_TTL = 5
 
 
 class Environment(object):
+    """Juju environment operations.
+
+    By default one authenticated api connection is held for the whole
+    command and status, machine removal and destroy go over it. Without
+    a reachable api server (or with juju-connection: cli in the
+    environment's config) the juju cli is run instead. Adding manual
+    machines always uses the cli, which provisions them over ssh.
+
+    Status is cached for juju-status-ttl seconds and dropped after any
+    change made through the environment. With juju-status-watch: true
+    it's instead kept current by an api watch.
+    """
 
     _client = None
+    _registrar = None
+    _status = None
+    _watcher = None
 
-    def __init__(self, config):
+    def __init__(self, config, clock=time.time):
         self.config = config
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._api_failed = False
+
+    def _conf(self):
+        return self.config.get_current_env_conf() or {}
+
+    @property
+    def use_api(self):
+        return self._conf().get('juju-connection', 'api') == 'api'
+
+    def get_client(self):
+        """The shared api connection, or None to use the cli.
+        """
+        if self._client is None and not self._api_failed and self.use_api:
+            try:
+                self._client = self.connect()
+            except Exception, e:
+                log.debug("Juju api unavailable, using the cli: %s", e)
+                self._api_failed = True
+        return self._client
+
+    def _call(self, name, api, cli):
+        """Run api(client) over the connection, falling back to cli()
+        if there's none or it broke.
+        """
+        with self._lock:
+            client = self.get_client()
+            if client is not None:
+                try:
+                    return api(client)
+                except EnvError:
+                    raise
+                except Exception, e:
+                    log.warning(
+                        "Juju api %s failed, using the cli: %s", name, e)
+                    self._drop_client()
+        return cli()
+
+    def _drop_client(self):
+        client, self._client = self._client, None
+        self._api_failed = True
+        try:
+            client.close()
+        except Exception:
+            pass
 
     def _run(self, command, env=None, capture_err=False):
         if env is None:
@@ -45,12 +115,83 @@ class Environment(object):
         return Client.connect(self.config.get_env_name())
 
     def close(self):
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
         if self._client:
             self._client.close()
             self._client = None
+        if self._registrar:
+            self._registrar.close()
+            self._registrar = None
+
+    @property
+    def registrar(self):
+        with self._lock:
+            if self._registrar is None:
+                self._registrar = Registrar.from_config(
+                    self, self.config.get_current_env_conf() or {})
+            return self._registrar
+
+    def register_machine(self, host):
+        """Add a provisioned instance as a manual machine.
+        """
+        return self.registrar.register(host)
 
-    def status(self):
-        return yaml.safe_load(self._run(['status']))
+    def status(self, refresh=False):
+        """Current status as a StatusSnapshot.
+        """
+        conf = self._conf()
+        if conf.get('juju-status-watch') and not refresh:
+            snapshot = self._watched_status()
+            if snapshot is not None:
+                return snapshot
+
+        ttl = float(conf.get('juju-status-ttl', DEFAULT_STATUS_TTL))
+        status = self._status
+        if (not refresh and status is not None and
+                self.clock() - status.fetched < ttl):
+            return status
+
+        fetched = self.clock()
+        status = self._call(
+            'status',
+            lambda client: StatusSnapshot.from_api(client.status(), fetched),
+            lambda: StatusSnapshot(
+                yaml.safe_load(self._run(['status'])), fetched))
+        if ttl:
+            self._status = status
+        return status
+
+    def _watched_status(self):
+        with self._lock:
+            if self._watcher is None:
+                client = self.get_client()
+                if client is None:
+                    return None
+                try:
+                    self._watcher = StatusWatcher(client, self.clock).start()
+                except Exception, e:
+                    log.warning("Couldn't watch juju status: %s", e)
+                    self._watcher = False
+            if not self._watcher:
+                return None
+            watcher = self._watcher
+        snapshot = watcher.current(timeout=30)
+        if snapshot is None:
+            log.debug("Juju status watch unavailable or stale, "
+                      "fetching status")
+        return snapshot
+
+    def invalidate_status(self):
+        """Drop the cached status, after changing the environment.
+
+        Watched status is stale until the watch delivers newer deltas,
+        status is fetched directly meanwhile.
+        """
+        self._status = None
+        if self._watcher:
+            self._watcher.mark_stale()
 
     def is_running(self):
         """Try to connect the api server websocket to see if env is running.
@@ -75,24 +216,47 @@ class Environment(object):
         except socket.error:
             return False
 
-    def add_machine(self, location, key=None, debug=False):
+    def add_machine(self, location, key=None, debug=False, env=None):
         ops = ['add-machine', location]
         if key:
             ops.extend(['--ssh-key', key])
         if debug:
             ops.append('--debug')
 
-        return self._run(ops, capture_err=debug)
+        try:
+            return self._run(ops, env=env, capture_err=debug)
+        finally:
+            self.invalidate_status()
 
     def terminate_machines(self, machines):
         cmd = ['terminate-machine', '--force']
         cmd.extend(machines)
-        return self._run(cmd)
+        try:
+            return self._call(
+                'terminate-machine',
+                lambda client: client.destroy_machines(machines, force=True),
+                lambda: self._run(cmd))
+        finally:
+            self.invalidate_status()
 
     def destroy_environment(self):
         cmd = [
             'destroy-environment', "-y", self.config.get_env_name()]
-        return self._run(cmd)
+        try:
+            return self._call(
+                'destroy-environment', self._destroy_environment_api,
+                lambda: self._run(cmd))
+        finally:
+            self.invalidate_status()
+
+    def _destroy_environment_api(self, client):
+        client._rpc({
+            "Type": "Client",
+            "Request": "DestroyEnvironment",
+            "Params": {}})
+        # As the cli does, drop the client cache of the environment.
+        self.close()
+        self.destroy_environment_jenv()
 
     def destroy_environment_jenv(self):
         """Force remove client cache of environment by deleting jenv.
@@ -37,3 +37,20 @@ class ProviderAPIError(Exception):
 
     def __str__(self):
         return "<ProviderAPIError message:%s>" % (str(self.message) or "Unknown")
+
+
+class CancelledError(Exception):
+    """Op was cancelled before it ran.
+    """
+
+
+class TransientAPIError(ProviderAPIError):
+    """Api call was rejected without being applied, and may succeed when
+    retried.
+    """
+
+
+class AmbiguousAPIError(ProviderAPIError):
+    """Api call failed in a way that leaves unknown whether it was
+    applied, eg. a gateway timeout or a garbled response.
+    """
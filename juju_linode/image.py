@@ -0,0 +1,153 @@
+"""
+Golden image provisioning.
+
+Instead of running the stackscript on every new machine, a linode is
+provisioned once with the stackscript and the packages juju's manual
+provider installs, and its root disk is imagized. Later machines create
+their root disk from that image.
+
+Images are labeled with a key derived from the stackscript id and
+series, so changing either builds a fresh image. The builder's
+environment is recorded in the image description, and only images
+built by the same environment are removed as stale.
+"""
+
+import logging
+import threading
+import time
+
+from juju_linode import ssh
+from juju_linode.exceptions import ProviderError, TimeoutError
+from juju_linode.register import ControlMasters
+from juju_linode.waiter import Backoff
+
+
+log = logging.getLogger("juju.linode")
+
+IMAGE_PREFIX = "juju"
+
+# Installed by juju when provisioning a manual machine.
+DEFAULT_PACKAGES = (
+    "curl", "cpu-checker", "bridge-utils", "rsyslog-gnutls",
+    "cloud-utils", "tmux")
+
+
+# Seconds to wait for an image another builder has in progress.
+DEFAULT_BUILD_TIMEOUT = 30 * 60
+
+
+def image_label(stack_script_id, series):
+    return "%s-%s-%s" % (IMAGE_PREFIX, stack_script_id, series)
+
+
+def image_owner(env_name):
+    """Description prefix marking the images an environment built.
+    """
+    return "juju env %s:" % env_name
+
+
+class GoldenImage(object):
+
+    def __init__(self, provider, stack_script_id, series="trusty",
+                 packages=DEFAULT_PACKAGES, env_name=None,
+                 build_timeout=DEFAULT_BUILD_TIMEOUT, sleep=time.sleep,
+                 clock=time.time):
+        self.provider = provider
+        self.client = provider.client
+        self.stack_script_id = stack_script_id
+        self.series = series
+        self.packages = packages
+        self.label = image_label(stack_script_id, series)
+        self.owner = image_owner(env_name or provider.env_name or 'juju')
+        self.build_timeout = build_timeout
+        self.sleep = sleep
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._image_id = None
+
+    def find(self):
+        """Return the available image for the current key, if any.
+
+        An image with the key that's still being built, eg. by another
+        process, is waited on rather than built again.
+        """
+        deadline = None
+        for interval in Backoff(5, 1.5, 60):
+            images = [i for i in self.client.get_images()
+                      if i.label == self.label and i.status != 'deleted']
+            for image in images:
+                if image.status == 'available':
+                    return image
+            if not images:
+                return None
+            if deadline is None:
+                log.info("Waiting for image %s being built...", self.label)
+                deadline = self.clock() + self.build_timeout
+            elif self.clock() >= deadline:
+                raise TimeoutError(
+                    "Image %s still %s after %ds" % (
+                        self.label, images[0].status, self.build_timeout))
+            self.sleep(interval)
+
+    def invalidate(self):
+        """Delete images this environment built for a different
+        stackscript or series.
+        """
+        for image in self.client.get_images():
+            if image.label == self.label:
+                continue
+            if not (image.description or '').startswith(self.owner):
+                continue
+            log.info("Deleting stale image %s", image.label)
+            self.client.delete_image(image)
+
+    def get_image_id(self, datacenter_id, plan_id):
+        """Return the image id to provision from, building it once if
+        needed. Concurrent launches share a single build.
+        """
+        with self._lock:
+            if self._image_id is None:
+                image = self.find()
+                if image is None:
+                    self.invalidate()
+                    self._image_id = self.build(datacenter_id, plan_id)
+                else:
+                    self._image_id = image.imageid
+            return self._image_id
+
+    def build(self, datacenter_id, plan_id):
+        log.info("Building image %s (eta 10m)...", self.label)
+        instance = self.provider.launch_instance(dict(
+            datacenter_id=datacenter_id, plan_id=plan_id,
+            domain_postfix=None), claim=False, from_image=False)
+        try:
+            # The steps share one ssh connection to the build host.
+            host = instance.ip_addresses[0]
+            masters = ControlMasters()
+            try:
+                masters.open(host)
+                ssh.update_instance(host, options=masters.options)
+                ssh.install_packages(
+                    host, self.packages, options=masters.options)
+                # Machines launched from the image mustn't share host keys.
+                ssh.reset_host_keys(host, options=masters.options)
+            finally:
+                masters.close()
+
+            shutdown = self.client.linode_shutdown(instance)
+            self.provider.wait_on(instance, [shutdown['JobID']], 'shutdown')
+
+            disks = [d for d in self.client.get_linode_disks(instance)
+                     if d.type != 'swap']
+            if not disks:
+                raise ProviderError(
+                    "No root disk found on %s to imagize" % instance.label)
+            result = self.client.linode_disk_imagize(
+                disks[0], self.label,
+                "%s stackscript %s series %s" % (
+                    self.owner, self.stack_script_id, self.series))
+            self.provider.wait_on(instance, [result['JobID']], 'imagize')
+        finally:
+            self.provider.terminate_instance(instance.linodeid)
+        log.info("Image %s built", self.label)
+        return result['ImageID']
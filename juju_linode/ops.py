@@ -4,7 +4,8 @@ import time
 import uuid
 
 
-from juju_linode.exceptions import TimeoutError, ProviderAPIError
+from juju_linode.engine import Return
+from juju_linode.exceptions import TimeoutError
 from juju_linode import ssh, constraints
 
 
@@ -23,6 +24,12 @@ class MachineOp(object):
     def run(self):
         raise NotImplementedError()
 
+    def run_async(self, loop):
+        """Coroutine for the engine, by default run on a worker thread.
+        """
+        result = yield loop.call(self.run)
+        raise Return(result)
+
 
 class MachineAdd(MachineOp):
 
@@ -30,20 +37,50 @@ class MachineAdd(MachineOp):
         instance = self.provider.launch_instance(self.params)
         return instance
 
+    def run_async(self, loop):
+        instance = yield loop.spawn(
+            self.provider.launch_instance_async(loop, self.params))
+        raise Return(instance)
+
 class MachineRegister(MachineAdd):
 
     def run(self):
         instance = super(MachineRegister, self).run()
         try:
-            machine_id = self.env.add_machine(
-                "ssh:ubuntu@%s" % instance.remote_access_name)
+            machine_id = self.env.register_machine(
+                instance.remote_access_name)
         except:
             self.provider.terminate_instance(instance.linodeid)
             raise
         return instance, machine_id
 
+    def run_async(self, loop):
+        instance = yield loop.spawn(
+            super(MachineRegister, self).run_async(loop))
+        try:
+            machine_id = yield loop.call(
+                self.env.register_machine, instance.remote_access_name)
+        except Exception, e:
+            yield loop.spawn(
+                self.provider.terminate_instance_async(loop, instance.linodeid))
+            raise e
+        raise Return((instance, machine_id))
+
+
+class PoolFill(MachineOp):
+
+    def run(self):
+        return self.provider.pool.fill(
+            self.params['datacenter_id'], self.params['plan_id'])
+
 
 class MachineDestroy(MachineOp):
+    """Destroys params' instance, or else looks up its instance_id.
+    """
+
+    @property
+    def instance(self):
+        return self.params.get('instance') or self.params['instance_id']
 
     def run(self):
         if not self.options.get('iaas_only'):
@@ -51,16 +88,16 @@ class MachineDestroy(MachineOp):
         if self.options.get('env_only'):
             return
         log.debug("Destroying instance %s", self.params['instance_id'])
-        while True:
-            try:
-                self.provider.terminate_instance(self.params['instance_id'], self.params['domain_name'])
-                break
-            except ProviderAPIError, e:
-                # The vm has a pending event, sleep and try again.
-                if e.message['id'] == 'unprocessable_entity':
-                    log.debug(
-                        "Waiting for pending instance action to complete.")
-                    time.sleep(6)
-                    continue
-                raise
-            break
+        # Transient api failures are retried by the client's retry policy,
+        # pending jobs are waited on by terminate_instance.
+        self.provider.terminate_instance(self.instance, self.params['domain_name'])
+
+    def run_async(self, loop):
+        if not self.options.get('iaas_only'):
+            yield loop.call(
+                self.env.terminate_machines, [self.params['machine_id']])
+        if self.options.get('env_only'):
+            return
+        log.debug("Destroying instance %s", self.params['instance_id'])
+        yield loop.spawn(self.provider.terminate_instance_async(
+            loop, self.instance, self.params['domain_name']))
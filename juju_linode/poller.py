@@ -0,0 +1,135 @@
+"""
+Single background poller for the jobs of every in flight linode.
+
+Op runner threads register the linode (and job ids) they're waiting on
+and block on a future. Each tick fetches pending jobs for all registered
+linodes in one batched request, so api volume grows with ticks rather
+than ticks times machines.
+"""
+
+import logging
+import threading
+import time
+
+from juju_linode.exceptions import ProviderAPIError
+from juju_linode.retry import classify
+from juju_linode.runner import Future
+
+
+log = logging.getLogger("juju.linode")
+
+DEFAULT_INTERVAL = 2
+
+# Consecutive transient polling errors before a watch fails.
+DEFAULT_MAX_ERRORS = 5
+
+
+class Watch(Future):
+
+    def __init__(self, linode_id, job_ids=None):
+        super(Watch, self).__init__()
+        self.linode_id = linode_id
+        self.job_ids = job_ids and set(job_ids) or None
+        # Consecutive transient errors polling its linode.
+        self.errors = 0
+
+    def check(self, pending_jobs):
+        """Resolve the watch if none of its jobs are pending.
+        """
+        self.errors = 0
+        pending = [j.jobid for j in pending_jobs]
+        if self.job_ids is not None:
+            pending = self.job_ids.intersection(pending)
+        if not pending:
+            self.set_result(True)
+            return True
+        return False
+
+
+class JobPoller(object):
+    """Polls pending jobs for all watched linodes from a single thread.
+
+    The thread is started on demand and exits once nothing is watched.
+    Transient errors, for the whole tick or a single linode, are retried
+    on the next tick up to max_errors times in a row, anything else fails
+    the affected watches.
+    """
+
+    def __init__(self, client, interval=DEFAULT_INTERVAL, sleep=time.sleep,
+                 max_errors=DEFAULT_MAX_ERRORS):
+        self.client = client
+        self.interval = interval
+        self.sleep = sleep
+        self.max_errors = max_errors
+        self.ticks = 0
+        self._lock = threading.Lock()
+        self._watches = []
+        self._thread = None
+
+    def watch(self, linode_instance, job_ids=None):
+        watch = Watch(linode_instance.linodeid, job_ids)
+        with self._lock:
+            self._watches.append(watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run)
+                self._thread.daemon = True
+                self._thread.start()
+        return watch
+
+    def cancel(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+    def run(self):
+        while True:
+            with self._lock:
+                if not self._watches:
+                    self._thread = None
+                    return
+                watches = list(self._watches)
+            try:
+                self.tick(watches)
+            except Exception, e:
+                log.warning("Error polling linode jobs: %s", e)
+                self._remove(self.failed(watches, e))
+            self.sleep(self.interval)
+
+    def failed(self, watches, error):
+        """Count a polling error against watches, returns those it fails.
+        """
+        transient = classify(error) is not None
+        resolved = []
+        for w in watches:
+            w.errors += 1
+            if not transient or w.errors >= self.max_errors:
+                w.set_exception(error)
+                resolved.append(w)
+        return resolved
+
+    def _remove(self, resolved):
+        with self._lock:
+            for w in resolved:
+                if w in self._watches:
+                    self._watches.remove(w)
+
+    def tick(self, watches):
+        self.ticks += 1
+        linode_ids = sorted(set([w.linode_id for w in watches]))
+        results = self.client.request_batch(
+            [('linode.job.list', {'LinodeID': linode_id, 'pendingOnly': '1'})
+             for linode_id in linode_ids])
+
+        resolved = []
+        for linode_id, (data, errors) in zip(linode_ids, results):
+            linode_watches = [w for w in watches if w.linode_id == linode_id]
+            if errors:
+                resolved.extend(
+                    self.failed(linode_watches, ProviderAPIError(errors)))
+                continue
+            jobs = map(self.client.make_linode_job, data)
+            resolved.extend([w for w in linode_watches if w.check(jobs)])
+
+        self._remove(resolved)
+        log.debug("Polled jobs for %d linodes, %d ready",
+                  len(linode_ids), len(resolved))
@@ -0,0 +1,180 @@
+"""
+Warm pool of booted, stackscript installed linodes.
+
+Pooled linodes are kept in a display group per datacenter and plan, a
+launch claims one by moving it out of the group. Replacements are
+provisioned by the command that claimed, before it exits (see
+take_refills), so none is left half provisioned by the process exiting.
+
+Other processes (another juju-linode run against the same account) may
+claim from the same pool. Display groups can't be updated conditionally,
+so a claim first moves the linode to a group of its own and reads it back
+after a moment, whoever wrote last owns it and the others move on.
+"""
+
+import logging
+import random
+import threading
+import time
+import uuid
+
+
+
+log = logging.getLogger("juju.linode")
+
+POOL_PREFIX = "juju-pool"
+
+# linode.list status of a booted linode.
+RUNNING = 1
+
+CLAIM_PREFIX = "juju-claim"
+
+# Seconds to wait before reading back a claim, and at most between
+# attempts after losing one.
+CLAIM_SETTLE = 1.0
+CLAIM_BACKOFF = 2.0
+
+# Seconds a listing of the pool serves claims for.
+LISTING_TTL = 10
+
+
+def pool_group(datacenter_id, plan_id):
+    return "%s-%s-%s" % (POOL_PREFIX, datacenter_id, plan_id)
+
+
+def parse_pool_group(group):
+    """Return the datacenter and plan id of a pool display group.
+    """
+    if not group or not group.startswith(POOL_PREFIX + "-"):
+        return None
+    parts = group[len(POOL_PREFIX) + 1:].split("-")
+    if len(parts) != 2:
+        return None
+    return parts[0], parts[1]
+
+
+class WarmPool(object):
+
+    def __init__(self, provider, claimed_group="juju", sleep=time.sleep,
+                 clock=time.time):
+        self.provider = provider
+        self.client = provider.client
+        self.claimed_group = claimed_group
+        self.sleep = sleep
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Ids of linodes being claimed by this process.
+        self._claiming = set()
+        # (datacenter id, plan id) of claimed linodes not yet replaced.
+        self._refills = []
+        self._listing = None
+        self._listed = None
+        self._listing_lock = threading.Lock()
+
+    def members(self, datacenter_id=None, plan_id=None, instances=None):
+        """Pooled linodes, keyed by (datacenter id, plan id).
+        """
+        if instances is None:
+            instances = self.client.get_linode_instaces()
+        groups = {}
+        for i in instances:
+            key = parse_pool_group(i.lpm_displaygroup)
+            if key is None:
+                continue
+            if datacenter_id is not None and key != (
+                    str(datacenter_id), str(plan_id)):
+                continue
+            groups.setdefault(key, []).append(i)
+        return groups
+
+    def listing(self):
+        """The account's linodes, listed at most once per LISTING_TTL
+        however many claims are made. Claims check each linode again
+        before taking it, so a stale listing only risks a miss.
+        """
+        with self._listing_lock:
+            if (self._listing is None or
+                    self.clock() - self._listed >= LISTING_TTL):
+                self._listing = self.client.get_linode_instaces()
+                self._listed = self.clock()
+            return self._listing
+
+    def claim(self, datacenter_id, plan_id):
+        """Claim a running pooled linode, or None if the pool is empty.
+
+        The claim is recorded for take_refills.
+        """
+        members = self.members(
+            datacenter_id, plan_id, self.listing()).get(
+                (str(datacenter_id), str(plan_id)), [])
+        for instance in [i for i in members if i.status == RUNNING]:
+            with self._lock:
+                if instance.linodeid in self._claiming:
+                    continue
+                self._claiming.add(instance.linodeid)
+            try:
+                claimed = self._claim(instance)
+            finally:
+                with self._lock:
+                    self._claiming.discard(instance.linodeid)
+            if claimed:
+                break
+            self.sleep(random.uniform(0, CLAIM_BACKOFF))
+        else:
+            log.debug("Warm pool %s is empty",
+                      pool_group(datacenter_id, plan_id))
+            return None
+        log.info("Claimed pooled instance %s", instance.label)
+        with self._lock:
+            self._refills.append((datacenter_id, plan_id))
+        return instance
+
+    def _claim(self, instance):
+        """Move instance to the claimed group, False if it was taken.
+
+        Instances are updated with the group found, so a cached listing
+        doesn't offer them again.
+        """
+        group = instance.lpm_displaygroup
+        current = self.client.get_linode_instace(instance.linodeid)
+        if current is None or current.lpm_displaygroup != group:
+            log.debug("Pooled instance %s was already claimed", instance.label)
+            instance.lpm_displaygroup = current and current.lpm_displaygroup
+            return False
+        token = "%s-%s" % (CLAIM_PREFIX, uuid.uuid4().hex[:12])
+        self.client.update_linode(instance, LPM_DisplayGroup=token)
+        self.sleep(CLAIM_SETTLE)
+        current = self.client.get_linode_instace(instance.linodeid)
+        if current is None or current.lpm_displaygroup != token:
+            log.debug("Lost the claim on pooled instance %s", instance.label)
+            instance.lpm_displaygroup = current and current.lpm_displaygroup
+            return False
+        self.client.update_linode(
+            instance, LPM_DisplayGroup=self.claimed_group)
+        instance.lpm_displaygroup = self.claimed_group
+        return True
+
+    def take_refills(self):
+        """(datacenter id, plan id) per linode claimed since last called,
+        for the caller to fill the pool back up.
+        """
+        with self._lock:
+            refills, self._refills = self._refills, []
+        return refills
+
+    def fill(self, datacenter_id, plan_id):
+        """Provision one linode into the pool.
+        """
+        instance = self.provider.launch_instance(dict(
+            datacenter_id=datacenter_id, plan_id=plan_id,
+            domain_postfix=None), claim=False)
+        self.client.update_linode(
+            instance, LPM_DisplayGroup=pool_group(datacenter_id, plan_id))
+        log.info("Added instance %s to warm pool", instance.label)
+        return instance
+
+    def close(self):
+        refills = self.take_refills()
+        if refills:
+            log.warning("Warm pool is %d instances short, refill it with "
+                        "the pool command", len(refills))
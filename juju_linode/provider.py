@@ -1,19 +1,31 @@
 import logging
 import os
+import sys
 import time
 
-from juju_linode.exceptions import ConfigError, ProviderError
-from juju_linode.client import Client
+from juju_linode.exceptions import ConfigError
+from juju_linode.catalog import Catalog
+from juju_linode.client import Client, LinodeInstace
 from juju_linode.domain_manager import DomainManager
 from juju_linode.constraints import init
+from juju_linode import dns, engine, ssh
+from juju_linode.engine import AsyncClient, Return, Stages, ThreadLoop, WaitFor
+from juju_linode.exceptions import TimeoutError
+from juju_linode.transport import Transport
+from juju_linode.poller import JobPoller, DEFAULT_INTERVAL
+from juju_linode.retry import Retrier
+from juju_linode.pool import WarmPool
+from juju_linode.image import GoldenImage
+from juju_linode.waiter import JobWaiter, DEFAULT_TIMEOUT
 
 log = logging.getLogger("juju.linode")
 
 
 def factory(config):
     cfg = Linode.get_config(config)
-    ans = Linode(cfg)
-    init(ans.client)
+    ans = Linode(cfg, env_name=config.get_env_name())
+    catalog = Catalog.connect(ans.client, config.juju_home, cfg)
+    init(ans.client, data=catalog.load(refresh=config.refresh_catalog))
     return ans
 
 
@@ -21,20 +33,77 @@ def validate(config):
     Linode.get_config(config)
 
 
+class InstanceIndex(object):
+    """One listing of instances, by linode id and by address.
+    """
+
+    def __init__(self, instances):
+        self.instances = list(instances)
+        self.by_id = {}
+        self.by_address = {}
+        self.by_label = {}
+        for i in self.instances:
+            self.by_id[str(i.linodeid)] = i
+            self.by_label[i.label] = i
+            for address in i.ip_addresses:
+                self.by_address[address] = i
+
+    def find(self, linode_id=None, address=None):
+        """The instance with linode_id, else at address.
+
+        An address can also be a domain registered for the instance,
+        named after its label.
+        """
+        if linode_id is not None and str(linode_id) in self.by_id:
+            return self.by_id[str(linode_id)]
+        if not address:
+            return None
+        return self.by_address.get(address) or self.by_label.get(
+            address.split('.')[0])
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def __len__(self):
+        return len(self.instances)
+
+
 class Linode(object):
 
-    def __init__(self, config, client=None, domain_manager=None):
+    def __init__(self, config, client=None, domain_manager=None, env_name=None):
         self.config = config
+        self.env_name = env_name
+        # One pooled transport shared by every op runner thread.
+        self.transport = Transport.from_config(config)
         if client is None:
-            self.client = Client.connect(config)
+            # one retry budget for the linode and domain manager apis.
+            self.retrier = Retrier.from_config(config)
+            self.client = Client.connect(config, self.transport, self.retrier)
         else:
             self.client = client
+            self.retrier = client.retrier
 
         if domain_manager is None:
-            self.domain_manager =  DomainManager.connect(config)
+            self.domain_manager =  DomainManager.connect(
+                config, self.transport, self.retrier)
         else:
             self.domain_manager =  domain_manager
 
+        # Concurrent ops share a single job polling thread.
+        self.poller = JobPoller(
+            self.client,
+            float(config.get('linode-poll-interval', DEFAULT_INTERVAL)))
+        self.waiter = JobWaiter(self.client, poller=self.poller)
+
+        self.pool = WarmPool(self, claimed_group=env_name or 'juju')
+        self.use_pool = bool(config.get('warm-pool', False))
+
+        self.image = None
+        if config.get('linode-provisioning', 'stackscript') == 'image':
+            self.image = GoldenImage(
+                self, config['linode-stack-script-id'],
+                config.get('default-series', 'trusty'), env_name=env_name)
+
     @property
     def version(self):
         return self.client.version
@@ -51,101 +120,219 @@ class Linode(object):
         return provider_conf
 
     def get_instances(self):
-        return self.client.get_linode_instaces()
+        """Stream the account's instances, see Client.iter_linode_instaces.
+        """
+        return self.client.iter_linode_instaces()
 
     def get_instance(self, instance_id):
         return self.client.get_linode_instace(instance_id)
 
-    def launch_instance(self, params):
-
+    def get_instance_index(self):
+        """Index every instance, in one linode.list and linode.ip.list.
+        """
+        return InstanceIndex(self.get_instances())
+
+    def _instance(self, instance):
+        """Instances from a listing are used as is, ids are looked up.
+        """
+        if isinstance(instance, LinodeInstace):
+            return instance
+        return self.client.get_linode_instace(instance)
+
+    def close(self):
+        self.pool.close()
+        self.transport.close()
+
+    def launch_instance(self, params, claim=True, from_image=True):
+        loop = ThreadLoop()
+        return loop.run(self.launch_instance_async(
+            loop, params, claim, from_image))
+
+    def create_disks(self, instance, image_id=None):
+        # create linode disk and swap in a single round trip
+        with self.client.batch() as batch:
+            if image_id is not None:
+                disk = batch.linode_disk_createfromimage(instance, image_id, str(time.time()) )
+            else:
+                disk = batch.linode_disk_createfromstackscript(instance, self.config['linode-stack-script-id'], str(time.time()) )
+            swap = batch.create_linode_swap(instance)
+        return disk.result(), swap.result()
+
+    def create_config(self, instance, disk, swap):
+        disk_list = str(disk['DiskID']) + ',' + str(swap['DiskID'])
+        return self.client.create_linode_config(instance, str(time.time()), disk_list )
+
+    def delete_disks(self, instance):
+        """Delete all disks of the linode, returns the delete job ids.
+        """
+        with self.client.batch() as batch:
+            deletes = [batch.delete_linode_disk(disk) for disk in self.client.get_linode_disks(instance)]
+        return [d.result()['JobID'] for d in deletes]
+
+    def register_domain(self, instance, domain_postfix):
+        full_domain_name = instance.label+'.'+domain_postfix
+        self.domain_manager.create_subdomain(full_domain_name, instance.ip_addresses[0])
+        self.domain_manager.create_subdomain_alias(domain_postfix, full_domain_name, instance.label)
+        instance.remote_access_name = full_domain_name
+        return full_domain_name
+
+    def unregister_domain(self, instance, domain_postfix):
+        full_domain_name = instance.label+'.'+domain_postfix
+        self.domain_manager.destroy_subdomain(full_domain_name, instance.ip_addresses[0])
+        self.domain_manager.destroy_subdomain_alias(domain_postfix, full_domain_name, instance.label)
+
+    def terminate_instance(self, instance, domain_name=None):
+        """Destroy an instance, given as a LinodeInstace or linode id.
+        """
+        loop = ThreadLoop()
+        return loop.run(self.terminate_instance_async(
+            loop, instance, domain_name))
+
+    def wait_on(self, linode_instance, job_ids=None, phase=None):
+        """Wait for job_ids, or all pending jobs, on the linode to finish.
+        """
+        return self.waiter.wait(linode_instance, job_ids, phase)
+
+    # Launch and terminate steps are coroutines, see engine.py, run on the
+    # engine's loop by the coroutine engine and on a ThreadLoop by the
+    # blocking methods above. Waits yield to the loop instead of sleeping.
+
+    def launch_instance_async(self, loop, params, claim=True, from_image=True):
+        client = AsyncClient(self.client, loop)
         domain_postfix = params['domain_postfix']
         instance_params = {'datacenter_id': params['datacenter_id'], 'plan_id': params['plan_id']}
-
-        # create linode Instance
-        instance = self.client.create_linode_instace(**instance_params)
-
+        stages = Stages(loop.clock)
+
+        instance = None
+        if claim and self.use_pool:
+            start = loop.clock()
+            instance = yield loop.call(self.pool.claim, **instance_params)
+            stages.done('claim', start)
+
+        claimed = instance is not None
+        image_id = None
+        if not claimed:
+            # build the golden image, if needed, before paying for a linode
+            if from_image and self.image is not None:
+                start = loop.clock()
+                image_id = yield loop.call(self.image.get_image_id, **instance_params)
+                stages.done('image', start)
+            start = loop.clock()
+            instance = yield client.create_linode_instace(**instance_params)
+            stages.done('create', start)
+
+        registration = resolution = None
         try:
-
             # assign a domain to machine if there is domain_postfix in constraints
             if domain_postfix is not None:
-                full_domain_name = instance.label+'.'+domain_postfix
-                self.domain_manager.create_subdomain(full_domain_name, instance.ip_addresses[0])
-                self.domain_manager.create_subdomain_alias(domain_postfix, full_domain_name, instance.label)
-                instance.remote_access_name = full_domain_name
-                time.sleep(60) # wait for subdomain to register on DNS servers
-
-
-            try:
-                # create linode disk
-                disk = self.client.linode_disk_createfromstackscript(instance, self.config['linode-stack-script-id'], str(time.time()) )
-
-                # create swap
-                swap = self.client.create_linode_swap(instance)
-
-                #create linode config
-                disk_list = str(disk['DiskID']) + ',' + str(swap['DiskID'])
-                self.client.create_linode_config(instance, str(time.time()), disk_list )
-
-                # wait for all jobs before boot the linode instance
-                self.wait_on(instance)
-
-                # booting linode instance
-                self.client.linode_boot(instance)
-
-                # waiting for boot instance
-                self.wait_on(instance)
-
-                # wait for ssh service to start
-                time.sleep(10)
-
-            except:
-                if domain_postfix is not None:
-                    full_domain_name = instance.label+'.'+domain_postfix
-                    self.domain_manager.destroy_subdomain(full_domain_name, instance.ip_addresses[0])
-                    self.domain_manager.destroy_subdomain_alias(domain_postfix, full_domain_name, instance.label)
-                raise
-
-        except:
+                registration = loop.spawn(self._register_domain_async(loop, instance, domain_postfix, stages))
+                resolution = loop.spawn(self._resolve_domain_async(loop, instance, registration, stages))
+
+            if not claimed:
+                yield loop.spawn(self._provision_async(loop, instance, stages, image_id))
+
+            if resolution is not None:
+                yield resolution
+        except Exception:
+            exc_info = sys.exc_info()
+            if registration is not None:
+                # let the registration settle before cleaning up after it
+                try:
+                    yield registration
+                    registered = True
+                except Exception:
+                    registered = False
+                # don't keep polling dns for a linode being terminated
+                loop.cancel(resolution)
+                if registered:
+                    yield loop.call(self.unregister_domain, instance, domain_postfix)
+            stages.log("Instance %s" % instance.label)
             log.debug("Error occurred, terminating instance")
-            self.terminate_instance(instance.linodeid)
-            raise
-
-        return instance
-
-    def terminate_instance(self, instance_id, domain_name=None):
-        instance = self.client.get_linode_instace(instance_id)
+            yield loop.spawn(self.terminate_instance_async(loop, instance.linodeid))
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        stages.log("Instance %s" % instance.label)
+        raise Return(instance)
+
+    def _provision_async(self, loop, instance, stages, image_id=None):
+        """Disks, config and boot of a created linode, till ssh is up.
+
+        With an image_id the root disk is created from that image rather
+        than by the stackscript.
+        """
+        client = AsyncClient(self.client, loop)
+        start = loop.clock()
+        disk, swap = yield loop.call(self.create_disks, instance, image_id)
+        stages.done('disks', start)
+
+        # the config only needs the disk ids, not the finished disks
+        start = loop.clock()
+        config = loop.call(self.create_config, instance, disk, swap)
+        config.add_done_callback(lambda f: stages.done('config', start))
+        yield loop.spawn(self.wait_on_async(loop, instance, [disk['JobID'], swap['JobID']], 'provision'))
+        stages.done('wait-disks', start)
+        yield config
+
+        start = loop.clock()
+        boot = yield client.linode_boot(instance)
+        yield loop.spawn(self.wait_on_async(loop, instance, [boot['JobID']], 'boot'))
+        stages.done('boot', start)
+
+        start = loop.clock()
+        yield loop.spawn(engine.wait_for_ssh_async(
+            loop, instance.ip_addresses[0],
+            timeout=int(self.config.get('ssh-wait-timeout', ssh.DEFAULT_TIMEOUT))))
+        stages.done('ssh', start)
+
+    def _register_domain_async(self, loop, instance, domain_postfix, stages):
+        start = loop.clock()
+        full_domain_name = yield loop.call(self.register_domain, instance, domain_postfix)
+        stages.done('dns', start)
+        raise Return(full_domain_name)
+
+    def _resolve_domain_async(self, loop, instance, registration, stages):
+        full_domain_name = yield registration
+        start = loop.clock()
+        yield loop.spawn(engine.wait_for_record_async(
+            loop, full_domain_name, instance.ip_addresses[0],
+            int(self.config.get('dns-wait-timeout', dns.DEFAULT_TIMEOUT))))
+        stages.done('resolve-dns', start)
+        raise Return(full_domain_name)
+
+    def terminate_instance_async(self, loop, instance, domain_name=None):
+        client = AsyncClient(self.client, loop)
+        instance = yield loop.call(self._instance, instance)
 
         # shutting down instance
-        self.client.linode_shutdown(instance)
-        self.wait_on(instance)
+        shutdown = yield client.linode_shutdown(instance)
+        yield loop.spawn(self.wait_on_async(loop, instance, [shutdown['JobID']], 'shutdown'))
 
         # deleting linode disks
-        [self.client.delete_linode_disk(disk) for disk in self.client.get_linode_disks(instance)]
-        self.wait_on(instance)
+        job_ids = yield loop.call(self.delete_disks, instance)
+        yield loop.spawn(self.wait_on_async(loop, instance, job_ids, 'teardown'))
 
-        self.client.destroy_linode_instace(instance)
+        yield client.destroy_linode_instace(instance)
 
         # delete instance's domain it it has one
         if domain_name:
-            self.domain_manager.destroy_subdomain_alias(domain_name.replace(instance.label+".",""), domain_name, instance.label)
-            self.domain_manager.destroy_subdomain(domain_name, instance.ip_addresses[0])
-
-    def wait_on(self, linode_instance):
-        instance_pending_jobs = self.client.get_linode_pending_jobs(linode_instance)
-        print('Jobs in Q: ' + str(len(instance_pending_jobs) ) )
-        loop_count = 0
-        while len(instance_pending_jobs) > 0:
-            time.sleep(10)  # Takes on average 1m for a linode instance.
-            instance_pending_jobs = self.client.get_linode_pending_jobs(linode_instance)
-            print('Jobs in Q: ' + str(len(instance_pending_jobs) ) )
-            if len(instance_pending_jobs) == 0:
-                log.debug("Instance %s ready", linode_instance.label)
-                return
-            else:
-                log.debug("Waiting on instance %s", linode_instance.label)
-            if loop_count > 60:
-                # After 10m for instance, just bail as provider error.
-                raise ProviderError(
-                    "Failed to get running instance %s jobs: %s" % (
-                        linode_instance.label, str(instance_pending_jobs) ))
-            loop_count += 1
+            yield loop.call(self.domain_manager.destroy_subdomain_alias, domain_name.replace(instance.label+".",""), domain_name, instance.label)
+            yield loop.call(self.domain_manager.destroy_subdomain, domain_name, instance.ip_addresses[0])
+
+    def wait_on_async(self, loop, linode_instance, job_ids=None, phase=None):
+        timeout = self.waiter.timeouts.get(phase, DEFAULT_TIMEOUT)
+        start = loop.clock()
+        watch = self.poller.watch(linode_instance, job_ids)
+        try:
+            yield WaitFor(watch, timeout)
+        except TimeoutError:
+            self.poller.cancel(watch)
+            raise TimeoutError(
+                "Timed out waiting on instance %s %s jobs" % (
+                    linode_instance.label, phase or ''))
+        if job_ids:
+            yield loop.call(self.waiter.check_jobs, linode_instance, job_ids)
+        elapsed = loop.clock() - start
+        self.waiter.timings.append((linode_instance.label, phase, elapsed))
+        log.debug("Instance %s %s ready after %.1fs",
+                  linode_instance.label, phase or 'jobs', elapsed)
+        raise Return(elapsed)
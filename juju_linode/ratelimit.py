@@ -0,0 +1,156 @@
+"""
+Client side rate limiting of linode api calls.
+
+Every op runner thread shares one limiter, reads (``*.list`` and
+``avail.*``) and mutating actions draw from separate token buckets, so a
+burst of list calls can't starve provisioning or the reverse. When the
+api still reports a rate limit, both buckets pause with exponential
+backoff until a call succeeds again.
+"""
+
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+
+log = logging.getLogger("juju.linode")
+
+# ERRORCODE of an api response rejected for exceeding the rate limit.
+RATE_LIMITED = 14
+
+# Sustained calls per second, and the burst allowed above it.
+DEFAULT_READ_RATE = 8.0
+DEFAULT_WRITE_RATE = 2.0
+DEFAULT_BURST = 10
+
+
+def is_read(api_action):
+    """Whether api_action only reads, see also retry.is_idempotent.
+    """
+    return api_action.endswith('.list') or api_action.startswith('avail.')
+
+
+def is_rate_limited(errors):
+    return any([e.get('ERRORCODE') == RATE_LIMITED for e in errors or ()])
+
+
+class TokenBucket(object):
+    """Thread safe token bucket refilled at rate tokens per second.
+    """
+
+    def __init__(self, rate, burst, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.updated = clock()
+        # No tokens are handed out before this time.
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token, returning the seconds to wait before using it.
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = 0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(
+                self.paused_until, self.clock() + seconds)
+            self.tokens = min(self.tokens, 0)
+
+
+class RateLimiter(object):
+    """Rate and concurrency limits for the calls of a client.
+
+    max_in_flight bounds concurrent requests regardless of their rate,
+    retries is the number of times a rate limited call is resent.
+    """
+
+    def __init__(self, read_rate=DEFAULT_READ_RATE,
+                 write_rate=DEFAULT_WRITE_RATE, burst=DEFAULT_BURST,
+                 max_in_flight=None, retries=5, backoff=1.0,
+                 max_backoff=30.0, clock=time.time, sleep=time.sleep):
+        self.reads = TokenBucket(read_rate, burst, clock, sleep)
+        self.writes = TokenBucket(write_rate, burst, clock, sleep)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.throttled_count = 0
+        self.waited = 0.0
+        self._slots = max_in_flight and threading.BoundedSemaphore(
+            max_in_flight)
+        self._lock = threading.Lock()
+        self._consecutive = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            read_rate=float(config.get(
+                'linode-read-rate', DEFAULT_READ_RATE)),
+            write_rate=float(config.get(
+                'linode-write-rate', DEFAULT_WRITE_RATE)),
+            burst=int(config.get('linode-rate-burst', DEFAULT_BURST)),
+            max_in_flight=config.get('linode-max-in-flight') and int(
+                config['linode-max-in-flight']))
+
+    def bucket(self, api_actions):
+        """Batches of only reads use the read budget.
+        """
+        if all([is_read(a) for a in api_actions]):
+            return self.reads
+        return self.writes
+
+    @contextmanager
+    def slot(self, api_actions):
+        """Wait for a token and an in flight slot for a request.
+        """
+        waited = self.bucket(api_actions).acquire()
+        if waited:
+            with self._lock:
+                self.waited += waited
+        if self._slots:
+            self._slots.acquire()
+        try:
+            yield
+        finally:
+            if self._slots:
+                self._slots.release()
+
+    def throttled(self):
+        """The api rate limited a call, pause every caller.
+        """
+        with self._lock:
+            self._consecutive += 1
+            self.throttled_count += 1
+            delay = min(self.backoff * 2 ** (self._consecutive - 1),
+                        self.max_backoff)
+        log.warning("Linode api rate limit hit, pausing %.1fs", delay)
+        self.reads.pause(delay)
+        self.writes.pause(delay)
+        return delay
+
+    def succeeded(self):
+        with self._lock:
+            self._consecutive = 0
+
+    def summary(self):
+        return "rate limited:%d throttle wait:%.1fs" % (
+            self.throttled_count, self.waited)
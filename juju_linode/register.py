@@ -0,0 +1,142 @@
+"""
+Registration of provisioned instances as juju manual machines.
+
+juju add-machine ssh:user@host opens several ssh sessions to the host,
+on top of our own checks. A ControlMaster socket is kept per host, the
+first connection authenticates and everything after it (our ssh
+helpers, and juju's ssh through a wrapper put first on its PATH) is
+multiplexed over it.
+
+Registrations are also capped separately from the linode side
+concurrency, each one is a round of work for the state server.
+"""
+
+import logging
+import os
+import pipes
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from juju_linode import ssh
+
+
+log = logging.getLogger("juju.linode")
+
+DEFAULT_MAX_REGISTRATIONS = 4
+
+# Seconds an idle master connection is kept open.
+DEFAULT_CONTROL_PERSIST = 120
+
+
+class ControlMasters(object):
+    """Ssh master connections per user and host.
+    """
+
+    def __init__(self, persist=DEFAULT_CONTROL_PERSIST, root=None):
+        # Unix socket paths are short, keep the directory near the root.
+        self.root = root or tempfile.mkdtemp(prefix="jl-ssh-")
+        self.control_path = os.path.join(self.root, "%r@%h:%p")
+        self.options = [
+            "-o", "ControlMaster=auto",
+            "-o", "ControlPath=%s" % self.control_path,
+            "-o", "ControlPersist=%d" % persist]
+        self.hosts = set()
+        self._lock = threading.Lock()
+        # Held while a master to (user, host) is being opened.
+        self._opening = {}
+        self._bin = None
+
+    def open(self, host, user="root"):
+        """Start the master connection to host, if not already.
+
+        Returns False if the host couldn't be reached, callers then
+        just get a connection of their own.
+        """
+        with self._lock:
+            opening = self._opening.setdefault(
+                (user, host), threading.Lock())
+        with opening:
+            if (user, host) in self.hosts:
+                return True
+            try:
+                ssh.check_ssh(host, user, options=self.options)
+            except subprocess.CalledProcessError, e:
+                log.warning("Couldn't open ssh master to %s@%s: %s",
+                            user, host, e.output)
+                return False
+            with self._lock:
+                self.hosts.add((user, host))
+            return True
+
+    def wrapper_dir(self):
+        """Directory with an ssh that multiplexes over the masters.
+        """
+        with self._lock:
+            if self._bin is None:
+                bin_dir = os.path.join(self.root, "bin")
+                os.mkdir(bin_dir)
+                path = os.path.join(bin_dir, "ssh")
+                with open(path, 'w') as fh:
+                    fh.write("#!/bin/sh\nexec %s \"$@\"\n" % " ".join(
+                        [pipes.quote(a) for a in
+                         [ssh.SSH_CMD[0]] + self.options]))
+                os.chmod(path, 0755)
+                self._bin = bin_dir
+            return self._bin
+
+    def environ(self, env=None):
+        """Process environment for commands that run ssh, eg. juju.
+        """
+        env = dict(env is None and os.environ or env)
+        env['PATH'] = os.pathsep.join(
+            [self.wrapper_dir(), env.get('PATH', os.defpath)])
+        return env
+
+    def close(self):
+        with self._lock:
+            hosts, self.hosts = self.hosts, set()
+        for user, host in hosts:
+            cmd = [ssh.SSH_CMD[0], "-o", "ControlPath=%s" % self.control_path,
+                   "-O", "exit", "%s@%s" % (user, host)]
+            try:
+                subprocess.check_output(cmd, stderr=subprocess.STDOUT)
+            except subprocess.CalledProcessError, e:
+                log.debug("Closing ssh master to %s@%s: %s",
+                          user, host, e.output)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class Registrar(object):
+    """Adds instances to the environment with juju add-machine ssh:.
+    """
+
+    def __init__(self, env, masters=None,
+                 max_concurrent=DEFAULT_MAX_REGISTRATIONS):
+        self.env = env
+        self.masters = masters or ControlMasters()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    @classmethod
+    def from_config(cls, env, config):
+        return cls(
+            env,
+            ControlMasters(int(config.get(
+                'ssh-control-persist', DEFAULT_CONTROL_PERSIST))),
+            int(config.get(
+                'juju-max-registrations', DEFAULT_MAX_REGISTRATIONS)))
+
+    def register(self, host, user="ubuntu"):
+        """Add host as a machine of the environment.
+        """
+        environ = None
+        if self.masters.open(host, user):
+            environ = self.masters.environ()
+        with self._slots:
+            log.debug("Registering %s@%s", user, host)
+            return self.env.add_machine(
+                "ssh:%s@%s" % (user, host), env=environ)
+
+    def close(self):
+        self.masters.close()
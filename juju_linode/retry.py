@@ -0,0 +1,230 @@
+"""
+Retry policies for transient api failures.
+
+Failures are classified by whether the call may have been applied:
+
+- rejected: the api refused the call (rate limited, overloaded,
+  connection refused, timed out or not resolved), any action can be
+  resent.
+- ambiguous: the call may have been applied (read timeout, connection
+  dropped, garbled response), only idempotent actions are resent.
+
+Everything else fails immediately. Reads get more attempts than writes,
+see POLICIES. The linode and domain manager clients share one Retrier,
+so their retries draw from one budget and an api outage doesn't
+multiply the load on it.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+from juju_linode.exceptions import (
+    AmbiguousAPIError, ProviderAPIError, TransientAPIError)
+from juju_linode.ratelimit import is_read
+
+
+log = logging.getLogger("juju.linode")
+
+REJECTED = 'rejected'
+AMBIGUOUS = 'ambiguous'
+
+# Linode ERRORCODEs of calls refused before being applied: rate limit
+# exceeded, once the client's rate limiter has given up resending.
+REJECTED_CODES = frozenset([14])
+
+# Batch approaching timeout, some of its actions may have been applied.
+AMBIGUOUS_CODES = frozenset([12])
+
+# Mutating actions that are safe to repeat.
+IDEMPOTENT_ACTIONS = frozenset([
+    'linode.boot', 'linode.shutdown', 'linode.reboot', 'linode.update'])
+
+
+def error_codes(e):
+    """ERRORCODEs of a ProviderAPIError raised for an ERRORARRAY.
+    """
+    if not isinstance(e.message, list):
+        return set()
+    return set([err.get('ERRORCODE') for err in e.message
+                if isinstance(err, dict)])
+
+
+def classify(e):
+    if isinstance(e, TransientAPIError):
+        return REJECTED
+    if isinstance(e, AmbiguousAPIError):
+        return AMBIGUOUS
+    if isinstance(e, ProviderAPIError):
+        codes = error_codes(e)
+        if codes and codes <= REJECTED_CODES:
+            return REJECTED
+        if codes & AMBIGUOUS_CODES:
+            return AMBIGUOUS
+        return None
+    if isinstance(e, requests.ConnectTimeout) or never_connected(e):
+        return REJECTED
+    if isinstance(e, requests.RequestException):
+        return AMBIGUOUS
+    return None
+
+
+def never_connected(e):
+    """Whether e is a connection refused or a name resolution failure,
+    before any of the request was sent.
+    """
+    if not isinstance(e, requests.ConnectionError) or not e.args:
+        return False
+    return isinstance(getattr(e.args[0], 'reason', None), NewConnectionError)
+
+
+def is_idempotent(action):
+    return is_read(action) or action in IDEMPOTENT_ACTIONS
+
+
+class RetryPolicy(object):
+    """Jittered exponential backoff for up to attempts tries.
+
+    Each delay is drawn from [delay * (1 - jitter), delay], so callers
+    failing together don't retry in lockstep.
+    """
+
+    def __init__(self, attempts=4, initial=0.5, factor=2.0, maximum=20.0,
+                 jitter=0.5):
+        self.attempts = attempts
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+
+    def delay(self, retry, rand=random.random):
+        delay = min(self.initial * self.factor ** retry, self.maximum)
+        return delay * (1 - self.jitter * rand())
+
+
+# Default attempts for reads, cheap and always safe to repeat, and for
+# writes. Actions listed in POLICIES override these.
+READ_ATTEMPTS = 8
+DEFAULT_ATTEMPTS = 4
+
+# linode.create bills a linode, so is resent at most once.
+POLICIES = {
+    'linode.create': RetryPolicy(attempts=2)}
+
+
+class RetryBudget(object):
+    """Allow retries up to ratio of the calls made, plus a minimum.
+    """
+
+    def __init__(self, ratio=0.2, minimum=10):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.calls = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.calls += 1
+
+    def withdraw(self):
+        with self._lock:
+            if self.retries >= self.minimum + self.calls * self.ratio:
+                return False
+            self.retries += 1
+            return True
+
+
+class RetryStats(object):
+    """Retry counters keyed by action.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.actions = {}
+
+    def record(self, action, outcome):
+        with self._lock:
+            counts = self.actions.setdefault(action, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            items = sorted(self.actions.items())
+        return ["%-36s %s" % (action, " ".join([
+            "%s:%d" % c for c in sorted(counts.items())]))
+            for action, counts in items]
+
+
+class Retrier(object):
+    """Run api calls under per action retry policies.
+
+    policies maps action names to a RetryPolicy, other reads use reads
+    and other writes default.
+    """
+
+    def __init__(self, policies=None, default=None, reads=None, budget=None,
+                 sleep=time.sleep, rand=random.random):
+        self.policies = POLICIES if policies is None else policies
+        self.default = default or RetryPolicy(DEFAULT_ATTEMPTS)
+        self.reads = reads or self.default
+        self.budget = budget or RetryBudget()
+        self.stats = RetryStats()
+        self.sleep = sleep
+        self.rand = rand
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            default=RetryPolicy(attempts=int(config.get(
+                'linode-retry-attempts', DEFAULT_ATTEMPTS))),
+            reads=RetryPolicy(attempts=int(config.get(
+                'linode-retry-read-attempts', READ_ATTEMPTS))),
+            budget=RetryBudget(
+                ratio=float(config.get('linode-retry-budget', 0.2))))
+
+    def policy(self, action):
+        if action in self.policies:
+            return self.policies[action]
+        if is_read(action):
+            return self.reads
+        return self.default
+
+    def retryable(self, action, e):
+        kind = classify(e)
+        if kind == REJECTED:
+            return True
+        return kind == AMBIGUOUS and is_idempotent(action)
+
+    def call(self, actions, func, *args, **kw):
+        """Call func, retrying failures retryable for all of actions.
+        """
+        label = len(actions) == 1 and actions[0] or 'batch(%s)' % actions[0]
+        policy = self.policy(label)
+        self.budget.deposit()
+        retry = 0
+        while True:
+            try:
+                result = func(*args, **kw)
+            except Exception, e:
+                if not all([self.retryable(a, e) for a in actions]):
+                    raise
+                if retry + 1 >= policy.attempts:
+                    self.stats.record(label, 'exhausted')
+                    raise
+                if not self.budget.withdraw():
+                    self.stats.record(label, 'over-budget')
+                    raise
+                delay = policy.delay(retry, self.rand)
+                log.debug("Retrying %s in %.1fs after: %s", label, delay, e)
+                self.stats.record(label, 'retries')
+                self.sleep(delay)
+                retry += 1
+                continue
+            if retry:
+                self.stats.record(label, 'recovered')
+            return result
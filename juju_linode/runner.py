@@ -2,79 +2,272 @@
 Thread based concurrency around bulk ops. do api is sync
 """
 
+from contextlib import contextmanager
 import logging
 from Queue import Queue, Empty
 import threading
 
+from juju_linode.exceptions import CancelledError, TimeoutError
+
 
 log = logging.getLogger("juju.linode")
 
 
+class Future(object):
+    """Result of work completed on another thread.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._exception = None
+        self._running = False
+        self._cancelled = False
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """Cancel the work if it hasn't started, returns True if cancelled.
+        """
+        with self._lock:
+            if self._running or self._done.is_set():
+                return False
+            self._cancelled = True
+        self.set_exception(CancelledError("Cancelled"))
+        return True
+
+    def set_running_or_notify_cancel(self):
+        """Mark the work as started, returns False if it was cancelled.
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._running = True
+            return True
+
+    def add_done_callback(self, callback):
+        """Call callback with the future once it completes.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _complete(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._complete()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._complete()
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Timed out waiting for result")
+        return self._exception
+
+    def result(self, timeout=None):
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+
+def spawn(func, *args, **kw):
+    """Run func on a background thread, returning a Future for its result.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func(*args, **kw))
+        except Exception, e:
+            future.set_exception(e)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+class OpFuture(Future):
+    """Future for the result of a queued op.
+    """
+
+    def __init__(self, op):
+        super(OpFuture, self).__init__()
+        self.op = op
+
+
 class Runner(object):
+    """Run ops on a pool of worker threads.
 
-    def __init__(self, default_num_runner):
+    queue_op returns a future per op. Results can be consumed in
+    completion order (as_completed, iter_results) or in queue order
+    (iter_ordered). With fail_fast set, queued ops that haven't started
+    are cancelled once that many ops have failed.
+
+    Workers started with start() are long lived and pick up ops queued
+    at any time until stop(), else iteration starts and stops a pool
+    sized for the queued ops.
+    """
+
+    def __init__(self, default_num_runner=10, fail_fast=None):
         self.default_num_runner = default_num_runner
+        self.fail_fast = fail_fast
         self.jobs = Queue()
-        self.results = Queue()
-        self.job_count = 0
+        self.futures = []
+        # Futures of ops not yet completed, for cancellation.
+        self.queued = set()
+        self.failures = 0
         self.runners = []
         self.started = False
+        self._lock = threading.Lock()
+
+    @property
+    def job_count(self):
+        return len(self.futures)
 
     def queue_op(self, op):
-        self.jobs.put(op)
-        self.job_count += 1
+        future = OpFuture(op)
+        future.add_done_callback(self._op_done)
+        with self._lock:
+            self.queued.add(future)
+        self.futures.append(future)
+        self.jobs.put(future)
+        return future
 
-    def iter_results(self):
-        auto = not self.started
+    def _op_done(self, future):
+        with self._lock:
+            self.queued.discard(future)
+        if future.cancelled() or future.exception() is None:
+            return
+        with self._lock:
+            self.failures += 1
+            cancel = (self.fail_fast is not None and
+                      self.failures >= self.fail_fast)
+        if cancel:
+            self.cancel()
 
-        if auto:
-            self.start(min(self.default_num_runner, self.job_count))
+    def cancel(self):
+        """Cancel queued ops that haven't started, returns their count.
+        """
+        with self._lock:
+            queued = list(self.queued)
+        cancelled = len([f for f in queued if f.cancel()])
+        if cancelled:
+            log.warning("Cancelled %d queued ops", cancelled)
+        return cancelled
 
-        for i in range(self.job_count):
-            self.job_count -= 1
-            result = self.gather_result()
-            if isinstance(result, Exception):
-                continue
-            yield result
+    def _take(self):
+        futures, self.futures = self.futures, []
+        return futures
 
+    @contextmanager
+    def _workers(self, futures):
+        auto = not self.started
         if auto:
-            self.stop()
+            self.start(min(self.default_num_runner, len(futures)))
+        try:
+            yield
+        finally:
+            if auto:
+                for f in futures:
+                    f.cancel()
+                self.stop()
+
+    def as_completed(self, futures=None, timeout=None):
+        """Yield futures as they complete, by default those of all the
+        ops queued since the last iteration.
+        """
+        if futures is None:
+            futures = self._take()
+        completed = Queue()
+        for f in futures:
+            f.add_done_callback(completed.put)
+        with self._workers(futures):
+            for i in range(len(futures)):
+                try:
+                    yield completed.get(timeout=timeout)
+                except Empty:
+                    raise TimeoutError("Timed out waiting for ops")
+
+    def iter_ordered(self):
+        """Yield results in the order ops were queued.
 
-    def gather_result(self):
-        return self.results.get()
+        The first failure cancels the remaining ops and is raised.
+        """
+        futures = self._take()
+        with self._workers(futures):
+            for f in futures:
+                if f.exception() is not None:
+                    for pending in futures:
+                        pending.cancel()
+                yield f.result()
+
+    def iter_results(self):
+        """Yield results of successful ops in completion order.
+
+        Failures are logged by the workers and skipped.
+        """
+        for f in self.as_completed():
+            if f.exception() is not None:
+                continue
+            yield f.result()
 
     def start(self, count):
         for i in range(count):
-            runner = OpRunner(self.jobs, self.results)
+            runner = OpRunner(self.jobs)
             runner.daemon = True
             self.runners.append(runner)
             runner.start()
         self.started = True
 
     def stop(self):
+        for runner in self.runners:
+            self.jobs.put(None)
         for runner in self.runners:
             runner.join()
+        self.runners = []
         self.started = False
 
 
 class OpRunner(threading.Thread):
 
-    def __init__(self, ops, results):
+    def __init__(self, ops):
         self.ops = ops
-        self.results = results
         super(OpRunner, self).__init__()
 
     def run(self):
         while 1:
-            try:
-                op = self.ops.get(block=False)
-            except Empty:
-                op = None
-            if op is None:
+            future = self.ops.get()
+            if future is None:
                 return
+            if not future.set_running_or_notify_cancel():
+                continue
+            op = future.op
             try:
                 result = op.run()
             except Exception, e:
                 log.exception("Error while processing op %s", op)
-                result = e
-            self.results.put(result)
+                future.set_exception(e)
+                continue
+            # Ops may also report failure by returning the exception.
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,8 +1,13 @@
+import errno
+import select
+import socket
 import subprocess
 import logging
 
 log = logging.getLogger('juju.linode')
 
+DEFAULT_TIMEOUT = 180
+
 # juju-core will defer to either ssh or go.crypto/ssh impl
 # these options are only for the ssh ops below (availability
 # check and apt-get update on precise instances).
@@ -11,8 +16,15 @@ SSH_CMD = ("/usr/bin/ssh",
            "-o", "UserKnownHostsFile=/dev/null")
 
 
-def check_ssh(host, user="root"):
-    cmd = list(SSH_CMD) + ["%s@%s" % (user, host), "ls"]
+def ssh_command(host, user="root", options=()):
+    """Ssh command line for host, options (eg. a register.ControlMasters'
+    multiplexing options) go before the destination.
+    """
+    return list(SSH_CMD) + list(options) + ["%s@%s" % (user, host)]
+
+
+def check_ssh(host, user="root", options=()):
+    cmd = ssh_command(host, user, options) + ["ls"]
     process = subprocess.Popen(
         args=cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
@@ -24,8 +36,60 @@ def check_ssh(host, user="root"):
     return True
 
 
-def update_instance(host, user="root"):
-    base = list(SSH_CMD) + ["%s@%s" % (user, host)]
+def probe_ssh(host, port=22, connect_timeout=2, banner=True):
+    """Check whether sshd accepts connections on host, without blocking
+    longer than connect_timeout.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(0)
+    try:
+        err = sock.connect_ex((host, port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            return False
+        _, writable, _ = select.select([], [sock], [], connect_timeout)
+        if not writable:
+            return False
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            return False
+        if not banner:
+            return True
+        readable, _, _ = select.select([sock], [], [], connect_timeout)
+        if not readable:
+            return False
+        return sock.recv(255).startswith('SSH-')
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+# Upstart task generating missing host keys before sshd starts, so each
+# machine launched from an image gets keys of its own.
+HOST_KEYS_JOB = """\
+description "Generate missing ssh host keys"
+start on starting ssh
+task
+exec /usr/bin/ssh-keygen -A
+"""
+
+
+def reset_host_keys(host, user="root", options=()):
+    """Remove host's ssh host keys, they're generated again on its next
+    boot (or the next boot of a machine launched from its image).
+    """
+    cmd = ssh_command(host, user, options) + [
+        "cat > /etc/init/ssh-hostkeys.conf && rm -f /etc/ssh/ssh_host_*"]
+    process = subprocess.Popen(
+        args=cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT)
+    output, err = process.communicate(HOST_KEYS_JOB)
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, cmd, output + (err or ''))
+
+
+def update_instance(host, user="root", options=()):
+    base = ssh_command(host, user, options)
     subprocess.check_output(
         base + ["apt-get", "update"], stderr=subprocess.STDOUT)
 # Don't really need to update the image, just the package lists.
@@ -0,0 +1,203 @@
+"""
+Structured juju status.
+
+A StatusSnapshot is the cli's yaml status (a dict, so existing callers
+keep working) with machines indexed by address and linode id. Snapshots
+come from juju status, the api's FullStatus, or are kept current from
+the api's all watcher deltas by a StatusWatcher.
+"""
+
+import copy
+import logging
+import re
+import threading
+import time
+
+
+log = logging.getLogger("juju.linode")
+
+LINODE_ID = re.compile("linode(\d+)")
+
+
+def parse_linode_id(instance_id):
+    """The linode id in a machine's instance id, if there is one.
+    """
+    found = LINODE_ID.findall(instance_id or '')
+    if found and len(found[0]) > 4:
+        return found[0]
+    return None
+
+
+def public_address(addresses):
+    """The dns-name juju status would show for a machine's addresses.
+    """
+    addresses = addresses or []
+    for a in addresses:
+        if a.get('Scope') == 'public':
+            return a.get('Value')
+    return addresses and addresses[0].get('Value') or None
+
+
+class StatusSnapshot(dict):
+
+    def __init__(self, data=None, fetched=None):
+        super(StatusSnapshot, self).__init__(data or {})
+        self.fetched = fetched
+        self.reindex()
+
+    @classmethod
+    def from_api(cls, data, fetched=None):
+        """Shape a FullStatus api result like the cli's yaml status.
+        """
+        machines = {}
+        for mid, m in (data.get('Machines') or {}).items():
+            machines[mid] = {
+                'dns-name': m.get('DNSName'),
+                'instance-id': m.get('InstanceId'),
+                'agent-state': m.get('AgentState'),
+                'series': m.get('Series')}
+        services = {}
+        for name, svc in (data.get('Services') or {}).items():
+            services[name] = {
+                'charm': svc.get('Charm'),
+                'units': dict([
+                    (uid, {'machine': u.get('Machine')})
+                    for uid, u in (svc.get('Units') or {}).items()])}
+        return cls({'environment': data.get('EnvironmentName'),
+                    'machines': machines, 'services': services}, fetched)
+
+    @property
+    def machines(self):
+        return self.get('machines') or {}
+
+    def reindex(self):
+        self._by_address = {}
+        self._by_linodeid = {}
+        for mid, m in self.machines.items():
+            if m.get('dns-name'):
+                self._by_address[m['dns-name']] = mid
+            linode_id = parse_linode_id(m.get('instance-id'))
+            if linode_id:
+                self._by_linodeid[linode_id] = mid
+
+    def machine(self, machine_id):
+        return self.machines.get(machine_id)
+
+    def address(self, machine_id):
+        return (self.machine(machine_id) or {}).get('dns-name')
+
+    def instance_id(self, machine_id):
+        return (self.machine(machine_id) or {}).get('instance-id')
+
+    def machine_by_address(self, address):
+        """Id of the machine at address.
+        """
+        return self._by_address.get(address)
+
+    def machine_by_linodeid(self, linode_id):
+        return self._by_linodeid.get(str(linode_id))
+
+    def copy(self):
+        return self.__class__(copy.deepcopy(dict(self)), self.fetched)
+
+    def apply(self, entity, change, data):
+        """Apply an all watcher delta, returns True if it was relevant.
+        """
+        if entity == 'machine':
+            machines = self.setdefault('machines', {})
+            if change == 'remove':
+                machines.pop(data['Id'], None)
+            else:
+                machines[data['Id']] = {
+                    'dns-name': public_address(data.get('Addresses')),
+                    'instance-id': data.get('InstanceId'),
+                    'agent-state': data.get('Status'),
+                    'series': data.get('Series')}
+        elif entity == 'service':
+            services = self.setdefault('services', {})
+            if change == 'remove':
+                services.pop(data['Name'], None)
+            else:
+                services.setdefault(data['Name'], {'units': {}})[
+                    'charm'] = data.get('CharmURL')
+        elif entity == 'unit':
+            service = self.setdefault('services', {}).setdefault(
+                data['Service'], {'charm': None, 'units': {}})
+            if change == 'remove':
+                service['units'].pop(data['Name'], None)
+            else:
+                service['units'][data['Name']] = {
+                    'machine': data.get('MachineId')}
+        else:
+            return False
+        return True
+
+
+class StatusWatcher(object):
+    """Keeps a snapshot current from an api all watcher.
+
+    The watcher has a connection of its own, and every batch of deltas
+    publishes a new snapshot, so readers never see one half applied.
+    """
+
+    def __init__(self, client, clock=time.time):
+        self.client = client
+        self.clock = clock
+        self.snapshot = None
+        self.failed = False
+        self.watch = None
+        # Count of published snapshots, and the count when the
+        # environment was last changed from here.
+        self.version = 0
+        self.stale_version = None
+        self._ready = threading.Event()
+
+    def start(self):
+        self.watch = self.client.get_watch()
+        thread = threading.Thread(target=self.run, name="status-watch")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def run(self):
+        try:
+            for deltas in self.watch:
+                snapshot = (self.snapshot or StatusSnapshot(
+                    {'machines': {}, 'services': {}})).copy()
+                for entity, change, data in deltas:
+                    snapshot.apply(entity, change, data)
+                snapshot.reindex()
+                snapshot.fetched = self.clock()
+                self.snapshot = snapshot
+                self.version += 1
+                self._ready.set()
+        except Exception, e:
+            if self.watch.running:
+                log.warning("Juju status watch failed: %s", e)
+        self.failed = True
+        self._ready.set()
+
+    def mark_stale(self):
+        """The environment was changed, the snapshot predates the change
+        until the next deltas arrive.
+        """
+        self.stale_version = self.version
+
+    def current(self, timeout=None):
+        """The latest snapshot, None if the watch failed, hasn't
+        delivered the initial state within timeout, or is stale.
+        """
+        self._ready.wait(timeout)
+        if self.failed:
+            return None
+        if (self.stale_version is not None and
+                self.version <= self.stale_version):
+            return None
+        return self.snapshot
+
+    def stop(self):
+        if self.watch is not None:
+            try:
+                self.watch.stop()
+            except Exception, e:
+                log.debug("Stopping status watch: %s", e)
@@ -0,0 +1,471 @@
+"""
+Local stand-in for api.linode.com and the domain manager endpoint.
+
+Serves the linode api v3 actions used by the client, keeping linodes,
+disks, jobs and images in memory. Jobs finish job_latency seconds after
+they're entered, linodes move between states as their boot, shutdown
+and delete jobs complete. Optionally the server enforces a rate limit
+(ERRORCODE 14) and injects errors. A listener answering with an ssh
+banner lets provisioning's ssh wait succeed against its 127.x addresses,
+and resolve() answers for the records registered with the domain
+manager.
+
+    server = FakeLinode(job_latency=0.5)
+    server.start()
+    client = Client('key')
+    client.api_url_base = server.url
+    ...
+    server.stop()
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn, TCPServer, BaseRequestHandler
+import itertools
+import json
+import random
+import threading
+import time
+import urlparse
+
+from juju_linode.client import LinodeInstace
+
+
+PLANS = [
+    {'PLANID': 1, 'LABEL': 'Linode 1024', 'RAM': 1024, 'DISK': 24,
+     'XFER': 2000, 'PRICE': 10.0, 'HOURLY': 0.015, 'CORES': 1},
+    {'PLANID': 2, 'LABEL': 'Linode 2048', 'RAM': 2048, 'DISK': 48,
+     'XFER': 3000, 'PRICE': 20.0, 'HOURLY': 0.03, 'CORES': 2},
+    {'PLANID': 4, 'LABEL': 'Linode 4096', 'RAM': 4096, 'DISK': 96,
+     'XFER': 4000, 'PRICE': 40.0, 'HOURLY': 0.06, 'CORES': 4}]
+
+DATACENTERS = [
+    {'DATACENTERID': 2, 'LOCATION': 'Dallas, TX, USA', 'ABBR': 'dallas'},
+    {'DATACENTERID': 3, 'LOCATION': 'Fremont, CA, USA', 'ABBR': 'fremont'},
+    {'DATACENTERID': 7, 'LOCATION': 'London, England, UK',
+     'ABBR': 'london'}]
+
+DISTRIBUTIONS = [
+    {'DISTRIBUTIONID': 124, 'LABEL': 'Ubuntu 14.04 LTS', 'IS64BIT': 1,
+     'REQUIRESPVOPSKERNEL': 1, 'MINIMAGESIZE': 750,
+     'CREATE_DT': '2014-04-17 00:00:00.0'}]
+
+# linode.list STATUS values.
+BRAND_NEW, RUNNING, POWERED_OFF = 0, 1, 2
+
+NOT_FOUND = 5
+VALIDATION = 8
+RATE_LIMITED = 14
+
+
+class APIError(Exception):
+
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+
+class FakeLinode(object):
+    """In memory linode account served over http.
+
+    job_latency is the seconds each job takes, rate_limit the requests
+    per second served before answering with ERRORCODE 14 (None for no
+    limit), error_rate the chance any action fails with a validation
+    error. See fail() to inject errors for specific actions.
+    """
+
+    def __init__(self, job_latency=0.0, rate_limit=None, error_rate=0.0,
+                 seed=None, clock=time.time):
+        self.job_latency = job_latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.clock = clock
+        self.linodes = {}
+        self.ips = {}
+        self.disks = {}
+        self.configs = {}
+        self.jobs = {}
+        self.images = {}
+        self.records = []
+        self.calls = {}
+        self.rate_limited = 0
+        self.failures = {}
+        self._ids = itertools.count(1000)
+        self._lock = threading.RLock()
+        self._window = (0, 0)
+        self.server = None
+        self.ssh = None
+
+    # Test controls
+
+    def fail(self, api_action, code=VALIDATION, count=1):
+        """Fail the next count calls of api_action with ERRORCODE code.
+        """
+        with self._lock:
+            self.failures.setdefault(api_action, []).extend([code] * count)
+
+    @property
+    def round_trips(self):
+        with self._lock:
+            return self.calls.get('http', 0)
+
+    def start(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.fake = self
+        self.url = "http://127.0.0.1:%d/" % self.server.server_address[1]
+        self.dns_url = self.url + "dns"
+        self.ssh = SSHBanner(('0.0.0.0', 0), SSHBannerHandler)
+        self.ssh_port = self.ssh.server_address[1]
+        for server in (self.server, self.ssh):
+            thread = threading.Thread(
+                target=server.serve_forever, args=(0.05,), name=THREAD_NAME)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        for server in (self.server, self.ssh):
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    def config(self, **extra):
+        """Provider config pointing at this server.
+        """
+        config = {
+            'linode-api-key': 'fake', 'linode-api-url': self.url,
+            'linode-stack-script-id': 1,
+            'domain-manager-api-url': self.dns_url,
+            'domain-manager-username': 'fake',
+            'domain-manager-password': 'fake',
+            'default-num-runner': 10}
+        config.update(extra)
+        return config
+
+    # Api
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _throttled(self):
+        if not self.rate_limit:
+            return False
+        second = int(self.clock())
+        start, count = self._window
+        if start != second:
+            start, count = second, 0
+        self._window = (start, count + 1)
+        return count + 1 > self.rate_limit
+
+    def handle(self, params):
+        """Answer a linode api request, as the decoded json response.
+        """
+        with self._lock:
+            self._count('http')
+            if self._throttled():
+                self.rate_limited += 1
+                return self._error(
+                    params.get('api_action'), RATE_LIMITED,
+                    'Rate limit exceeded')
+            action = params.get('api_action')
+            if action == 'batch':
+                return [self.dispatch(p) for p in json.loads(
+                    params['api_requestArray'])]
+            return self.dispatch(params)
+
+    def _error(self, action, code, message):
+        return {'ACTION': action, 'DATA': {}, 'ERRORARRAY': [
+            {'ERRORCODE': code, 'ERRORMESSAGE': message}]}
+
+    def dispatch(self, params):
+        action = params.get('api_action')
+        self._count(action)
+        injected = self.failures.get(action)
+        if injected:
+            return self._error(action, injected.pop(0), 'Injected failure')
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self._error(action, VALIDATION, 'Random failure')
+        method = getattr(self, 'api_' + str(action).replace('.', '_'), None)
+        if method is None:
+            return self._error(action, 3, 'Action not supported')
+        self.update_jobs()
+        try:
+            data = method(params)
+        except APIError, e:
+            return self._error(action, e.code, e.message)
+        return {'ACTION': action, 'DATA': data, 'ERRORARRAY': []}
+
+    def _linode(self, params):
+        linode_id = int(params.get('LinodeID', 0))
+        if linode_id not in self.linodes:
+            raise APIError(NOT_FOUND, 'Object not found')
+        return self.linodes[linode_id]
+
+    def _job(self, linode_id, action, on_finish=None):
+        job_id = next(self._ids)
+        self.jobs[job_id] = {
+            'JOBID': job_id, 'LINODEID': linode_id, 'ACTION': action,
+            'LABEL': action, 'ENTERED_DT': self.clock(),
+            'HOST_START_DT': self.clock(), 'HOST_FINISH_DT': '',
+            'DURATION': '', 'HOST_MESSAGE': '', 'HOST_SUCCESS': '',
+            'finish': self.clock() + self.job_latency,
+            'on_finish': on_finish}
+        return job_id
+
+    def update_jobs(self):
+        now = self.clock()
+        for job in self.jobs.values():
+            if job['HOST_FINISH_DT'] or job['finish'] > now:
+                continue
+            job['HOST_FINISH_DT'] = now
+            job['DURATION'] = self.job_latency
+            job['HOST_SUCCESS'] = 1
+            if job['on_finish'] is not None:
+                job['on_finish']()
+
+    def api_avail_linodeplans(self, params):
+        return [dict(p, AVAIL=dict([
+            (str(d['DATACENTERID']), 100) for d in DATACENTERS]))
+            for p in PLANS]
+
+    def api_avail_datacenters(self, params):
+        return DATACENTERS
+
+    def api_avail_distributions(self, params):
+        return DISTRIBUTIONS
+
+    def api_linode_create(self, params):
+        plan = [p for p in PLANS if str(p['PLANID']) == str(
+            params.get('PlanID'))]
+        if not plan or not [d for d in DATACENTERS if str(
+                d['DATACENTERID']) == str(params.get('DatacenterID'))]:
+            raise APIError(VALIDATION, 'Invalid plan or datacenter')
+        linode_id = next(self._ids)
+        linode = dict([(k, 0) for k in LinodeInstace.api_keys])
+        linode.update(
+            LINODEID=linode_id, LABEL='linode%d' % linode_id,
+            STATUS=BRAND_NEW, PLANID=plan[0]['PLANID'],
+            DATACENTERID=int(params['DatacenterID']),
+            TOTALRAM=plan[0]['RAM'], TOTALHD=plan[0]['DISK'] * 1024,
+            LPM_DISPLAYGROUP='', CREATE_DT=self.clock())
+        self.linodes[linode_id] = linode
+        self.ips[linode_id] = '127.0.%d.%d' % (
+            linode_id / 250 % 250, linode_id % 250 + 1)
+        self.disks[linode_id] = {}
+        return {'LinodeID': linode_id}
+
+    def api_linode_list(self, params):
+        if params.get('LinodeID'):
+            linode_id = int(params['LinodeID'])
+            return [self.linodes[linode_id]] if (
+                linode_id in self.linodes) else []
+        return sorted(self.linodes.values(), key=lambda l: l['LINODEID'])
+
+    def api_linode_ip_list(self, params):
+        ids = params.get('LinodeID') and [int(params['LinodeID'])] or (
+            sorted(self.ips))
+        return [{'LINODEID': i, 'IPADDRESS': self.ips[i], 'ISPUBLIC': 1}
+                for i in ids if i in self.ips]
+
+    def api_linode_update(self, params):
+        linode = self._linode(params)
+        for k, v in params.items():
+            if k.upper() in linode and k != 'LinodeID':
+                linode[k.upper()] = v
+        return {'LinodeID': linode['LINODEID']}
+
+    def _set_status(self, linode_id, status):
+        def set_status():
+            if linode_id in self.linodes:
+                self.linodes[linode_id]['STATUS'] = status
+        return set_status
+
+    def api_linode_boot(self, params):
+        linode = self._linode(params)
+        return {'JobID': self._job(
+            linode['LINODEID'], 'linode.boot',
+            self._set_status(linode['LINODEID'], RUNNING))}
+
+    def api_linode_shutdown(self, params):
+        linode = self._linode(params)
+        return {'JobID': self._job(
+            linode['LINODEID'], 'linode.shutdown',
+            self._set_status(linode['LINODEID'], POWERED_OFF))}
+
+    def api_linode_delete(self, params):
+        linode = self._linode(params)
+        linode_id = linode['LINODEID']
+        if self.disks[linode_id] and not params.get('skipChecks'):
+            raise APIError(VALIDATION, 'Linode must have no disks')
+        for store in (self.linodes, self.ips, self.disks):
+            store.pop(linode_id, None)
+        return {'LinodeID': linode_id}
+
+    def _create_disk(self, params, label, disk_type='ext4'):
+        linode = self._linode(params)
+        linode_id = linode['LINODEID']
+        disk_id = next(self._ids)
+        self.disks[linode_id][disk_id] = {
+            'DISKID': disk_id, 'LINODEID': linode_id, 'LABEL': label,
+            'TYPE': disk_type, 'SIZE': params.get('Size', 0),
+            'ISREADONLY': 0, 'CREATE_DT': self.clock(),
+            'UPDATE_DT': self.clock()}
+        return {'DiskID': disk_id, 'JobID': self._job(
+            linode_id, 'linode.disk.create')}
+
+    def api_linode_disk_create(self, params):
+        return self._create_disk(
+            params, params.get('Label'), params.get('Type', 'ext4'))
+
+    def api_linode_disk_createfromstackscript(self, params):
+        return self._create_disk(params, params.get('Label'))
+
+    def api_linode_disk_createfromimage(self, params):
+        if int(params.get('ImageID', 0)) not in self.images:
+            raise APIError(NOT_FOUND, 'Image not found')
+        return self._create_disk(params, params.get('Label'))
+
+    def api_linode_disk_list(self, params):
+        linode = self._linode(params)
+        return self.disks[linode['LINODEID']].values()
+
+    def api_linode_disk_delete(self, params):
+        linode = self._linode(params)
+        linode_id = linode['LINODEID']
+        disk_id = int(params.get('DiskID', 0))
+        if disk_id not in self.disks[linode_id]:
+            raise APIError(NOT_FOUND, 'Disk not found')
+
+        def delete():
+            if linode_id in self.disks:
+                self.disks[linode_id].pop(disk_id, None)
+        # The disk is gone once the delete job finishes.
+        return {'DiskID': disk_id, 'JobID': self._job(
+            linode_id, 'linode.disk.delete', delete)}
+
+    def api_linode_disk_imagize(self, params):
+        linode = self._linode(params)
+        image_id = next(self._ids)
+        self.images[image_id] = {
+            'IMAGEID': image_id, 'LABEL': params.get('Label'),
+            'DESCRIPTION': params.get('Description', ''),
+            'STATUS': 'pending_upload', 'MINSIZE': 0,
+            'CREATE_DT': self.clock()}
+
+        def available():
+            self.images[image_id]['STATUS'] = 'available'
+        return {'ImageID': image_id, 'JobID': self._job(
+            linode['LINODEID'], 'linode.disk.imagize', available)}
+
+    def api_linode_config_create(self, params):
+        linode = self._linode(params)
+        config_id = next(self._ids)
+        self.configs[config_id] = dict(params, LinodeID=linode['LINODEID'])
+        return {'ConfigID': config_id}
+
+    def api_linode_job_list(self, params):
+        linode = self._linode(params)
+        jobs = [j for j in self.jobs.values()
+                if j['LINODEID'] == linode['LINODEID']]
+        if params.get('JobID'):
+            jobs = [j for j in jobs if j['JOBID'] == int(params['JobID'])]
+        if str(params.get('pendingOnly', '0')) == '1':
+            jobs = [j for j in jobs if not j['HOST_FINISH_DT']]
+        return [dict([(k, v) for k, v in j.items() if k.isupper()])
+                for j in jobs]
+
+    def api_image_list(self, params):
+        return self.images.values()
+
+    def api_image_delete(self, params):
+        image = self.images.pop(int(params.get('ImageID', 0)), None)
+        if image is None:
+            raise APIError(NOT_FOUND, 'Image not found')
+        return {'ImageID': image['IMAGEID']}
+
+    def resolve(self, name):
+        """Addresses of the A records registered for name, a resolver for
+        engine.wait_for_record_async.
+        """
+        with self._lock:
+            addresses = []
+            for change, record in self.records:
+                if record['name'] != name or 'data' not in record:
+                    continue
+                if change == 'create':
+                    addresses.append(record['data'])
+                elif record['data'] in addresses:
+                    addresses.remove(record['data'])
+            return addresses
+
+    def handle_dns(self, changes):
+        with self._lock:
+            self._count('http')
+            self._count('domain-manager')
+            self.records.extend(changes.get('changes', []))
+
+
+THREAD_NAME = "fakelinode"
+
+
+class NamedThreadsMixIn(ThreadingMixIn):
+    """Name request threads, so benchmarks can tell them from the
+    client's.
+    """
+
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(
+            target=self.process_request_thread, name=THREAD_NAME,
+            args=(request, client_address))
+        thread.daemon = True
+        thread.start()
+
+
+class Server(NamedThreadsMixIn, HTTPServer):
+    pass
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status, body):
+        body = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        return length and self.rfile.read(length) or ''
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        body = self._body()
+        if url.path.startswith('/dns'):
+            self.server.fake.handle_dns(json.loads(body or '{}'))
+            return self._reply(200, {'status': 'ok'})
+        if body:
+            params.update(urlparse.parse_qsl(body))
+        self._reply(200, self.server.fake.handle(params))
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SSHBanner(NamedThreadsMixIn, TCPServer):
+
+    allow_reuse_address = True
+
+
+class SSHBannerHandler(BaseRequestHandler):
+
+    def handle(self):
+        self.request.sendall("SSH-2.0-OpenSSH_6.6 fakelinode\r\n")
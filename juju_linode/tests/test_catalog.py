@@ -0,0 +1,56 @@
+import json
+import mock
+import os
+
+from juju_linode.catalog import Catalog
+from juju_linode.client import DataCenter, Distribution, Plan
+
+from base import Base
+
+
+class CatalogTest(Base):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.client.get_linode_plans.return_value = [
+            Plan.from_dict(dict(planid=1, label='Linode 1024', ram=1024))]
+        self.client.get_datacenters.return_value = [
+            DataCenter.from_dict(dict(
+                datacenterid=2, abbr='dallas', location='Dallas, TX, USA'))]
+        self.client.get_distributions.return_value = [
+            Distribution.from_dict(dict(distributionid=124, label='Ubuntu'))]
+        self.path = os.path.join(self.mkdir(), 'catalog.json')
+        self.now = 1000
+        self.catalog = Catalog(
+            self.client, self.path, ttl=100, clock=lambda: self.now)
+
+    def test_load_caches(self):
+        data = self.catalog.load()
+        self.assertEqual(data['plans'][0].label, 'Linode 1024')
+        self.assertEqual(data['datacenters'][0].abbr, 'dallas')
+
+        self.client.reset_mock()
+        self.now = 1050
+        data = self.catalog.load()
+        self.assertEqual(data['datacenters'][0].datacenterid, 2)
+        self.assertFalse(self.client.get_linode_plans.called)
+        self.assertFalse(self.client.get_datacenters.called)
+
+    def test_load_refreshes_expired(self):
+        self.catalog.load()
+        with open(self.path) as fh:
+            cache = json.loads(fh.read())
+        cache['plans']['fetched'] = 800
+        with open(self.path, 'w') as fh:
+            fh.write(json.dumps(cache))
+
+        self.client.reset_mock()
+        self.catalog.load()
+        self.assertTrue(self.client.get_linode_plans.called)
+        self.assertFalse(self.client.get_datacenters.called)
+
+    def test_load_refresh(self):
+        self.catalog.load()
+        self.client.reset_mock()
+        self.catalog.load(refresh=True)
+        self.assertTrue(self.client.get_datacenters.called)
@@ -0,0 +1,194 @@
+import json
+import mock
+
+from juju_linode.client import Client, Job, LinodeInstace
+from juju_linode.exceptions import ProviderAPIError
+
+from base import Base
+
+
+def linode_info(linode_id, label):
+    info = dict([(k, 0) for k in (
+        'ALERT_CPU_ENABLED', 'ALERT_BWIN_ENABLED', 'ALERT_BWQUOTA_ENABLED',
+        'ALERT_DISKIO_THRESHOLD', 'BACKUPWINDOW', 'WATCHDOG',
+        'DISTRIBUTIONVENDOR', 'DATACENTERID', 'STATUS',
+        'ALERT_DISKIO_ENABLED', 'CREATE_DT', 'TOTALHD',
+        'ALERT_BWQUOTA_THRESHOLD', 'TOTALRAM', 'ALERT_BWIN_THRESHOLD',
+        'ALERT_BWOUT_THRESHOLD', 'ALERT_BWOUT_ENABLED', 'BACKUPSENABLED',
+        'ALERT_CPU_THRESHOLD', 'PLANID', 'BACKUPWEEKLYDAY',
+        'LPM_DISPLAYGROUP', 'TOTALXFER')])
+    info['LINODEID'] = linode_id
+    info['LABEL'] = label
+    return info
+
+
+def ip_info(linode_id, address):
+    return {'LINODEID': linode_id, 'IPADDRESS': address, 'ISPUBLIC': 1}
+
+
+class FakeTransport(object):
+    """Replays canned api responses keyed by api action.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+        self.stats = mock.MagicMock(round_trips=0)
+
+    def request(self, method, url, label=None, **kw):
+        params = kw['params']
+        self.calls.append(params)
+        response = mock.MagicMock()
+        if params['api_action'] == 'batch':
+            response.json.return_value = [
+                self.reply(p) for p in
+                json.loads(params['api_requestArray'])]
+        else:
+            response.json.return_value = self.reply(params)
+        return response
+
+    def reply(self, params):
+        data = self.responses[params['api_action']]
+        if callable(data):
+            data = data(params)
+        if isinstance(data, ProviderAPIError):
+            return {'ERRORARRAY': data.message, 'DATA': {},
+                    'ACTION': params['api_action']}
+        return {'ERRORARRAY': [], 'DATA': data,
+                'ACTION': params['api_action']}
+
+
+class ClientBase(Base):
+
+    def get_client(self, responses, batch_size=25):
+        transport = FakeTransport(responses)
+        return Client('xyz', transport, batch_size), transport
+
+
+class EntityTest(Base):
+
+    def test_from_api(self):
+        instance = LinodeInstace.from_api(
+            linode_info(3, 'linode3'), ip_addresses=['10.0.0.3'])
+        self.assertEqual(instance.linodeid, 3)
+        self.assertEqual(instance.label, 'linode3')
+        self.assertEqual(instance.ip_addresses, ['10.0.0.3'])
+        self.assertEqual(instance.remote_access_name, '10.0.0.3')
+        self.assertFalse(hasattr(instance, '__dict__'))
+        self.assertRaises(AttributeError, setattr, instance, 'name', 'x')
+
+    def test_to_json_round_trip(self):
+        job = Job.from_dict(dict(jobid=1, host_success=0))
+        self.assertEqual(job.linodeid, None)
+        data = job.to_json()
+        self.assertEqual(data['jobid'], 1)
+        self.assertEqual(Job.from_dict(data).to_json(), data)
+
+
+class ClientTest(ClientBase):
+
+    def test_request_error(self):
+        client, transport = self.get_client({
+            'linode.boot': ProviderAPIError([{'ERRORCODE': 5}])})
+        self.assertRaises(ProviderAPIError, client.request, 'linode.boot')
+
+    def test_get_linode_instances_single_ip_lookup(self):
+        client, transport = self.get_client({
+            'linode.list': [linode_info(i, 'linode%d' % i)
+                            for i in range(1, 6)],
+            'linode.ip.list': [ip_info(i, '10.0.0.%d' % i)
+                               for i in range(1, 6)]})
+        instances = client.get_linode_instaces()
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(
+            [i.ip_addresses for i in instances],
+            [['10.0.0.%d' % i] for i in range(1, 6)])
+        self.assertEqual(instances[2].remote_access_name, '10.0.0.3')
+
+    def test_iter_linode_instances_lazy_ips(self):
+        loaded = []
+
+        def ip_list(params):
+            loaded.append(params)
+            return [ip_info(i, '10.0.0.%d' % i) for i in range(1, 3)]
+
+        client, transport = self.get_client({
+            'linode.list': [linode_info(i, 'linode%d' % i)
+                            for i in range(1, 4)],
+            'linode.ip.list': ip_list})
+        stream = client.iter_linode_instaces()
+        first = next(stream)
+        self.assertEqual(first.label, 'linode1')
+        self.assertEqual(first.ip_addresses, ['10.0.0.1'])
+        self.assertEqual(first.remote_access_name, '10.0.0.1')
+        rest = list(stream)
+        self.assertEqual(rest[1].ip_addresses, [])
+        self.assertEqual(rest[1].remote_access_name, None)
+        self.assertEqual(len(loaded), 1)
+
+    def test_ip_map_batched(self):
+        client, transport = self.get_client({
+            'linode.ip.list': lambda p: [
+                ip_info(p['LinodeID'], '10.0.0.%d' % p['LinodeID'])]},
+            batch_size=2)
+        ip_map = client.get_linode_ip_map([1, 2, 3, 4, 5])
+        self.assertEqual(len(transport.calls), 3)
+        self.assertEqual(ip_map[5], ['10.0.0.5'])
+
+    def test_batch_errors(self):
+        client, transport = self.get_client({
+            'linode.ip.list': ProviderAPIError([{'ERRORCODE': 5}])})
+        results = client.request_batch([('linode.ip.list', {'LinodeID': 1})])
+        self.assertEqual(results, [({}, [{'ERRORCODE': 5}])])
+
+    def test_get_linode_instance_single_round_trip(self):
+        client, transport = self.get_client({
+            'linode.list': [linode_info(7, 'linode7')],
+            'linode.ip.list': [ip_info(7, '10.0.0.7')]})
+        instance = client.get_linode_instace(7)
+        self.assertEqual(len(transport.calls), 1)
+        self.assertEqual(instance.ip_addresses, ['10.0.0.7'])
+
+    def test_get_linodes_pending_jobs(self):
+        client, transport = self.get_client({'linode.job.list': []})
+        self.assertEqual(
+            client.get_linodes_pending_jobs([1, 2]), {1: [], 2: []})
+        self.assertEqual(len(transport.calls), 1)
+
+
+class BatchTest(ClientBase):
+
+    def test_batch(self):
+        client, transport = self.get_client({
+            'linode.disk.create': {'DiskID': 2, 'JobID': 11},
+            'linode.disk.delete': ProviderAPIError([{'ERRORCODE': 5}])})
+        instance = mock.MagicMock(linodeid=3, planid=1)
+        disk = mock.MagicMock(linodeid=3, diskid=4)
+        with client.batch() as batch:
+            swap = batch.create_linode_swap(instance)
+            delete = batch.delete_linode_disk(disk)
+            self.assertFalse(swap.done)
+        self.assertEqual(len(transport.calls), 1)
+        self.assertEqual(swap.result(), {'DiskID': 2, 'JobID': 11})
+        self.assertRaises(ProviderAPIError, delete.result)
+
+    def test_batch_not_executed_on_error(self):
+        client, transport = self.get_client({})
+        try:
+            with client.batch() as batch:
+                pending = batch.linode_boot(mock.MagicMock(linodeid=3))
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(transport.calls, [])
+        self.assertRaises(ProviderAPIError, pending.result)
+
+    def test_batch_rejects_processed_results(self):
+        client, transport = self.get_client({})
+        batch = client.batch()
+        self.assertRaises(AttributeError, getattr, batch, 'get_linode_plans')
+        self.assertRaises(
+            AttributeError, getattr, batch, 'make_linode_instace')
+        self.assertRaises(AttributeError, getattr, batch, 'request_batch')
+        batch.linode_boot(mock.MagicMock(linodeid=3))
+        self.assertEqual(len(batch.pending), 1)
@@ -275,9 +275,7 @@ class DestroyEnvironmentTest(CommandBase):
         self.assertEqual(
             self.provider.terminate_instance.call_args_list,
             [mock.call(258), mock.call(221)])
-        self.assertEqual(
-            self.env.terminate_machines.call_args_list,
-            [mock.call(['1']), mock.call(['2'])])
+        self.env.terminate_machines.assert_called_once_with(['1', '2'])
 
 if __name__ == '__main__':
     unittest.main()
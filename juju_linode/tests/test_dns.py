@@ -0,0 +1,43 @@
+from juju_linode.engine import ThreadLoop, wait_for_record_async
+from juju_linode.exceptions import TimeoutError
+
+from base import Base
+from test_waiter import FakeClock
+
+
+class StubResolver(object):
+    """Resolves name only after a number of lookups.
+    """
+
+    def __init__(self, records, misses=0):
+        self.records = records
+        self.misses = misses
+        self.lookups = 0
+
+    def __call__(self, name):
+        self.lookups += 1
+        if self.lookups <= self.misses:
+            return []
+        return self.records.get(name, [])
+
+
+class DNSTest(Base):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def wait(self, resolver, timeout=300):
+        loop = ThreadLoop(clock=self.clock.time, sleep=self.clock.sleep)
+        return loop.run(wait_for_record_async(
+            loop, 'linode1.example.com', '10.0.0.1', timeout, resolver))
+
+    def test_resolved(self):
+        resolver = StubResolver(
+            {'linode1.example.com': ['10.0.0.1']}, misses=3)
+        self.assertEqual(self.wait(resolver), 7)
+        self.assertEqual(self.clock.sleeps, [1, 2, 4])
+
+    def test_timeout(self):
+        resolver = StubResolver({'linode1.example.com': ['10.0.0.2']})
+        self.assertRaises(TimeoutError, self.wait, resolver, 20)
+        self.assertEqual(self.clock.now, 20)
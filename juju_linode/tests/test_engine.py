@@ -0,0 +1,192 @@
+import threading
+import time
+
+import mock
+
+from juju_linode.engine import (
+    EngineRunner, Loop, Return, Sleep, Stages, ThreadLoop, WaitFor,
+    AsyncClient)
+from juju_linode.exceptions import CancelledError, TimeoutError
+from juju_linode.runner import Future
+
+from base import Base
+
+
+class FakeOp(object):
+
+    def run(self):
+        return 1
+
+
+class FakeAsyncOp(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def run_async(self, loop):
+        yield loop.spawn(self.step())
+        if self.value is None:
+            raise ValueError("Bad")
+        raise Return(self.value)
+
+
+    def step(self):
+        yield Sleep(0.01)
+        raise Return('step')
+
+
+class LoopTest(Base):
+
+    def setUp(self):
+        self.loop = Loop(workers=2)
+        self.addCleanup(self.loop.close)
+
+    def test_call_and_sleep(self):
+        def coroutine():
+            value = yield self.loop.call(lambda: 3)
+            yield Sleep(0.01)
+            raise Return(value * 2)
+        task = self.loop.spawn(coroutine())
+        self.loop.run()
+        self.assertEqual(task.result(), 6)
+
+    def test_exception_raised_at_yield(self):
+        def fail():
+            raise ValueError("bad")
+
+        def coroutine():
+            try:
+                yield self.loop.call(fail)
+            except ValueError:
+                raise Return('caught')
+        task = self.loop.spawn(coroutine())
+        self.loop.run()
+        self.assertEqual(task.result(), 'caught')
+
+    def test_wait_for_timeout(self):
+        def coroutine():
+            yield WaitFor(Future(), 0.01)
+        task = self.loop.spawn(coroutine())
+        self.loop.run()
+        self.assertRaises(TimeoutError, task.result)
+
+    def test_cancel(self):
+        def child():
+            yield Sleep(60)
+
+        def parent(state):
+            state['child'] = self.loop.spawn(child())
+            yield state['child']
+
+        def canceller(task):
+            yield Sleep(0.01)
+            raise Return(self.loop.cancel(task))
+
+        state = {}
+        task = self.loop.spawn(parent(state))
+        cancelled = self.loop.spawn(canceller(task))
+        started = time.time()
+        self.loop.run()
+        self.assertLess(time.time() - started, 5)
+        self.assertTrue(cancelled.result())
+        self.assertRaises(CancelledError, task.result)
+        self.assertRaises(CancelledError, state['child'].result)
+        self.assertFalse(self.loop.cancel(task))
+
+    def test_many_tasks_single_thread(self):
+        threads = threading.active_count()
+
+        def coroutine(i):
+            for n in range(3):
+                yield Sleep(0.01)
+            raise Return(i)
+
+        tasks = [self.loop.spawn(coroutine(i)) for i in range(300)]
+        self.loop.run()
+        self.assertEqual([t.result() for t in tasks], range(300))
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_async_client(self):
+        class Client(object):
+            version = 1.0
+
+            def linode_boot(self, instance):
+                return {'JobID': instance}
+
+        client = AsyncClient(Client(), self.loop)
+        self.assertEqual(client.version, 1.0)
+        self.assertEqual(client.linode_boot(3).result(5), {'JobID': 3})
+
+
+class ThreadLoopTest(Base):
+
+    def setUp(self):
+        self.sleeps = []
+        self.loop = ThreadLoop(sleep=self.sleeps.append)
+
+    def test_run(self):
+        def fail():
+            raise ValueError("bad")
+
+        def coroutine():
+            value = yield self.loop.call(lambda: 3)
+            yield Sleep(2)
+            step = yield self.loop.spawn(FakeAsyncOp(value).run_async(self.loop))
+            try:
+                yield self.loop.call(fail)
+            except ValueError:
+                raise Return((value, step))
+        self.assertEqual(self.loop.run(coroutine()), (3, 3))
+        self.assertEqual(self.sleeps, [2, 0.01])
+
+    def test_wait_for_timeout(self):
+        def coroutine():
+            yield WaitFor(Future(), 0.01)
+        self.assertRaises(TimeoutError, self.loop.run, coroutine())
+
+    def test_cancel(self):
+        loop = ThreadLoop()
+
+        def child():
+            yield Sleep(60)
+
+        def parent(state):
+            state['child'] = loop.spawn(child())
+            yield state['child']
+
+        state = {}
+        task = loop.spawn(parent(state))
+        while 'child' not in state or task.waiting is None:
+            time.sleep(0.01)
+        started = time.time()
+        self.assertTrue(loop.cancel(task))
+        self.assertRaises(CancelledError, task.result, 5)
+        self.assertRaises(CancelledError, state['child'].result, 5)
+        self.assertLess(time.time() - started, 5)
+        self.assertFalse(loop.cancel(task))
+
+
+class StagesTest(Base):
+
+    def test_log(self):
+        now = [10.0]
+        stages = Stages(clock=lambda: now[0])
+        now[0] = 11.5
+        stages.done('disks', 10.0)
+        now[0] = 14.0
+        stages.done('boot', 12.0)
+        with mock.patch('juju_linode.engine.log') as log:
+            stages.log('Instance a')
+        log.info.assert_called_once_with(
+            "%s stages: %s total:%.1fs", 'Instance a',
+            'disks:1.5s boot:2.0s', 4.0)
+
+
+class EngineRunnerTest(Base):
+
+    def test_runner(self):
+        runner = EngineRunner(2)
+        runner.queue_op(FakeOp())
+        runner.queue_op(FakeAsyncOp(2))
+        runner.queue_op(FakeAsyncOp(None))
+        self.assertEqual(sorted(runner.iter_results()), [1, 2])
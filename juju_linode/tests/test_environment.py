@@ -68,3 +68,125 @@ class EnvironmentTest(Base):
         self.env.bootstrap_jenv('1.1.1.1')
 
         self.assertNotIn('boot-linode', os.listdir(juju_home))
+
+
+class EnvironmentConnectionTest(Base):
+
+    def setUp(self):
+        self.config = mock.MagicMock()
+        self.config.get_env_name.return_value = "linode"
+        self.conf = {}
+        self.config.get_current_env_conf.return_value = self.conf
+        self.client = mock.MagicMock()
+        self.env = Environment(self.config)
+
+    def test_connection_shared(self):
+        self.client.status.return_value = {
+            'EnvironmentName': 'linode',
+            'Machines': {'1': {
+                'DNSName': '1.1.1.1', 'InstanceId': 'manual:1.1.1.1',
+                'AgentState': 'started', 'Series': 'trusty'}},
+            'Services': {}}
+        with mock.patch('juju_linode.env.Client') as client_cls:
+            client_cls.connect.return_value = self.client
+            status = self.env.status()
+            self.env.terminate_machines(['1'])
+            self.assertEqual(client_cls.connect.call_count, 1)
+        self.assertEqual(
+            status['machines']['1'],
+            {'dns-name': '1.1.1.1', 'instance-id': 'manual:1.1.1.1',
+             'agent-state': 'started', 'series': 'trusty'})
+        self.client.destroy_machines.assert_called_once_with(
+            ['1'], force=True)
+        self.env.close()
+        self.client.close.assert_called_once_with()
+
+    @mock.patch('subprocess.check_output')
+    def test_cli_fallback(self, run_juju):
+        self.conf['juju-status-ttl'] = 0
+        run_juju.return_value = "machines: {}\n"
+        with mock.patch('juju_linode.env.Client') as client_cls:
+            client_cls.connect.side_effect = IOError("refused")
+            self.assertEqual(self.env.status(), {'machines': {}})
+            self.env.status()
+            self.assertEqual(client_cls.connect.call_count, 1)
+        self.assertEqual(run_juju.call_count, 2)
+
+    @mock.patch('subprocess.check_output')
+    def test_broken_connection_fallback(self, run_juju):
+        self.client.destroy_machines.side_effect = IOError("closed")
+        with mock.patch('juju_linode.env.Client') as client_cls:
+            client_cls.connect.return_value = self.client
+            self.env.terminate_machines(['2'])
+        self.assertEqual(
+            run_juju.call_args[0][0],
+            ['juju', 'terminate-machine', '--force', '2'])
+        self.client.close.assert_called_once_with()
+        self.assertEqual(self.env._client, None)
+
+    @mock.patch('subprocess.check_output')
+    def test_cli_mode(self, run_juju):
+        self.conf['juju-connection'] = 'cli'
+        run_juju.return_value = "machines: {}\n"
+        with mock.patch('juju_linode.env.Client') as client_cls:
+            self.env.status()
+            self.assertFalse(client_cls.connect.called)
+
+    @mock.patch('subprocess.check_output')
+    def test_status_cache(self, run_juju):
+        self.conf.update({'juju-connection': 'cli', 'juju-status-ttl': 10})
+        now = [100]
+        self.env.clock = lambda: now[0]
+        run_juju.return_value = yaml.safe_dump({'machines': {
+            '1': {'dns-name': '10.0.1.25', 'instance-id': 'manual:x'}}})
+
+        status = self.env.status()
+        self.assertEqual(status.machine_by_address('10.0.1.25'), '1')
+        self.assertTrue(self.env.status() is status)
+        now[0] = 111
+        self.assertFalse(self.env.status() is status)
+        self.assertEqual(run_juju.call_count, 2)
+
+        # Changes to the environment drop the cache.
+        status = self.env.status()
+        self.env.terminate_machines(['1'])
+        self.assertFalse(self.env.status() is status)
+        self.assertEqual(run_juju.call_count, 4)
+        self.assertFalse(self.env.status(refresh=True) is status)
+
+    @mock.patch('subprocess.check_output')
+    def test_status_uncached(self, run_juju):
+        self.conf.update({'juju-connection': 'cli', 'juju-status-ttl': 0})
+        run_juju.return_value = "machines: {}\n"
+        self.env.status()
+        self.env.status()
+        self.assertEqual(run_juju.call_count, 2)
+
+    @mock.patch('subprocess.check_output')
+    def test_status_default_ttl(self, run_juju):
+        self.conf['juju-connection'] = 'cli'
+        run_juju.return_value = "machines: {}\n"
+        status = self.env.status()
+        self.assertTrue(self.env.status() is status)
+        self.assertEqual(run_juju.call_count, 1)
+
+    def test_status_watch(self):
+        self.conf['juju-status-watch'] = True
+        watcher = mock.MagicMock()
+        watcher.current.return_value = {'machines': {}}
+        with mock.patch('juju_linode.env.Client') as client_cls:
+            client_cls.connect.return_value = self.client
+            with mock.patch('juju_linode.env.StatusWatcher') as watcher_cls:
+                watcher_cls.return_value.start.return_value = watcher
+                self.assertEqual(self.env.status(), {'machines': {}})
+                self.env.status()
+                watcher_cls.assert_called_once_with(
+                    self.client, self.env.clock)
+        self.assertFalse(self.client.status.called)
+
+        # Changes made from here mark the watched status stale.
+        self.env.terminate_machines(['1'])
+        watcher.mark_stale.assert_called_once_with()
+
+        self.env.close()
+        watcher.stop.assert_called_once_with()
@@ -0,0 +1,213 @@
+import functools
+import time
+
+import mock
+
+from juju_linode.client import Client
+from juju_linode.constraints import get_images
+from juju_linode.engine import Loop
+from juju_linode.exceptions import CancelledError
+from juju_linode.provider import Linode
+from juju_linode import engine
+
+from base import Base
+from fakelinode import FakeLinode, RUNNING
+
+
+PARAMS = dict(datacenter_id=2, plan_id=1, domain_postfix='example.com')
+
+
+class FakeLinodeTest(Base):
+
+    def setUp(self):
+        self.fake = FakeLinode().start()
+        self.addCleanup(self.fake.stop)
+        self.client = Client.connect(self.fake.config())
+        self.addCleanup(self.client.transport.close)
+
+    def test_linode_lifecycle(self):
+        instance = self.client.create_linode_instace(2, 1)
+        self.assertEqual(instance.ip_addresses, [
+            self.fake.ips[instance.linodeid]])
+        boot = self.client.linode_boot(instance)
+        jobs = self.client.get_linode_jobs(instance, [boot['JobID']])
+        self.assertEqual(jobs[0].host_success, 1)
+        self.assertEqual(
+            self.client.get_linode_instace(instance.linodeid).status, RUNNING)
+        self.client.destroy_linode_instace(instance)
+        self.assertEqual(list(self.client.iter_linode_instaces()), [])
+
+    def test_get_images(self):
+        self.assertEqual(get_images(self.client), {'trusty': 124, '14.04': 124})
+
+    def test_rate_limit(self):
+        self.fake.rate_limit = 1
+        self.client.limiter.reads.sleep = lambda s: None
+        self.client.limiter.writes.sleep = lambda s: None
+        self.client.get_datacenters()
+        self.client.get_datacenters()
+        self.assertTrue(self.fake.rate_limited)
+        self.assertTrue(self.client.limiter.throttled_count)
+
+    def test_injected_failure(self):
+        self.fake.fail('linode.boot', code=5)
+        instance = self.client.create_linode_instace(2, 1)
+        with self.client.batch() as batch:
+            boot = batch.linode_boot(instance)
+        self.assertRaises(Exception, boot.result)
+        self.assertTrue(self.client.linode_boot(instance)['JobID'])
+
+
+class FakeProvisioningTest(Base):
+
+    def setUp(self):
+        self.fake = fake = FakeLinode().start()
+        self.addCleanup(fake.stop)
+        self.provider = Linode(fake.config(**{'linode-poll-interval': 0.05}))
+        self.addCleanup(self.provider.close)
+        wait_for_ssh = functools.partial(
+            engine.wait_for_ssh_async, port=fake.ssh_port)
+        wait_for_record = functools.partial(
+            engine.wait_for_record_async, resolver=fake.resolve)
+        for patcher in [
+                mock.patch('juju_linode.engine.wait_for_ssh_async',
+                           wait_for_ssh),
+                mock.patch('juju_linode.engine.wait_for_record_async',
+                           wait_for_record)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_loop(self, coroutine):
+        loop = Loop(workers=4)
+        self.addCleanup(loop.close)
+        task = loop.spawn(coroutine(loop))
+        loop.run()
+        return task.result()
+
+    def assert_launched(self, instance):
+        self.assertEqual(len(self.fake.disks[instance.linodeid]), 2)
+        self.assertEqual(
+            self.fake.linodes[instance.linodeid]['STATUS'], RUNNING)
+        self.assertEqual(
+            instance.remote_access_name, instance.label + '.example.com')
+
+    def test_launch_and_terminate(self):
+        instance = self.provider.launch_instance(PARAMS)
+        self.assert_launched(instance)
+        self.provider.terminate_instance(
+            instance.linodeid, instance.remote_access_name)
+        self.assertEqual(self.fake.linodes, {})
+        self.assertEqual(len(self.fake.records), 4)
+
+    def test_launch_and_terminate_async(self):
+        instance = self.run_loop(
+            lambda loop: self.provider.launch_instance_async(loop, PARAMS))
+        self.assert_launched(instance)
+        self.run_loop(lambda loop: self.provider.terminate_instance_async(
+            loop, instance.linodeid, instance.remote_access_name))
+        self.assertEqual(self.fake.linodes, {})
+        self.assertEqual(len(self.fake.records), 4)
+
+    def logged_stages(self, log):
+        lines = [c[0] for c in log.info.call_args_list
+                 if c[0][0].startswith("%s stages")]
+        self.assertEqual(len(lines), 1)
+        return set(t.split(':')[0] for t in lines[0][2].split())
+
+    def test_launch_logs_stages(self):
+        with mock.patch('juju_linode.engine.log') as log:
+            self.provider.launch_instance(PARAMS)
+        self.assertEqual(self.logged_stages(log), set([
+            'create', 'dns', 'disks', 'config', 'wait-disks', 'boot', 'ssh',
+            'resolve-dns']))
+
+    def test_launch_failure_logs_stages_async(self):
+        self.fake.fail('linode.boot')
+        with mock.patch('juju_linode.engine.log') as log:
+            self.assertRaises(Exception, self.run_loop, lambda loop: (
+                self.provider.launch_instance_async(loop, PARAMS)))
+        stages = self.logged_stages(log)
+        self.assertTrue(stages.issuperset(
+            ['create', 'dns', 'disks', 'config', 'wait-disks']))
+        self.assertFalse(stages.intersection(['boot', 'ssh']))
+
+    def test_launch_failure(self):
+        self.fake.fail('linode.boot')
+        self.assertRaises(
+            Exception, self.provider.launch_instance, PARAMS)
+        self.assertEqual(self.fake.linodes, {})
+
+    def test_launch_failure_async(self):
+        self.fake.fail('linode.boot')
+        self.assertRaises(Exception, self.run_loop, lambda loop: (
+            self.provider.launch_instance_async(loop, PARAMS)))
+        self.assertEqual(self.fake.linodes, {})
+
+    def patch_unresolved(self):
+        """Records never resolve, returns the outcomes of the dns waits.
+        """
+        self.provider.config['dns-wait-timeout'] = 60
+        wait_for_record_async = engine.wait_for_record_async
+        outcomes = []
+
+        def wait_for_record(loop, *args, **kw):
+            kw['resolver'] = lambda name: []
+            try:
+                yield loop.spawn(wait_for_record_async(loop, *args, **kw))
+            except Exception, e:
+                outcomes.append(e)
+                raise
+        patcher = mock.patch(
+            'juju_linode.engine.wait_for_record_async', wait_for_record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return outcomes
+
+    def test_launch_failure_cancels_dns_wait(self):
+        outcomes = self.patch_unresolved()
+        self.fake.fail('linode.boot')
+        self.assertRaises(
+            Exception, self.provider.launch_instance, PARAMS)
+        deadline = time.time() + 5
+        while not outcomes and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(map(type, outcomes), [CancelledError])
+        self.assertEqual(self.fake.linodes, {})
+
+    def test_launch_failure_cancels_dns_wait_async(self):
+        outcomes = self.patch_unresolved()
+        self.fake.fail('linode.boot')
+        started = time.time()
+        self.assertRaises(Exception, self.run_loop, lambda loop: (
+            self.provider.launch_instance_async(loop, PARAMS)))
+        self.assertLess(time.time() - started, 10)
+        self.assertEqual(map(type, outcomes), [CancelledError])
+        self.assertEqual(self.fake.linodes, {})
+
+    def test_instance_index(self):
+        fake, provider = self.fake, self.provider
+        created = [provider.client.create_linode_instace(2, 1)
+                   for n in range(3)]
+
+        calls = dict(fake.calls)
+        instances = provider.get_instance_index()
+        self.assertEqual(len(instances), 3)
+        self.assertEqual(fake.calls['linode.list'] - calls['linode.list'], 1)
+        self.assertEqual(fake.calls['linode.ip.list'] -
+                         calls.get('linode.ip.list', 0), 1)
+
+        first, second, third = created
+        self.assertEqual(
+            instances.find(first.linodeid).linodeid, first.linodeid)
+        self.assertEqual(instances.find(
+            None, second.ip_addresses[0]).linodeid, second.linodeid)
+        self.assertEqual(instances.find(
+            None, "%s.example.com" % third.label).linodeid, third.linodeid)
+        self.assertEqual(instances.find(None, '10.9.9.9'), None)
+
+        # Indexed instances are terminated without being looked up again.
+        calls = dict(fake.calls)
+        provider.terminate_instance(instances.find(first.linodeid))
+        self.assertEqual(fake.calls['linode.list'], calls['linode.list'])
+        self.assertEqual(sorted(fake.linodes),
+                         sorted([second.linodeid, third.linodeid]))
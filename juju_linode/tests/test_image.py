@@ -0,0 +1,90 @@
+import mock
+
+from juju_linode.client import Disk, Image
+from juju_linode.exceptions import TimeoutError
+from juju_linode.image import GoldenImage
+
+from base import Base
+from test_waiter import FakeClock
+
+
+def image(imageid, label, status='available', env='linode'):
+    return Image.from_dict(dict(
+        imageid=imageid, label=label, status=status,
+        description=env and 'juju env %s: stackscript' % env or ''))
+
+
+class GoldenImageTest(Base):
+
+    def setUp(self):
+        self.provider = mock.MagicMock()
+        self.client = self.provider.client
+        self.clock = FakeClock()
+        self.golden = GoldenImage(
+            self.provider, 1234, 'trusty', env_name='linode',
+            build_timeout=60, sleep=self.clock.sleep, clock=self.clock.time)
+
+    def test_cached_image(self):
+        self.client.get_images.return_value = [
+            image(1, 'juju-1234-precise'), image(2, 'juju-1234-trusty')]
+        self.assertEqual(self.golden.get_image_id(2, 1), 2)
+        self.assertEqual(self.golden.get_image_id(2, 1), 2)
+        self.assertEqual(self.client.get_images.call_count, 1)
+        self.assertFalse(self.provider.launch_instance.called)
+
+    @mock.patch('juju_linode.image.ControlMasters')
+    @mock.patch('juju_linode.image.ssh')
+    def test_build_invalidates_stale(self, mock_ssh, masters_cls):
+        stale = image(1, 'juju-999-trusty')
+        self.client.get_images.return_value = [
+            stale, image(3, 'other', env=None),
+            image(4, 'juju-1234-trusty', 'deleted'),
+            # Built by another environment, or by hand.
+            image(5, 'juju-999-precise', env='staging'),
+            image(6, 'juju-998-trusty', env=None)]
+        instance = self.provider.launch_instance.return_value
+        instance.ip_addresses = ['10.0.0.1']
+        self.client.get_linode_disks.return_value = [
+            Disk.from_dict(dict(diskid=8, linodeid=5, type='swap')),
+            Disk.from_dict(dict(diskid=9, linodeid=5, type='ext4'))]
+        self.client.linode_disk_imagize.return_value = {
+            'JobID': 7, 'ImageID': 11}
+
+        self.assertEqual(self.golden.get_image_id(2, 1), 11)
+        self.assertTrue(self.client.linode_disk_imagize.call_args[0][2]
+                        .startswith('juju env linode:'))
+
+        self.client.delete_image.assert_called_once_with(stale)
+        self.provider.launch_instance.assert_called_once_with(
+            dict(datacenter_id=2, plan_id=1, domain_postfix=None),
+            claim=False, from_image=False)
+        # Package steps share the build host's ssh master.
+        masters = masters_cls.return_value
+        masters.open.assert_called_once_with('10.0.0.1')
+        mock_ssh.update_instance.assert_called_once_with(
+            '10.0.0.1', options=masters.options)
+        mock_ssh.install_packages.assert_called_once_with(
+            '10.0.0.1', self.golden.packages, options=masters.options)
+        mock_ssh.reset_host_keys.assert_called_once_with(
+            '10.0.0.1', options=masters.options)
+        masters.close.assert_called_once_with()
+        disk = self.client.linode_disk_imagize.call_args[0][0]
+        self.assertEqual(disk.diskid, 9)
+        self.provider.terminate_instance.assert_called_once_with(
+            instance.linodeid)
+
+    def test_wait_for_image_in_progress(self):
+        self.client.get_images.side_effect = [
+            [image(2, 'juju-1234-trusty', 'pending')],
+            [image(2, 'juju-1234-trusty', 'pending')],
+            [image(2, 'juju-1234-trusty')]]
+        self.assertEqual(self.golden.get_image_id(2, 1), 2)
+        self.assertFalse(self.provider.launch_instance.called)
+        self.assertFalse(self.client.delete_image.called)
+        self.assertEqual(len(self.clock.sleeps), 2)
+
+    def test_wait_for_image_timeout(self):
+        self.client.get_images.return_value = [
+            image(2, 'juju-1234-trusty', 'pending')]
+        self.assertRaises(TimeoutError, self.golden.get_image_id, 2, 1)
+        self.assertFalse(self.provider.launch_instance.called)
@@ -0,0 +1,89 @@
+import mock
+
+from juju_linode.client import Client
+from juju_linode.exceptions import ProviderAPIError
+from juju_linode.poller import JobPoller, Watch
+from juju_linode.runner import Future
+
+from base import Base
+
+
+def job_info(jobid, linodeid):
+    return {'JOBID': jobid, 'LINODEID': linodeid, 'ACTION': 'linode.boot',
+            'LABEL': '', 'ENTERED_DT': '', 'HOST_START_DT': '',
+            'HOST_FINISH_DT': '', 'DURATION': '', 'HOST_MESSAGE': '',
+            'HOST_SUCCESS': ''}
+
+
+class FutureTest(Base):
+
+    def test_future(self):
+        f = Future()
+        self.assertFalse(f.done())
+        f.set_result(3)
+        self.assertEqual(f.result(), 3)
+
+        f = Future()
+        f.set_exception(ValueError())
+        self.assertRaises(ValueError, f.result)
+
+
+class JobPollerTest(Base):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.client.make_linode_job = Client('xyz').make_linode_job
+        self.poller = JobPoller(self.client, sleep=lambda i: None)
+
+    def instance(self, linodeid):
+        return mock.MagicMock(linodeid=linodeid)
+
+    def test_tick_single_request(self):
+        self.client.request_batch.return_value = [
+            ([job_info(10, 1)], []),
+            ([], []),
+            ([], [{'ERRORCODE': 5}])]
+        watches = [Watch(1, [10]), Watch(1, [11]), Watch(2), Watch(3)]
+        self.poller.tick(watches)
+        self.assertEqual(self.client.request_batch.call_count, 1)
+        self.assertEqual(
+            len(self.client.request_batch.call_args[0][0]), 3)
+        self.assertFalse(watches[0].done())
+        self.assertEqual(watches[1].result(), True)
+        self.assertEqual(watches[2].result(), True)
+        self.assertRaises(ProviderAPIError, watches[3].result)
+
+    def test_tick_transient_errors(self):
+        self.poller.max_errors = 2
+        limited = [{'ERRORCODE': 14}]
+        self.client.request_batch.return_value = [([], limited)]
+        watch = Watch(1)
+        self.poller.tick([watch])
+        self.assertFalse(watch.done())
+        # Errors only fail the watch when consecutive.
+        self.client.request_batch.return_value = [([job_info(10, 1)], [])]
+        self.poller.tick([watch])
+        self.client.request_batch.return_value = [([], limited)]
+        self.poller.tick([watch])
+        self.assertFalse(watch.done())
+        self.poller.tick([watch])
+        self.assertRaises(ProviderAPIError, watch.result)
+
+    def test_watch_tick_failure(self):
+        error = ProviderAPIError([{'ERRORCODE': 12}])
+        self.client.request_batch.side_effect = [error, [([], [])]]
+        watch = self.poller.watch(self.instance(1))
+        self.assertEqual(watch.result(timeout=5), True)
+
+        self.client.request_batch.side_effect = [
+            ProviderAPIError([{'ERRORCODE': 5}])]
+        watch = self.poller.watch(self.instance(1))
+        self.assertRaises(ProviderAPIError, watch.result, 5)
+
+    def test_watch(self):
+        self.client.request_batch.side_effect = [
+            [([job_info(10, 1)], [])],
+            [([], [])]]
+        watch = self.poller.watch(self.instance(1), [10])
+        self.assertEqual(watch.result(timeout=5), True)
+        self.assertEqual(self.poller.ticks, 2)
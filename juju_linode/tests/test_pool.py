@@ -0,0 +1,134 @@
+import mock
+
+from juju_linode.client import LinodeInstace
+from juju_linode.commands import BaseCommand
+from juju_linode.pool import (
+    LISTING_TTL, WarmPool, pool_group, parse_pool_group)
+from juju_linode.runner import Runner
+
+from base import Base
+
+
+def instance(linodeid, group, status=1):
+    return LinodeInstace.from_dict(dict(
+        linodeid=linodeid, label='linode%d' % linodeid,
+        lpm_displaygroup=group, status=status))
+
+
+class WarmPoolTest(Base):
+
+    def setUp(self):
+        self.provider = mock.MagicMock()
+        self.client = self.provider.client
+        self.pool = WarmPool(
+            self.provider, claimed_group='env', sleep=lambda s: None)
+        self.provider.pool = self.pool
+        self.client.get_linode_instaces.return_value = [
+            instance(1, pool_group(2, 1), status=0),
+            instance(2, pool_group(2, 1)),
+            instance(3, pool_group(3, 1)),
+            instance(4, 'env')]
+        # Display groups as the api has them.
+        self.groups = dict([
+            (i.linodeid, i.lpm_displaygroup)
+            for i in self.client.get_linode_instaces.return_value])
+        self.client.get_linode_instace.side_effect = (
+            lambda linodeid: instance(linodeid, self.groups[linodeid]))
+
+        def update_linode(i, LPM_DisplayGroup):
+            self.groups[i.linodeid] = LPM_DisplayGroup
+        self.client.update_linode.side_effect = update_linode
+
+    def test_parse_pool_group(self):
+        self.assertEqual(parse_pool_group('juju-pool-2-1'), ('2', '1'))
+        self.assertEqual(parse_pool_group('env'), None)
+        self.assertEqual(parse_pool_group(''), None)
+
+    def test_members(self):
+        members = self.pool.members()
+        self.assertEqual(sorted(members), [('2', '1'), ('3', '1')])
+        self.assertEqual(
+            [i.linodeid for i in self.pool.members(2, 1)[('2', '1')]],
+            [1, 2])
+
+    def test_claim(self):
+        claimed = self.pool.claim(2, 1)
+        self.assertEqual(claimed.linodeid, 2)
+        self.assertEqual(claimed.lpm_displaygroup, 'env')
+        self.assertEqual(self.groups[2], 'env')
+        # Moved to a group of its own first, and read back.
+        groups = [c[1]['LPM_DisplayGroup']
+                  for c in self.client.update_linode.call_args_list]
+        self.assertTrue(groups[0].startswith('juju-claim-'))
+        self.assertEqual(groups[1], 'env')
+        # Replacing it is left to the caller.
+        self.assertFalse(self.provider.launch_instance.called)
+        self.assertEqual(self.pool.take_refills(), [(2, 1)])
+        self.assertEqual(self.pool.take_refills(), [])
+
+    def test_claims_share_listing(self):
+        self.client.get_linode_instaces.return_value.append(
+            instance(5, pool_group(2, 1)))
+        self.groups[5] = pool_group(2, 1)
+        self.assertEqual(self.pool.claim(2, 1).linodeid, 2)
+        self.assertEqual(self.pool.claim(2, 1).linodeid, 5)
+        self.assertEqual(self.pool.claim(2, 1), None)
+        self.assertEqual(self.client.get_linode_instaces.call_count, 1)
+
+    def test_listing_expires(self):
+        now = [0]
+        self.pool.clock = lambda: now[0]
+        self.pool.claim(4, 1)
+        now[0] = LISTING_TTL
+        self.pool.claim(4, 1)
+        self.assertEqual(self.client.get_linode_instaces.call_count, 2)
+
+    def test_claim_empty(self):
+        self.assertEqual(self.pool.claim(4, 1), None)
+        self.assertFalse(self.client.update_linode.called)
+        self.assertEqual(self.pool.take_refills(), [])
+
+    def test_claim_taken(self):
+        # Claimed elsewhere since the listing.
+        self.groups[2] = 'other'
+        self.assertEqual(self.pool.claim(2, 1), None)
+        self.assertFalse(self.client.update_linode.called)
+
+    def test_claim_lost_race(self):
+        self.client.get_linode_instaces.return_value.append(
+            instance(5, pool_group(2, 1)))
+        self.groups[5] = pool_group(2, 1)
+
+        def sleep(seconds):
+            # Another process claims linode 2 while ours settles.
+            if self.groups[2].startswith('juju-claim-'):
+                self.groups[2] = 'juju-claim-other'
+        self.pool.sleep = sleep
+
+        claimed = self.pool.claim(2, 1)
+        self.assertEqual(claimed.linodeid, 5)
+        self.assertEqual(self.groups[2], 'juju-claim-other')
+        self.assertEqual(self.groups[5], 'env')
+
+    def test_fill(self):
+        self.provider.launch_instance.return_value = instance(5, '')
+        self.groups[5] = ''
+        self.pool.fill(2, 1)
+        self.provider.launch_instance.assert_called_once_with(
+            dict(datacenter_id=2, plan_id=1, domain_postfix=None),
+            claim=False)
+        self.assertEqual(self.groups[5], 'juju-pool-2-1')
+
+
+class RefillPoolTest(Base):
+
+    def test_refill_pool(self):
+        provider = mock.MagicMock()
+        provider.pool.take_refills.return_value = [(2, 1), (2, 1)]
+        # a plain function, mocks lazily create children racing threads
+        filled = []
+        provider.pool.fill = lambda *args: filled.append(args)
+        cmd = BaseCommand(mock.MagicMock(), provider, mock.MagicMock())
+        cmd.runner = Runner(2)
+        cmd.refill_pool()
+        self.assertEqual(filled, [(2, 1), (2, 1)])
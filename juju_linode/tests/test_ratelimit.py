@@ -0,0 +1,95 @@
+import json
+
+from juju_linode.client import Client
+from juju_linode.exceptions import ProviderAPIError
+from juju_linode.ratelimit import RateLimiter, TokenBucket, is_read
+
+from base import Base
+from test_client import FakeTransport
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(Base):
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 3, clock, clock.sleep)
+        for i in range(3):
+            bucket.acquire()
+        self.assertEqual(clock.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(clock.sleeps, [0.5])
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10, 10, clock, clock.sleep)
+        bucket.pause(4)
+        bucket.acquire()
+        self.assertEqual(clock.sleeps, [4])
+
+
+class RateLimiterTest(Base):
+
+    def test_bucket(self):
+        limiter = RateLimiter()
+        self.assertTrue(is_read('avail.linodeplans'))
+        self.assertIs(limiter.bucket(['linode.list']), limiter.reads)
+        self.assertIs(limiter.bucket(
+            ['linode.list', 'linode.boot']), limiter.writes)
+
+    def test_throttled_backoff(self):
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        self.assertEqual(
+            [limiter.throttled() for i in range(3)], [1.0, 2.0, 4.0])
+        limiter.succeeded()
+        self.assertEqual(limiter.throttled(), 1.0)
+        self.assertEqual(limiter.throttled_count, 4)
+
+
+class ClientRateLimitTest(Base):
+
+    def get_client(self, responses):
+        self.clock = FakeClock()
+        limiter = RateLimiter(clock=self.clock, sleep=self.clock.sleep)
+        transport = FakeTransport(responses)
+        return Client('xyz', transport, limiter=limiter), transport
+
+    def test_request_retried(self):
+        replies = [ProviderAPIError([{'ERRORCODE': 14}]), {'JobID': 1}]
+        client, transport = self.get_client({
+            'linode.boot': lambda p: replies.pop(0)})
+        self.assertEqual(client.request('linode.boot'), {'JobID': 1})
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+    def test_batch_retries_limited_actions(self):
+        limited = set([2])
+
+        def ip_list(params):
+            linode_id = params['LinodeID']
+            if linode_id in limited:
+                limited.remove(linode_id)
+                return ProviderAPIError([{'ERRORCODE': 14}])
+            return [{'LINODEID': linode_id, 'IPADDRESS': 'ip%d' % linode_id}]
+
+        client, transport = self.get_client({'linode.ip.list': ip_list})
+        self.assertEqual(client.get_linode_ip_map([1, 2, 3]), {
+            1: ['ip1'], 2: ['ip2'], 3: ['ip3']})
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(
+            json.loads(transport.calls[1]['api_requestArray']),
+            [{'api_action': 'linode.ip.list', 'LinodeID': 2}])
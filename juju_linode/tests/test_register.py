@@ -0,0 +1,128 @@
+import os
+import subprocess
+import threading
+import time
+
+import mock
+
+from juju_linode.register import ControlMasters, Registrar
+
+from base import Base
+
+
+class ControlMastersTest(Base):
+
+    def setUp(self):
+        root = os.path.join(self.mkdir(), 'ssh')
+        os.mkdir(root)
+        self.masters = ControlMasters(60, root=root)
+
+    @mock.patch('juju_linode.ssh.check_ssh')
+    def test_open_once_per_host(self, check_ssh):
+        self.assertTrue(self.masters.open('10.0.0.1', 'ubuntu'))
+        self.assertTrue(self.masters.open('10.0.0.1', 'ubuntu'))
+        self.assertTrue(self.masters.open('10.0.0.2', 'ubuntu'))
+        self.assertEqual(check_ssh.call_args_list, [
+            mock.call('10.0.0.1', 'ubuntu', options=self.masters.options),
+            mock.call('10.0.0.2', 'ubuntu', options=self.masters.options)])
+        self.assertIn(
+            "ControlPath=%s/%%r@%%h:%%p" % self.masters.root,
+            self.masters.options)
+
+    @mock.patch('juju_linode.ssh.check_ssh')
+    def test_open_concurrently(self, check_ssh):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_check(host, user, options):
+            started.set()
+            release.wait(5)
+        check_ssh.side_effect = slow_check
+
+        threads = [threading.Thread(
+            target=self.masters.open, args=('10.0.0.1', 'ubuntu'))
+            for n in range(3)]
+        for t in threads:
+            t.start()
+        started.wait(5)
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(check_ssh.call_count, 1)
+
+    @mock.patch('juju_linode.ssh.check_ssh')
+    def test_open_unreachable(self, check_ssh):
+        check_ssh.side_effect = subprocess.CalledProcessError(
+            255, ['ssh'], 'Connection refused')
+        self.assertFalse(self.masters.open('10.0.0.1'))
+        self.assertEqual(self.masters.hosts, set())
+
+    def test_environ(self):
+        env = self.masters.environ({'PATH': '/usr/bin'})
+        bin_dir, rest = env['PATH'].split(os.pathsep, 1)
+        self.assertEqual(rest, '/usr/bin')
+        with open(os.path.join(bin_dir, 'ssh')) as fh:
+            script = fh.read()
+        self.assertTrue(script.startswith("#!/bin/sh\nexec /usr/bin/ssh"))
+        self.assertIn("ControlMaster=auto", script)
+        self.assertIn('"$@"', script)
+        self.assertTrue(os.access(os.path.join(bin_dir, 'ssh'), os.X_OK))
+
+    @mock.patch('subprocess.check_output')
+    @mock.patch('juju_linode.ssh.check_ssh')
+    def test_close(self, check_ssh, check_output):
+        self.masters.open('10.0.0.1', 'ubuntu')
+        self.masters.close()
+        cmd = check_output.call_args[0][0]
+        self.assertEqual(cmd[-3:], ['-O', 'exit', 'ubuntu@10.0.0.1'])
+        self.assertFalse(os.path.exists(self.masters.root))
+
+
+class RegistrarTest(Base):
+
+    def test_register(self):
+        env = mock.MagicMock()
+        env.add_machine.return_value = "created machine 1"
+        masters = mock.MagicMock()
+        masters.environ.return_value = {'PATH': '/wrapper'}
+        registrar = Registrar(env, masters)
+        registrar.register('10.0.0.1')
+        masters.open.assert_called_once_with('10.0.0.1', 'ubuntu')
+        env.add_machine.assert_called_once_with(
+            "ssh:ubuntu@10.0.0.1", env={'PATH': '/wrapper'})
+
+    def test_register_without_master(self):
+        env = mock.MagicMock()
+        masters = mock.MagicMock()
+        masters.open.return_value = False
+        Registrar(env, masters).register('10.0.0.1')
+        env.add_machine.assert_called_once_with(
+            "ssh:ubuntu@10.0.0.1", env=None)
+
+    def test_max_concurrent(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0, 'calls': 0}
+
+        def add_machine(location, env=None):
+            with lock:
+                state['calls'] += 1
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+
+        env = mock.MagicMock()
+        env.add_machine = add_machine
+        registrar = Registrar(env, mock.MagicMock(), max_concurrent=2)
+        threads = [threading.Thread(
+            target=registrar.register, args=('10.0.0.%d' % n,))
+            for n in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # Counted here, mock's own call counting isn't thread safe.
+        self.assertEqual(state['calls'], 6)
+        self.assertEqual(state['peak'], 2)
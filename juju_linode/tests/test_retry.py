@@ -0,0 +1,174 @@
+import requests
+from requests.packages.urllib3.exceptions import (
+    MaxRetryError, NewConnectionError, ProtocolError)
+
+from juju_linode.client import Client
+from juju_linode.domain_manager import DomainManager
+from juju_linode.exceptions import (
+    AmbiguousAPIError, ConfigError, ProviderAPIError, TimeoutError,
+    TransientAPIError)
+from juju_linode.provider import Linode
+from juju_linode.retry import (
+    AMBIGUOUS, REJECTED, Retrier, RetryBudget, RetryPolicy, classify)
+
+from base import Base
+from test_client import FakeTransport
+
+
+def failing(errors, result='ok'):
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return call
+
+
+class RetryTest(Base):
+
+    def get_retrier(self, **kw):
+        self.sleeps = []
+        return Retrier(sleep=self.sleeps.append, rand=lambda: 0, **kw)
+
+    def test_classify(self):
+        self.assertEqual(
+            classify(ProviderAPIError([{'ERRORCODE': 14}])), REJECTED)
+        self.assertEqual(
+            classify(ProviderAPIError([{'ERRORCODE': 12}])), AMBIGUOUS)
+        self.assertEqual(classify(ProviderAPIError([{'ERRORCODE': 5}])), None)
+        self.assertEqual(classify(requests.ConnectTimeout()), REJECTED)
+        self.assertEqual(classify(requests.ReadTimeout()), AMBIGUOUS)
+        self.assertEqual(classify(KeyError()), None)
+        self.assertEqual(classify(AmbiguousAPIError('garbled')), AMBIGUOUS)
+        # The plugin's own ValueError subclasses aren't api failures.
+        self.assertEqual(classify(TimeoutError('ssh')), None)
+        self.assertEqual(classify(ConfigError('bad')), None)
+        self.assertEqual(classify(ValueError()), None)
+
+    def test_classify_connection_errors(self):
+        refused = NewConnectionError(None, "Connection refused")
+        self.assertEqual(classify(requests.ConnectionError(
+            MaxRetryError(None, '/', refused))), REJECTED)
+        # Dropped after the request went out.
+        self.assertEqual(classify(requests.ConnectionError(
+            ProtocolError("Connection aborted."))), AMBIGUOUS)
+        self.assertEqual(classify(requests.ConnectionError()), AMBIGUOUS)
+
+    def test_policies(self):
+        retrier = Retrier.from_config({})
+        self.assertEqual(retrier.policy('linode.list').attempts, 8)
+        self.assertEqual(retrier.policy('avail.plans').attempts, 8)
+        self.assertEqual(retrier.policy('linode.boot').attempts, 4)
+        self.assertEqual(retrier.policy('linode.create').attempts, 2)
+
+    def test_backoff(self):
+        retrier = self.get_retrier()
+        call = failing([requests.ReadTimeout()] * 3)
+        self.assertEqual(retrier.call(['linode.list'], call), 'ok')
+        self.assertEqual(self.sleeps, [0.5, 1.0, 2.0])
+        self.assertEqual(retrier.stats.actions['linode.list'], {
+            'retries': 3, 'recovered': 1})
+
+    def test_jitter(self):
+        policy = RetryPolicy(initial=1.0, jitter=0.5)
+        self.assertEqual(policy.delay(2, lambda: 1), 2.0)
+        self.assertEqual(policy.delay(2, lambda: 0), 4.0)
+
+    def test_not_idempotent(self):
+        retrier = self.get_retrier()
+        call = failing([requests.ReadTimeout()])
+        self.assertRaises(
+            requests.ReadTimeout, retrier.call, ['linode.create'], call)
+        call = failing([TransientAPIError('busy')])
+        self.assertEqual(retrier.call(['linode.create'], call), 'ok')
+
+    def test_attempts_exhausted(self):
+        retrier = self.get_retrier(default=RetryPolicy(attempts=2))
+        call = failing([requests.ReadTimeout()] * 2)
+        self.assertRaises(
+            requests.ReadTimeout, retrier.call, ['linode.list'], call)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_budget(self):
+        retrier = self.get_retrier(budget=RetryBudget(ratio=0, minimum=1))
+        retrier.call(['linode.list'], failing([requests.ReadTimeout()]))
+        self.assertRaises(
+            requests.ReadTimeout, retrier.call, ['linode.list'],
+            failing([requests.ReadTimeout()]))
+        self.assertEqual(
+            retrier.stats.actions['linode.list']['over-budget'], 1)
+
+
+class ClientRetryTest(Base):
+
+    def test_request_retried(self):
+        replies = [ProviderAPIError([{'ERRORCODE': 12}]), [{'LINODEID': 1}]]
+        transport = FakeTransport({
+            'linode.list': lambda p: replies.pop(0)})
+        client = Client('xyz', transport, retrier=Retrier(
+            sleep=lambda s: None))
+        self.assertEqual(client.request('linode.list'), [{'LINODEID': 1}])
+        self.assertEqual(len(transport.calls), 2)
+
+
+    def test_invalid_json_retried(self):
+        class Response(object):
+            def json(self):
+                raise ValueError("No JSON object could be decoded")
+
+        class Transport(object):
+            calls = 0
+
+            def request(self, method, url, **kw):
+                self.calls += 1
+                return Response()
+
+        transport = Transport()
+        client = Client('xyz', transport, retrier=Retrier(
+            sleep=lambda s: None, default=RetryPolicy(attempts=2)))
+        self.assertRaises(AmbiguousAPIError, client.request, 'linode.list')
+        self.assertEqual(transport.calls, 2)
+        transport.calls = 0
+        self.assertRaises(AmbiguousAPIError, client.request, 'linode.create')
+        self.assertEqual(transport.calls, 1)
+
+
+class SharedRetrierTest(Base):
+
+    def test_shared(self):
+        provider = Linode({
+            'linode-api-key': 'xyz',
+            'domain-manager-api-url': 'http://dns'})
+        self.addCleanup(provider.close)
+        self.assertTrue(provider.client.retrier is provider.retrier)
+        self.assertTrue(provider.domain_manager.retrier is provider.retrier)
+
+
+class DomainManagerRetryTest(Base):
+
+    def get_manager(self, statuses):
+        class Transport(object):
+            def request(self, method, url, **kw):
+                response = requests.Response()
+                response.status_code = statuses.pop(0)
+                response._content = ''
+                return response
+
+        return DomainManager(
+            'http://dns', 'user', 'pass', Transport(),
+            Retrier(sleep=lambda s: None))
+
+    def test_rejected_retried(self):
+        statuses = [503, 200]
+        manager = self.get_manager(statuses)
+        self.assertTrue(manager.create_subdomain('a.example.com', '1.2.3.4'))
+        self.assertEqual(statuses, [])
+
+    def test_gateway_timeout_not_retried(self):
+        statuses = [504, 200]
+        manager = self.get_manager(statuses)
+        self.assertRaises(
+            AmbiguousAPIError, manager.create_subdomain,
+            'a.example.com', '1.2.3.4')
+        self.assertEqual(statuses, [200])
@@ -1,4 +1,7 @@
 
+import time
+
+from juju_linode.exceptions import CancelledError
 from juju_linode.runner import Runner
 from base import Base
 
@@ -15,6 +18,23 @@ class FakeBadOp(object):
         return ValueError("Bad")
 
 
+class FakeRaisingOp(object):
+
+    def run(self):
+        raise ValueError("Bad")
+
+
+class SlowOp(object):
+
+    def __init__(self, value, delay):
+        self.value = value
+        self.delay = delay
+
+    def run(self):
+        time.sleep(self.delay)
+        return self.value
+
+
 class RunnerTest(Base):
 
     def test_auto_runner(self):
@@ -34,3 +54,40 @@ class RunnerTest(Base):
         results = list(runner.iter_results())
         self.assertEqual(len(results), 2)
         runner.stop()
+
+    def test_queue_op_future(self):
+        runner = Runner(2)
+        future = runner.queue_op(FakeOp())
+        bad = runner.queue_op(FakeBadOp())
+        completed = list(runner.as_completed())
+        self.assertEqual(set(completed), set([future, bad]))
+        self.assertEqual(future.result(), 1)
+        self.assertIsInstance(bad.exception(), ValueError)
+        self.assertFalse(runner.started)
+
+    def test_iter_ordered(self):
+        runner = Runner(3)
+        for i in range(5):
+            runner.queue_op(SlowOp(i, (5 - i) * 0.01))
+        self.assertEqual(list(runner.iter_ordered()), range(5))
+
+    def test_fail_fast(self):
+        runner = Runner(1, fail_fast=1)
+        ok = runner.queue_op(FakeOp())
+        runner.queue_op(FakeRaisingOp())
+        rest = [runner.queue_op(FakeOp()) for i in range(3)]
+        self.assertEqual(list(runner.iter_results()), [1])
+        self.assertEqual(ok.result(), 1)
+        self.assertTrue(all([f.cancelled() for f in rest]))
+        self.assertRaises(CancelledError, rest[0].result)
+
+    def test_long_lived_pool(self):
+        runner = Runner(2)
+        runner.start(2)
+        runner.queue_op(FakeOp())
+        self.assertEqual(list(runner.iter_results()), [1])
+        runner.queue_op(SlowOp(2, 0))
+        self.assertEqual(list(runner.iter_results()), [2])
+        self.assertTrue(all([r.is_alive() for r in runner.runners]))
+        runner.stop()
+        self.assertEqual(runner.runners, [])
@@ -0,0 +1,97 @@
+from juju_linode import constraints
+from juju_linode.client import DataCenter, Plan
+from juju_linode.constraints import (
+    init, solve_constraints, find_plan, find_datacenter, get_datacenter)
+from juju_linode.exceptions import ConstraintError
+
+from base import Base
+
+
+PLANS = [
+    dict(planid=1, label='Linode 1024', cores=1, ram=1024, disk=24,
+         price=10.0, hourly=0.015, xfer=2000,
+         avail={'2': 500, '3': 500, '4': 0}),
+    dict(planid=2, label='Linode 2048', cores=2, ram=2048, disk=48,
+         price=20.0, hourly=0.03, xfer=3000,
+         avail={'2': 500, '3': 500, '4': 500}),
+    dict(planid=4, label='Linode 4096', cores=4, ram=4096, disk=96,
+         price=40.0, hourly=0.06, xfer=4000,
+         avail={'2': 500, '3': 0, '4': 500}),
+    dict(planid=6, label='Linode 8192', cores=6, ram=8192, disk=192,
+         price=80.0, hourly=0.12, xfer=8000,
+         avail={'2': 500, '3': 500, '4': 500})]
+
+DATACENTERS = [
+    dict(datacenterid=2, abbr='dallas', location='Dallas, TX, USA'),
+    dict(datacenterid=3, abbr='fremont', location='Fremont, CA, USA'),
+    dict(datacenterid=4, abbr='atlanta', location='Atlanta, GA, USA')]
+
+
+class SolverBase(Base):
+
+    def setUp(self):
+        init(None, data={
+            'plans': map(Plan.from_dict, PLANS),
+            'datacenters': map(DataCenter.from_dict, DATACENTERS)})
+
+
+class IndexTest(SolverBase):
+
+    def test_find_plan(self):
+        for value in ('Linode 2048', 'linode  2048', '2048', 2):
+            self.assertEqual(find_plan(value).planid, 2)
+        self.assertEqual(find_plan('512'), None)
+
+    def test_find_datacenter(self):
+        for value in ('fremont', 'FREMONT', 'Fremont, CA, USA', '3'):
+            self.assertEqual(find_datacenter(value).datacenterid, 3)
+        self.assertEqual(get_datacenter(4).abbr, 'atlanta')
+
+    def test_defaults(self):
+        self.assertEqual(constraints.DEFAULT_PLAN, 1)
+        self.assertEqual(constraints.DEFAULT_DATACENTER, 2)
+
+    def test_solve_memoized(self):
+        solution = solve_constraints("datacenter=fremont,plan=2048")
+        self.assertEqual(solution, (2, 3, None))
+        self.assertIn("datacenter=fremont,plan=2048", constraints._SOLVED)
+        self.assertIs(
+            solve_constraints("datacenter=fremont,plan=2048"), solution)
+
+    def test_unknown(self):
+        self.assertRaises(
+            ConstraintError, solve_constraints, "datacenter=mars")
+        self.assertRaises(ConstraintError, solve_constraints, "plan=3")
+        self.assertRaises(ConstraintError, solve_constraints, "color=red")
+
+
+class SolverTest(SolverBase):
+
+    cases = [
+        ("", (1, 2, None)),
+        ("mem=2G", (2, 2, None)),
+        ("mem=1500", (2, 2, None)),
+        ("cores=3", (4, 2, None)),
+        ("cpu-cores=3, datacenter=fremont", (6, 3, None)),
+        ("root-disk=50G", (4, 2, None)),
+        ("mem=512M, datacenter=atlanta", (2, 4, None)),
+        ("mem=1G, arch=amd64, domain_postfix=example.com",
+         (1, 2, 'example.com'))]
+
+    def test_constraint_solving(self):
+        for c, solution in self.cases:
+            self.assertEqual(solve_constraints(c), solution)
+
+    def test_sorted_plans(self):
+        self.assertEqual(
+            [p.planid for p in constraints.SORTED_PLANS], [1, 2, 4, 6])
+
+    def test_unavailable_default_datacenter(self):
+        constraints.find_plan(6).avail['2'] = 0
+        self.addCleanup(constraints.find_plan(6).avail.update, {'2': 500})
+        self.assertEqual(solve_constraints("mem=8G"), (6, 3, None))
+
+    def test_unsatisfiable(self):
+        for c in ("mem=64G", "plan=1024, mem=2G", "plan=4096, datacenter=3",
+                  "arch=i386", "mem=lots"):
+            self.assertRaises(ConstraintError, solve_constraints, c)
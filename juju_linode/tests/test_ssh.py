@@ -0,0 +1,76 @@
+import socket
+import threading
+
+import mock
+
+from juju_linode.engine import ThreadLoop, wait_for_ssh_async
+from juju_linode.exceptions import TimeoutError
+from juju_linode.ssh import HOST_KEYS_JOB, probe_ssh, reset_host_keys
+
+from base import Base
+from test_waiter import FakeClock
+
+
+class SSHProbeTest(Base):
+
+    def listen(self, banner):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+
+        def accept():
+            conn, _ = server.accept()
+            conn.sendall(banner)
+            conn.close()
+
+        thread = threading.Thread(target=accept)
+        thread.daemon = True
+        thread.start()
+        return server.getsockname()[1]
+
+    def test_probe_banner(self):
+        port = self.listen('SSH-2.0-OpenSSH_6.6.1p1 Ubuntu\r\n')
+        self.assertTrue(probe_ssh('127.0.0.1', port))
+
+    def test_probe_bad_banner(self):
+        port = self.listen('HTTP/1.1 400 Bad Request\r\n')
+        self.assertFalse(probe_ssh('127.0.0.1', port))
+
+    def test_probe_closed(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.assertFalse(probe_ssh('127.0.0.1', port))
+
+    def test_wait_for_ssh(self):
+        clock = FakeClock()
+        loop = ThreadLoop(clock=clock.time, sleep=clock.sleep)
+        results = [False, False, True]
+        elapsed = loop.run(wait_for_ssh_async(
+            loop, '10.0.0.1', probe=lambda h, p, banner: results.pop(0)))
+        self.assertEqual(elapsed, 1.25)
+
+    def test_wait_for_ssh_timeout(self):
+        clock = FakeClock()
+        loop = ThreadLoop(clock=clock.time, sleep=clock.sleep)
+        self.assertRaises(
+            TimeoutError, loop.run, wait_for_ssh_async(
+                loop, '10.0.0.1', timeout=10,
+                probe=lambda h, p, banner: False))
+
+
+class HostKeysTest(Base):
+
+    @mock.patch('subprocess.Popen')
+    def test_reset_host_keys(self, popen):
+        process = popen.return_value
+        process.communicate.return_value = ('', None)
+        process.returncode = 0
+        reset_host_keys('10.0.0.1', options=['-o', 'ControlPath=x'])
+        cmd = popen.call_args[1]['args']
+        self.assertEqual(cmd[-3:-1], ['ControlPath=x', 'root@10.0.0.1'])
+        self.assertIn("rm -f /etc/ssh/ssh_host_*", cmd[-1])
+        process.communicate.assert_called_once_with(HOST_KEYS_JOB)
+        self.assertIn("ssh-keygen -A", HOST_KEYS_JOB)
@@ -0,0 +1,125 @@
+import threading
+
+from juju_linode.status import (
+    StatusSnapshot, StatusWatcher, parse_linode_id)
+
+from base import Base
+
+
+STATUS = {
+    'machines': {
+        '0': {'dns-name': '10.0.1.23', 'instance-id': 'manual:10.0.1.23'},
+        '1': {'dns-name': '10.0.1.25',
+              'instance-id': 'manual:linode123456.example.com'}},
+    'services': {}}
+
+
+class FakeWatch(object):
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.running = True
+        self.done = threading.Event()
+
+    def __iter__(self):
+        for batch in self.batches:
+            yield batch
+        self.done.wait(5)
+
+    def stop(self):
+        self.running = False
+        self.done.set()
+
+
+class StatusSnapshotTest(Base):
+
+    def test_parse_linode_id(self):
+        self.assertEqual(parse_linode_id('linode123456'), '123456')
+        self.assertEqual(parse_linode_id('linode12'), None)
+        self.assertEqual(parse_linode_id('manual:10.0.1.2'), None)
+        self.assertEqual(parse_linode_id(None), None)
+
+    def test_lookups(self):
+        status = StatusSnapshot(STATUS)
+        self.assertEqual(status.get('machines'), STATUS['machines'])
+        self.assertEqual(status.address('1'), '10.0.1.25')
+        self.assertEqual(status.instance_id('0'), 'manual:10.0.1.23')
+        self.assertEqual(status.machine_by_address('10.0.1.23'), '0')
+        self.assertEqual(status.machine_by_linodeid(123456), '1')
+        self.assertEqual(status.machine_by_address('10.9.9.9'), None)
+        self.assertEqual(status.address('7'), None)
+
+    def test_from_api(self):
+        status = StatusSnapshot.from_api({
+            'EnvironmentName': 'linode',
+            'Machines': {'1': {
+                'DNSName': '1.1.1.1', 'InstanceId': 'manual:1.1.1.1',
+                'AgentState': 'started', 'Series': 'trusty'}},
+            'Services': {'mysql': {
+                'Charm': 'cs:trusty/mysql-1',
+                'Units': {'mysql/0': {'Machine': '1'}}}}}, fetched=5)
+        self.assertEqual(status['machines']['1'], {
+            'dns-name': '1.1.1.1', 'instance-id': 'manual:1.1.1.1',
+            'agent-state': 'started', 'series': 'trusty'})
+        self.assertEqual(
+            status['services']['mysql']['units'], {'mysql/0': {'machine': '1'}})
+        self.assertEqual(status.machine_by_address('1.1.1.1'), '1')
+        self.assertEqual(status.fetched, 5)
+
+    def test_apply(self):
+        status = StatusSnapshot(STATUS).copy()
+        self.assertTrue(status.apply('machine', 'change', {
+            'Id': '2', 'InstanceId': 'manual:10.0.1.30', 'Status': 'pending',
+            'Addresses': [
+                {'Value': '192.168.1.2', 'Scope': 'local-cloud'},
+                {'Value': '10.0.1.30', 'Scope': 'public'}]}))
+        self.assertTrue(status.apply('machine', 'remove', {'Id': '0'}))
+        self.assertFalse(status.apply('annotation', 'change', {}))
+        status.reindex()
+        self.assertEqual(sorted(status.machines), ['1', '2'])
+        self.assertEqual(status.machine_by_address('10.0.1.30'), '2')
+        self.assertEqual(status.machine_by_address('10.0.1.23'), None)
+        # The original is untouched.
+        self.assertEqual(sorted(STATUS['machines']), ['0', '1'])
+
+
+class StatusWatcherTest(Base):
+
+    def test_watch(self):
+        watch = FakeWatch([
+            [['machine', 'change', {
+                'Id': '0', 'InstanceId': 'manual:10.0.1.23',
+                'Addresses': [{'Value': '10.0.1.23'}]}],
+             ['service', 'change', {'Name': 'mysql', 'CharmURL': 'cs:mysql'}],
+             ['unit', 'change', {
+                 'Name': 'mysql/0', 'Service': 'mysql', 'MachineId': '0'}]]])
+        client = type('Client', (object,), {'get_watch': lambda s: watch})()
+        watcher = StatusWatcher(client, clock=lambda: 10).start()
+        status = watcher.current(timeout=5)
+        self.assertEqual(status.machine_by_address('10.0.1.23'), '0')
+        self.assertEqual(status['services']['mysql'], {
+            'charm': 'cs:mysql', 'units': {'mysql/0': {'machine': '0'}}})
+        self.assertEqual(status.fetched, 10)
+        watcher.stop()
+
+    def test_watch_stale(self):
+        watcher = StatusWatcher(None)
+        watcher.version = 1
+        watcher.snapshot = StatusSnapshot(STATUS)
+        watcher._ready.set()
+        self.assertEqual(watcher.current(), STATUS)
+
+        # After a change, nothing until newer deltas are published.
+        watcher.mark_stale()
+        self.assertEqual(watcher.current(), None)
+        watcher.version += 1
+        self.assertEqual(watcher.current(), STATUS)
+
+    def test_watch_failed(self):
+        class BrokenWatch(FakeWatch):
+            def __iter__(self):
+                raise IOError("connection lost")
+        client = type('Client', (object,), {
+            'get_watch': lambda s: BrokenWatch([])})()
+        watcher = StatusWatcher(client).start()
+        self.assertEqual(watcher.current(timeout=5), None)
@@ -0,0 +1,81 @@
+import mock
+
+from juju_linode.client import LinodeInstace
+from juju_linode.commands import TerminateMachine
+from juju_linode.provider import InstanceIndex
+from juju_linode.status import StatusSnapshot
+
+from base import Base
+
+
+def instance(linodeid, label, address):
+    return LinodeInstace.from_dict(dict(
+        linodeid=linodeid, label=label, ip_addresses=[address]))
+
+
+class TerminateMachinesTest(Base):
+
+    def setUp(self):
+        self.config = mock.MagicMock()
+        self.provider = mock.MagicMock()
+        self.env = mock.MagicMock()
+        self.cmd = TerminateMachine(self.config, self.provider, self.env)
+        self.cmd.runner = mock.MagicMock()
+        self.cmd.runner.iter_results.return_value = []
+
+        self.env.status.return_value = StatusSnapshot({'machines': {
+            '0': {'dns-name': '10.0.1.20', 'instance-id': 'manual:10.0.1.20'},
+            '1': {'dns-name': '10.0.1.23', 'instance-id': 'manual:10.0.1.23'},
+            '2': {'dns-name': 'app-2.example.com',
+                  'instance-id': 'manual:app-2.example.com'},
+            '3': {'dns-name': '10.0.1.99', 'instance-id': 'manual:10.0.1.99'}}})
+        self.provider.get_instance_index.return_value = InstanceIndex([
+            instance(220, 'app-0', '10.0.1.20'),
+            instance(221, 'app-1', '10.0.1.23'),
+            instance(222, 'app-2', '10.0.1.25')])
+
+    def test_single_juju_call_before_teardown(self):
+        calls = mock.MagicMock()
+        calls.attach_mock(self.env.terminate_machines, 'terminate_machines')
+        calls.attach_mock(self.cmd.runner.queue_op, 'queue_op')
+
+        status, instances = self.cmd._terminate_machines(
+            lambda mid, m: mid != '0')
+
+        names = [c[0] for c in calls.mock_calls]
+        self.assertEqual(names[0], 'terminate_machines')
+        self.assertEqual(names[1:], ['queue_op', 'queue_op'])
+        self.assertEqual(
+            sorted(self.env.terminate_machines.call_args[0][0]),
+            ['1', '2', '3'])
+
+        ops = sorted(
+            [c[0][0] for c in self.cmd.runner.queue_op.call_args_list],
+            key=lambda op: op.params['machine_id'])
+        self.assertEqual([op.params['instance'].linodeid for op in ops],
+                         [221, 222])
+        self.assertEqual([op.params['domain_name'] for op in ops],
+                         [None, 'app-2.example.com'])
+        self.assertTrue(all([op.options == {'iaas_only': True}
+                             for op in ops]))
+        # One listing resolved every machine.
+        self.provider.get_instance_index.assert_called_once_with()
+        self.assertFalse(self.provider.get_instance.called)
+
+    def test_select_machines(self):
+        self.env.status.return_value['machines']['4'] = {
+            'dns-name': '10.0.1.30',
+            'instance-id': 'manual:linode12345.members.linode.com'}
+        self.env.status.return_value.reindex()
+        self.config.options.machines = [
+            '1', '10.0.1.99', '12345', '0', '10.0.1.20', '7']
+        self.cmd._terminate_machines()
+        # The state server and unknown machines are skipped.
+        self.assertEqual(
+            sorted(self.env.terminate_machines.call_args[0][0]),
+            ['1', '3', '4'])
+
+    def test_nothing_to_terminate(self):
+        self.cmd._terminate_machines(lambda mid, m: False)
+        self.assertFalse(self.env.terminate_machines.called)
+        self.assertFalse(self.cmd.runner.queue_op.called)
@@ -0,0 +1,55 @@
+import mock
+
+from juju_linode.transport import Transport, CallStats
+
+from base import Base
+
+
+class CallStatsTest(Base):
+
+    def test_record(self):
+        stats = CallStats()
+        stats.record('linode.list', 0.5)
+        stats.record('linode.list', 1.5)
+        stats.record('linode.ip.list', 0.25)
+        self.assertEqual(stats.round_trips, 3)
+        self.assertEqual(stats.calls['linode.list'], (2, 2.0, 1.5))
+        self.assertEqual(len(stats.summary()), 2)
+
+
+class TransportTest(Base):
+
+    def test_from_config(self):
+        transport = Transport.from_config({'default-num-runner': 20})
+        self.assertEqual(transport.pool_size, 20)
+        self.assertEqual(transport.keep_alive, 60)
+
+    def test_session_is_shared(self):
+        transport = Transport()
+        self.assertIs(transport.get_session(), transport.get_session())
+
+    @mock.patch('juju_linode.transport.time')
+    def test_idle_session_discarded(self, mock_time):
+        transport = Transport(keep_alive=30)
+        mock_time.time.return_value = 100
+        session = transport.get_session()
+        mock_time.time.return_value = 120
+        self.assertIs(transport.get_session(), session)
+        mock_time.time.return_value = 151
+        self.assertIsNot(transport.get_session(), session)
+
+    def test_no_keep_alive(self):
+        transport = Transport(keep_alive=0)
+        self.assertEqual(
+            transport.get_session().headers['Connection'], 'close')
+
+    def test_request_records_timing(self):
+        transport = Transport()
+        with mock.patch.object(transport, 'get_session') as get_session:
+            get_session.return_value.request.return_value = 'response'
+            self.assertEqual(
+                transport.request('GET', 'https://x', label='linode.list'),
+                'response')
+            get_session.return_value.request.assert_called_once_with(
+                'GET', 'https://x', timeout=None)
+        self.assertEqual(transport.stats.calls['linode.list'][0], 1)
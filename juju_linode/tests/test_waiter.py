@@ -0,0 +1,84 @@
+import mock
+
+from juju_linode.client import Job
+from juju_linode.exceptions import ProviderError, TimeoutError
+from juju_linode.waiter import Backoff, JobWaiter
+
+from base import Base
+
+
+def job(jobid, finished=True, success=1):
+    return Job.from_dict(dict(
+        jobid=jobid, linodeid=1, action='linode.boot', host_message='',
+        host_finish_dt=finished and '2014-09-01 10:00:00' or '',
+        host_success=success if finished else ''))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, interval):
+        self.sleeps.append(interval)
+        self.now += interval
+
+
+class WaiterTest(Base):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.clock = FakeClock()
+        self.instance = mock.MagicMock(label='linode1', linodeid=1)
+        self.waiter = JobWaiter(
+            self.client, sleep=self.clock.sleep, clock=self.clock.time)
+
+    def test_backoff(self):
+        intervals = iter(Backoff(1, 2, 5))
+        self.assertEqual(
+            [intervals.next() for i in range(5)], [1, 2, 4, 5, 5])
+
+    def test_wait_on_job_ids(self):
+        self.client.get_linode_jobs.side_effect = [
+            [job(3, False), job(4)],
+            [job(3, False), job(4)],
+            [job(3), job(4)]]
+        elapsed = self.waiter.wait(self.instance, [3, 4], 'boot')
+        self.assertEqual(self.clock.sleeps, [1.0, 1.5])
+        self.assertEqual(elapsed, 2.5)
+        self.assertEqual(self.waiter.timings, [('linode1', 'boot', 2.5)])
+        self.client.get_linode_jobs.assert_called_with(self.instance, [3, 4])
+
+    def test_wait_on_pending(self):
+        self.client.get_linode_pending_jobs.side_effect = [[job(3, False)], []]
+        self.waiter.wait(self.instance)
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+    def test_failed_job(self):
+        self.client.get_linode_jobs.return_value = [job(3, success=0)]
+        self.assertRaises(
+            ProviderError, self.waiter.wait, self.instance, [3])
+
+    def test_timeout(self):
+        self.client.get_linode_jobs.return_value = [job(3, False)]
+        self.assertRaises(
+            TimeoutError, self.waiter.wait, self.instance, [3], 'boot', 30)
+        self.assertEqual(self.clock.now, 30)
+
+    def test_wait_with_poller(self):
+        poller = mock.MagicMock()
+        waiter = JobWaiter(self.client, poller=poller)
+        self.client.get_linode_jobs.return_value = [job(3, success=0)]
+        self.assertRaises(ProviderError, waiter.wait, self.instance, [3])
+        poller.watch.assert_called_once_with(self.instance, [3])
+
+    def test_wait_with_poller_timeout(self):
+        poller = mock.MagicMock()
+        poller.watch.return_value.result.side_effect = TimeoutError()
+        waiter = JobWaiter(self.client, poller=poller)
+        self.assertRaises(TimeoutError, waiter.wait, self.instance, [3])
+        poller.cancel.assert_called_once_with(poller.watch.return_value)
@@ -0,0 +1,117 @@
+"""
+Shared http transport for the linode and domain manager apis.
+
+A single pooled session is used by all op runner threads, so provisioning
+steps reuse established tls connections instead of handshaking per call.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger("juju.linode")
+
+DEFAULT_POOL_SIZE = 10
+
+# Seconds an idle pooled connection is considered reusable, linode's
+# frontends drop idle connections well before a few minutes pass.
+DEFAULT_KEEP_ALIVE = 60
+
+
+class CallStats(object):
+    """Per call timing counters, keyed by api action (or url).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def record(self, label, duration):
+        with self._lock:
+            count, total, slowest = self.calls.get(label, (0, 0.0, 0.0))
+            self.calls[label] = (
+                count + 1, total + duration, max(slowest, duration))
+
+    @property
+    def round_trips(self):
+        with self._lock:
+            return sum([c[0] for c in self.calls.values()])
+
+    def summary(self):
+        with self._lock:
+            items = sorted(self.calls.items())
+        lines = []
+        for label, (count, total, slowest) in items:
+            lines.append("%-36s calls:%-5d total:%.2fs avg:%.3fs max:%.3fs" % (
+                label, count, total, total / count, slowest))
+        return lines
+
+
+class Transport(object):
+    """Thread safe, connection pooled http transport.
+
+    pool_size bounds the connections kept open per host, which should
+    match the number of concurrent op runners. keep_alive is the number of
+    seconds an idle pool is kept, 0 disables connection reuse.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 keep_alive=DEFAULT_KEEP_ALIVE, timeout=None):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.stats = CallStats()
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            pool_size=int(config.get('default-num-runner') or
+                          DEFAULT_POOL_SIZE),
+            keep_alive=int(config.get('linode-keep-alive',
+                                      DEFAULT_KEEP_ALIVE)),
+            timeout=config.get('linode-api-timeout'))
+
+    def _make_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=2, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def get_session(self):
+        with self._lock:
+            now = time.time()
+            if self._session is not None and self.keep_alive and (
+                    now - self._last_used > self.keep_alive):
+                log.debug("Discarding idle http connection pool")
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = self._make_session()
+            self._last_used = now
+            return self._session
+
+    def request(self, method, url, label=None, **kw):
+        kw.setdefault('timeout', self.timeout)
+        session = self.get_session()
+        start = time.time()
+        try:
+            return session.request(method, url, **kw)
+        finally:
+            self.stats.record(label or url, time.time() - start)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,129 @@
+"""
+Waiting on linode jobs with exponential backoff.
+
+Most disk and boot jobs finish within a few seconds, so polling starts
+with a short interval and backs off towards a ceiling.
+"""
+
+import logging
+import time
+
+from juju_linode.exceptions import ProviderError, TimeoutError
+
+
+log = logging.getLogger("juju.linode")
+
+# Seconds allowed for each provisioning phase before giving up.
+PHASE_TIMEOUTS = {
+    'provision': 600,
+    'boot': 300,
+    'shutdown': 300,
+    'teardown': 300,
+    'imagize': 1800}
+
+DEFAULT_TIMEOUT = 600
+
+
+class Backoff(object):
+    """Iterable of sleep intervals growing by factor up to maximum.
+    """
+
+    def __init__(self, initial=1.0, factor=1.5, maximum=10.0):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+
+    def __iter__(self):
+        interval = self.initial
+        while True:
+            yield interval
+            interval = min(interval * self.factor, self.maximum)
+
+
+def job_finished(job):
+    if not job.host_finish_dt:
+        return False
+    if str(job.host_success) == '0':
+        raise ProviderError(
+            "Job %s %s failed on linode %s: %s" % (
+                job.jobid, job.action, job.linodeid, job.host_message))
+    return True
+
+
+class JobWaiter(object):
+    """Wait on a linode's jobs, recording how long each wait took.
+
+    With a poller, waits are served by its shared polling thread instead
+    of a poll loop per caller.
+    """
+
+    def __init__(self, client, backoff=None, timeouts=None, poller=None,
+                 sleep=time.sleep, clock=time.time):
+        self.client = client
+        self.poller = poller
+        self.backoff = backoff or Backoff()
+        self.timeouts = dict(PHASE_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.sleep = sleep
+        self.clock = clock
+        self.timings = []
+
+    def pending_jobs(self, linode_instance, job_ids=None):
+        if job_ids:
+            return [j for j in self.client.get_linode_jobs(
+                linode_instance, job_ids) if not job_finished(j)]
+        return self.client.get_linode_pending_jobs(linode_instance)
+
+    def wait(self, linode_instance, job_ids=None, phase=None, timeout=None):
+        """Wait till job_ids (or any pending job) on the linode complete.
+
+        Returns the number of seconds waited.
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(phase, DEFAULT_TIMEOUT)
+        start = self.clock()
+        if self.poller is not None:
+            self._watch(linode_instance, job_ids, phase, timeout)
+        else:
+            self._poll(linode_instance, job_ids, phase, start + timeout)
+
+        elapsed = self.clock() - start
+        self.timings.append((linode_instance.label, phase, elapsed))
+        log.debug("Instance %s %s ready after %.1fs",
+                  linode_instance.label, phase or 'jobs', elapsed)
+        return elapsed
+
+    def _poll(self, linode_instance, job_ids, phase, deadline):
+        for interval in self.backoff:
+            pending = self.pending_jobs(linode_instance, job_ids)
+            if not pending:
+                return
+            now = self.clock()
+            if now >= deadline:
+                raise TimeoutError(
+                    "Timed out waiting on instance %s %s jobs: %s" % (
+                        linode_instance.label, phase or '',
+                        ", ".join([str(j.jobid) for j in pending])))
+            log.debug("Waiting on instance %s, %d jobs in queue",
+                      linode_instance.label, len(pending))
+            self.sleep(min(interval, deadline - now))
+
+    def _watch(self, linode_instance, job_ids, phase, timeout):
+        watch = self.poller.watch(linode_instance, job_ids)
+        try:
+            watch.result(timeout)
+        except TimeoutError:
+            self.poller.cancel(watch)
+            raise TimeoutError(
+                "Timed out waiting on instance %s %s jobs" % (
+                    linode_instance.label, phase or ''))
+        if job_ids:
+            self.check_jobs(linode_instance, job_ids)
+
+    def check_jobs(self, linode_instance, job_ids):
+        """Raise if any of the finished jobs failed.
+
+        The poller only sees pending jobs, so can't tell failures apart.
+        """
+        for job in self.client.get_linode_jobs(linode_instance, job_ids):
+            job_finished(job)